@@ -1,6 +1,10 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+
+from . import alocacao, busca, cancelamentos, estoque
 from .models import Usuario, Item, Exemplar, Reserva
+from .paginacao import PaginadorContagemEmCache
 
 
 @admin.register(Usuario)
@@ -23,8 +27,72 @@ class ExemplarAdmin(admin.ModelAdmin):
     list_display = ('codigo_exemplar', 'item', 'situacao', 'condicao')
     list_filter = ('situacao', 'condicao', 'item')
     search_fields = ('codigo_exemplar', 'item__nome', 'item__codigo_tipo')
+    autocomplete_fields = ('item',)
+    ordering = ('codigo_exemplar',)
+    actions = ('marcar_em_manutencao', 'marcar_disponivel')
+
+    # Tabela grande: sem COUNT(*) a cada página (ver core.paginacao).
+    paginator = PaginadorContagemEmCache
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Exemplar.__str__ usa o item; vale para a lista e para o autocomplete.
+        return super().get_queryset(request).select_related('item')
+
+    @admin.action(description='Marcar como em manutenção')
+    def marcar_em_manutencao(self, request, queryset):
+        alterados = estoque.atualizar_em_lote(queryset, situacao=Exemplar.Situacao.EM_MANUTENCAO)
+        self.message_user(request, f'{alterados} exemplar(es) marcado(s) como em manutenção.', messages.SUCCESS)
+
+    @admin.action(description='Marcar como disponível (em bom estado)')
+    def marcar_disponivel(self, request, queryset):
+        alterados = estoque.atualizar_em_lote(
+            queryset,
+            situacao=Exemplar.Situacao.DISPONIVEL,
+            condicao=Exemplar.Condicao.BOM,
+        )
+        self.message_user(request, f'{alterados} exemplar(es) marcado(s) como disponível(is).', messages.SUCCESS)
+
+
+class ReservaAdminForm(forms.ModelForm):
+    """
+    O status só anda pelos mesmos caminhos das telas da gestão; a mudança em
+    si é feita em ReservaAdmin.save_model, pelos serviços de core.alocacao e
+    core.cancelamentos.
+    """
+
+    TRANSICOES = {
+        Reserva.Status.PENDENTE: (Reserva.Status.CONFIRMADO, Reserva.Status.CANCELADA),
+        Reserva.Status.CONFIRMADO: (Reserva.Status.CONCLUIDA, Reserva.Status.CANCELADA),
+    }
+
+    class Meta:
+        model = Reserva
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        anterior = self.instance.status if self.instance.pk else None
+        novo = cleaned_data.get('status')
+        if novo is None:
+            return cleaned_data
+
+        if anterior is None:
+            if novo != Reserva.Status.PENDENTE:
+                self.add_error('status', 'Reservas novas começam pendentes.')
+        elif novo != anterior and novo not in self.TRANSICOES.get(anterior, ()):
+            self.add_error(
+                'status',
+                f'Não é possível passar de "{Reserva.Status(anterior).label}" para "{Reserva.Status(novo).label}".',
+            )
+
+        # O exemplar só muda na retirada, escolhido aqui ou pelo sistema.
+        retirada = anterior == Reserva.Status.PENDENTE and novo == Reserva.Status.CONFIRMADO
+        if anterior is not None and 'exemplar' in self.changed_data and not retirada:
+            self.add_error('exemplar', 'O exemplar só pode ser escolhido ao confirmar a retirada.')
+        return cleaned_data
+
 
-    
 @admin.register(Reserva)
 class ReservaAdmin(admin.ModelAdmin):
     list_display = (
@@ -51,6 +119,23 @@ class ReservaAdmin(admin.ModelAdmin):
         'data_devolucao',
     )
     search_fields = ('usuario__nusp', 'item__codigo_tipo')
+    date_hierarchy = 'data_reserva'
+    list_select_related = (
+        'usuario',
+        'usuario_cancelou',
+        'item',
+        'exemplar__item',
+        'usuario_confirmou_retirada',
+        'usuario_confirmou_devolucao',
+    )
+    autocomplete_fields = ('usuario', 'item', 'exemplar')
+    actions = ('cancelar_reservas',)
+    form = ReservaAdminForm
+
+    # Tabela grande: sem COUNT(*) a cada página (ver core.paginacao).
+    paginator = PaginadorContagemEmCache
+    show_full_result_count = False
+
     readonly_fields = (
         'data_reserva',
         'usuario_confirmou_retirada',
@@ -81,7 +166,46 @@ class ReservaAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Mesmo índice de trigramas das filas da gestão (core.busca), em vez
+        # de LIKE com JOIN em usuário e item.
+        return busca.filtrar(queryset, search_term), False
 
+    def save_model(self, request, obj, form, change):
+        if not change or 'status' not in form.changed_data:
+            return super().save_model(request, obj, form, change)
 
+        # Os demais campos são gravados com o status antigo; a transição fica
+        # com os mesmos serviços usados pelas telas da gestão.
+        novo = obj.status
+        escolhido = obj.exemplar
+        obj.status = form.initial['status']
+        obj.exemplar_id = form.initial['exemplar']
+        super().save_model(request, obj, form, change)
 
+        if novo == Reserva.Status.CONFIRMADO:
+            if alocacao.confirmar_retirada(obj, request.user, exemplar=escolhido) is None:
+                self.message_user(
+                    request,
+                    'A retirada não foi confirmada: não há exemplar disponível deste item.',
+                    messages.ERROR,
+                )
+        elif novo == Reserva.Status.CONCLUIDA:
+            condicao = obj.exemplar.condicao if obj.exemplar else Exemplar.Condicao.BOM
+            alocacao.confirmar_devolucao(obj, request.user, condicao)
+        elif novo == Reserva.Status.CANCELADA:
+            cancelamentos.cancelar(
+                obj,
+                motivo=obj.motivo_cancelamento or 'Reserva cancelada pela administração.',
+                usuario=request.user,
+            )
 
+    @admin.action(description='Cancelar reservas pendentes selecionadas')
+    def cancelar_reservas(self, request, queryset):
+        canceladas = cancelamentos.cancelar_em_lote(
+            queryset,
+            motivo='Reserva cancelada pela administração.',
+            automatico=False,
+            usuario=request.user,
+        )
+        self.message_user(request, f'{canceladas} reserva(s) cancelada(s).', messages.SUCCESS)
@@ -0,0 +1,135 @@
+"""
+Entrega e devolução de exemplares no balcão.
+
+A escolha do exemplar e a confirmação da reserva acontecem numa única
+transação. O exemplar só é "pego" por um UPDATE condicional (situacao ainda
+DISPONIVEL), então dois atendentes nunca entregam a mesma unidade:
+- no Postgres o candidato é lido com SELECT ... FOR UPDATE SKIP LOCKED, um
+  por vez, e cada balcão fica com um exemplar diferente sem esperar o outro;
+- no SQLite a transação já começa com BEGIN IMMEDIATE (ver settings), que
+  serializa as escritas.
+
+As telas da gestão e o admin usam as mesmas funções, `confirmar_retirada` e
+`confirmar_devolucao`.
+"""
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .estoque import mover
+from .models import Exemplar, Reserva
+
+
+# Quantos candidatos tentar antes de desistir (só importa quando há disputa).
+TENTATIVAS = 5
+
+
+class _ReservaJaAtendida(Exception):
+    pass
+
+
+def _candidato(item_id, exemplar=None, tentados=()):
+    """
+    Próximo exemplar livre, menos usado primeiro. No Postgres a linha já vem
+    travada, e as travadas por outro balcão são puladas: cada um trava só o
+    exemplar que vai entregar.
+    """
+    candidatos = Exemplar.objects.filter(
+        item_id=item_id,
+        situacao=Exemplar.Situacao.DISPONIVEL,
+        condicao=Exemplar.Condicao.BOM,
+    ).exclude(pk__in=tentados)
+    if exemplar is not None:
+        candidatos = candidatos.filter(pk=exemplar.pk)
+    if connection.features.has_select_for_update_skip_locked:
+        candidatos = candidatos.select_for_update(skip_locked=True)
+    return candidatos.order_by('vezes_retirado', 'id').values_list('pk', flat=True).first()
+
+
+def _pegar(item_id, exemplar_id):
+    pegou = Exemplar.objects.filter(
+        pk=exemplar_id,
+        situacao=Exemplar.Situacao.DISPONIVEL,
+    ).update(
+        situacao=Exemplar.Situacao.RESERVADO,
+        vezes_retirado=F('vezes_retirado') + 1,
+    ) == 1
+    if pegou:
+        mover((item_id, Exemplar.Situacao.DISPONIVEL), (item_id, Exemplar.Situacao.RESERVADO))
+    return pegou
+
+
+def confirmar_retirada(reserva, usuario, exemplar=None):
+    """
+    Confirma a retirada de uma reserva pendente entregando um exemplar livre.
+
+    Sem `exemplar`, entrega o exemplar em bom estado menos usado do item.
+    Retorna o exemplar entregue, ou None se não houver exemplar livre ou se a
+    reserva já tiver sido atendida/cancelada por outra pessoa (nesse caso nada
+    é alterado).
+    """
+    try:
+        with transaction.atomic():
+            escolhido = None
+            tentados = []
+            for _ in range(TENTATIVAS):
+                exemplar_id = _candidato(reserva.item_id, exemplar, tentados)
+                if exemplar_id is None:
+                    break
+                if _pegar(reserva.item_id, exemplar_id):
+                    escolhido = exemplar_id
+                    break
+                # Outro balcão pegou este exemplar entre a leitura e o UPDATE.
+                tentados.append(exemplar_id)
+
+            if escolhido is None:
+                return None
+
+            agora = timezone.now()
+            atualizadas = Reserva.objects.filter(
+                pk=reserva.pk,
+                status=Reserva.Status.PENDENTE,
+            ).update(
+                exemplar_id=escolhido,
+                status=Reserva.Status.CONFIRMADO,
+                usuario_confirmou_retirada=usuario,
+                data_confirmou_retirada=agora,
+            )
+            if atualizadas != 1:
+                raise _ReservaJaAtendida
+    except _ReservaJaAtendida:
+        return None
+
+    reserva.exemplar_id = escolhido
+    reserva.status = Reserva.Status.CONFIRMADO
+    reserva.usuario_confirmou_retirada = usuario
+    reserva.data_confirmou_retirada = agora
+    return reserva.exemplar
+
+
+def confirmar_devolucao(reserva, usuario, condicao):
+    """
+    Conclui uma reserva confirmada. O exemplar volta como disponível se veio
+    em bom estado e vai para manutenção caso contrário.
+    """
+    exemplar = reserva.exemplar
+
+    reserva.status = Reserva.Status.CONCLUIDA
+    reserva.usuario_confirmou_devolucao = usuario
+    reserva.data_confirmou_devolucao = timezone.now()
+
+    # Exemplar e reserva mudam juntos: ninguém (nem corrigir_exemplares)
+    # vê o exemplar livre com a reserva ainda confirmada.
+    with transaction.atomic():
+        if exemplar is not None:
+            exemplar.condicao = condicao
+
+            if condicao == Exemplar.Condicao.BOM:
+                exemplar.situacao = Exemplar.Situacao.DISPONIVEL
+            else:
+                exemplar.situacao = Exemplar.Situacao.EM_MANUTENCAO
+
+            exemplar.save()
+
+        # Reserva.save também devolve os dias ocupados (core.disponibilidade).
+        reserva.save()
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Registram sinais: cache de usuários; ocupação, índice de busca e
+        # estatísticas ao apagar reservas.
+        from . import backends, busca, disponibilidade, estatisticas  # noqa: F401
+        from .logos import resolvedor
+
+        resolvedor.carregar()
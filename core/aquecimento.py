@@ -0,0 +1,79 @@
+"""
+Aquecimento do processo antes de atender requisições.
+
+Várias coisas do Django só são carregadas na primeira vez que alguém precisa
+delas: o import das views (pelo URLconf), a compilação de cada template, os
+catálogos de tradução, a lista de senhas comuns do CommonPasswordValidator e
+o manifesto dos arquivos estáticos. Sem aquecimento, o primeiro usuário de
+cada worker paga tudo isso.
+
+`aquecer` faz esse trabalho de uma vez. O gunicorn.conf.py chama a função no
+processo mestre, antes de criar os workers (preload_app), e depois congela
+os objetos (gc.freeze) para que os workers compartilhem essa memória em
+copy-on-write. Não abre conexão com o banco: uma conexão aberta antes do
+fork seria herdada por todos os workers.
+"""
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import password_validation
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template import engines
+from django.urls import get_resolver, reverse
+from django.utils import translation
+
+
+def _urls():
+    # url_patterns importa as views; reverse monta os índices de cada namespace.
+    get_resolver().url_patterns
+    reverse('core:home')
+    reverse('admin:index')
+
+
+def _templates():
+    """
+    Compila os templates do projeto (não os do Django) no loader em cache.
+    """
+    motor = engines['django']
+    for pasta in motor.template_dirs:
+        pasta = Path(pasta)
+        if not pasta.is_relative_to(settings.BASE_DIR):
+            continue
+        for arquivo in sorted(pasta.rglob('*.html')):
+            motor.get_template(arquivo.relative_to(pasta).as_posix())
+
+
+def _senhas():
+    password_validation.get_default_password_validators()
+
+
+def _traducoes():
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.gettext('Password')
+    translation.deactivate()
+
+
+def _estaticos():
+    staticfiles_storage.url  # carrega o manifesto (CompressedManifestStaticFilesStorage)
+
+
+ETAPAS = (
+    ('urls', _urls),
+    ('templates', _templates),
+    ('senhas', _senhas),
+    ('traducoes', _traducoes),
+    ('estaticos', _estaticos),
+)
+
+
+def aquecer():
+    """
+    Executa as ETAPAS e retorna {etapa: milissegundos}.
+    """
+    tempos = {}
+    for nome, etapa in ETAPAS:
+        inicio = time.perf_counter()
+        etapa()
+        tempos[nome] = round((time.perf_counter() - inicio) * 1000, 1)
+    return tempos
@@ -0,0 +1,44 @@
+"""
+Autenticação com o usuário logado guardado no cache.
+
+A cada requisição o AuthenticationMiddleware busca o usuário da sessão. O
+ModelBackend faz isso com um SELECT; aqui a instância fica no cache
+(settings.CACHES) por USUARIO_CACHE_SEGUNDOS e o banco só é lido na primeira
+requisição ou depois que o usuário muda. Toda gravação ou remoção de um
+Usuario (save(), delete() e delete() em lote) apaga a entrada, então mudanças
+de senha, tipo de acesso ou `is_active` valem já na requisição seguinte.
+UPDATEs em lote (queryset.update) não passam por aqui: quem fizer um deve
+chamar `esquecer` para os ids afetados.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+def _chave(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+def esquecer(*usuario_ids):
+    cache.delete_many([_chave(usuario_id) for usuario_id in usuario_ids])
+
+
+class BackendComCache(ModelBackend):
+
+    def get_user(self, user_id):
+        chave = _chave(user_id)
+        usuario = cache.get(chave)
+        if usuario is None:
+            usuario = super().get_user(user_id)
+            if usuario is None:
+                return None
+            cache.set(chave, usuario, getattr(settings, 'USUARIO_CACHE_SEGUNDOS', 300))
+        return usuario if self.user_can_authenticate(usuario) else None
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def _usuario_alterado(sender, instance, **kwargs):
+    esquecer(instance.pk)
@@ -0,0 +1,267 @@
+"""
+Busca nas filas da gestão (reservas pendentes e ativas).
+
+Cada reserva guarda em `documento_busca` um texto único, em minúsculas e sem
+acentos, com os dados do usuário e do item. A busca olha só essa coluna, sem
+JOIN com Usuario/Item, e usa um índice de trigramas:
+- SQLite: tabela FTS5 `core_reserva_busca` (tokenizer trigram), rowid = id da reserva;
+- Postgres: índice GIN com gin_trgm_ops sobre a coluna (extensão pg_trgm).
+Sem índice disponível (ou termos com menos de 3 letras), cai num LIKE na coluna.
+As filas ordenam os resultados por relevância (`ranquear`): bm25 no SQLite,
+similaridade de trigramas no Postgres.
+
+O documento é montado ao criar a reserva. Quando um campo indexado do usuário
+ou do item muda, Usuario.save/Item.save chamam `trocar_parte`, que troca só
+aquele trecho do documento com um UPDATE em lote. Reservas apagadas saem do
+índice FTS pelo sinal post_delete.
+"""
+import unicodedata
+
+from django.db import connection, transaction
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Concat, Length, Substr
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+
+TABELA_FTS = 'core_reserva_busca'
+
+CAMPOS_USUARIO = ('nusp', 'username', 'email', 'first_name', 'last_name')
+CAMPOS_ITEM = ('codigo_tipo', 'nome')
+
+# O tokenizer trigram não encontra termos menores que isso.
+TAMANHO_MINIMO_FTS = 3
+
+_fts_disponivel = None
+
+
+def normalizar(texto):
+    """
+    Minúsculas e sem acentos: "João" -> "joao".
+    """
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def _juntar(valores):
+    return normalizar(' '.join(v for v in valores if v))
+
+
+def montar_documento(usuario, item):
+    return _juntar(
+        [getattr(usuario, campo) for campo in CAMPOS_USUARIO]
+        + [getattr(item, campo) for campo in CAMPOS_ITEM]
+    )
+
+
+def valores_salvos(objeto, campos, antes=None, update_fields=None):
+    """
+    Valores de `campos` como ficaram no banco depois de objeto.save(); campos
+    adiados (não carregados) aparecem como None.
+    """
+    atuais = tuple(objeto.__dict__.get(campo) for campo in campos)
+    if update_fields is None or antes is None:
+        return atuais
+    return tuple(
+        atual if campo in update_fields else anterior
+        for campo, atual, anterior in zip(campos, atuais, antes)
+    )
+
+
+def usa_fts():
+    global _fts_disponivel
+    if connection.vendor != 'sqlite':
+        return False
+    if _fts_disponivel is None:
+        with connection.cursor() as cursor:
+            _fts_disponivel = TABELA_FTS in connection.introspection.table_names(cursor)
+    return _fts_disponivel
+
+
+def sincronizar(documentos):
+    """
+    Grava no índice FTS os pares (id da reserva, documento). No Postgres não
+    faz nada: o índice GIN acompanha a própria coluna.
+    """
+    if not documentos or not usa_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABELA_FTS} WHERE rowid = %s',
+            [(reserva_id,) for reserva_id, _ in documentos],
+        )
+        cursor.executemany(
+            f'INSERT INTO {TABELA_FTS} (rowid, documento) VALUES (%s, %s)',
+            documentos,
+        )
+
+
+def sincronizar_reservas(reservas):
+    """
+    Regrava no índice FTS as reservas do queryset com um DELETE e um
+    INSERT ... SELECT, sem trazer os documentos para o Python.
+    """
+    if not usa_fts():
+        return
+    sql, params = reservas.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABELA_FTS} WHERE rowid IN ({sql})', params)
+        cursor.execute(
+            f'INSERT INTO {TABELA_FTS} (rowid, documento) '
+            f'SELECT id, documento_busca FROM core_reserva WHERE id IN ({sql})',
+            params,
+        )
+
+
+def reconstruir_indice():
+    """
+    Refaz o índice FTS inteiro a partir de `documento_busca`, com um único
+    INSERT ... SELECT (usado depois de cargas em lote). Durante a carga a
+    fusão automática de segmentos fica desligada e um 'optimize' no fim junta
+    tudo de uma vez, o que custa bem menos que ir fundindo a cada página.
+    """
+    if not usa_fts():
+        return
+    configurar = f'INSERT INTO {TABELA_FTS} ({TABELA_FTS}, rank) VALUES (%s, %s)'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABELA_FTS}')
+        cursor.execute(configurar, ['automerge', 0])
+        cursor.execute(configurar, ['crisismerge', 1000])
+        cursor.execute(
+            f'INSERT INTO {TABELA_FTS} (rowid, documento) '
+            'SELECT id, documento_busca FROM core_reserva'
+        )
+        cursor.execute(f"INSERT INTO {TABELA_FTS} ({TABELA_FTS}) VALUES ('optimize')")
+        # Valores padrão do FTS5, para as gravações do dia a dia.
+        cursor.execute(configurar, ['automerge', 4])
+        cursor.execute(configurar, ['crisismerge', 16])
+
+
+def reindexar(reservas, tamanho_lote=1000):
+    """
+    Refaz o documento de busca das reservas do queryset.
+    """
+    from .models import Reserva
+
+    lote = []
+    for reserva in reservas.select_related('usuario', 'item').only(
+        'id', 'documento_busca',
+        *[f'usuario__{c}' for c in CAMPOS_USUARIO],
+        *[f'item__{c}' for c in CAMPOS_ITEM],
+    ).iterator(chunk_size=tamanho_lote):
+        reserva.documento_busca = montar_documento(reserva.usuario, reserva.item)
+        lote.append(reserva)
+        if len(lote) >= tamanho_lote:
+            _gravar(Reserva, lote)
+            lote = []
+    _gravar(Reserva, lote)
+
+
+def _gravar(Reserva, lote):
+    if not lote:
+        return
+    with transaction.atomic():
+        Reserva.objects.bulk_update(lote, ['documento_busca'])
+        sincronizar([(r.id, r.documento_busca) for r in lote])
+
+
+def trocar_parte(reservas, antes, depois, inicio):
+    """
+    O usuário (`inicio=True`) ou o item das `reservas` teve os campos
+    indexados alterados de `antes` para `depois`: troca esse trecho do
+    documento direto no banco. O do usuário é o começo do documento e o do
+    item, o fim. Reservas cujo documento não tem o formato esperado (ou quando
+    não se sabe o valor anterior) são refeitas por `reindexar`.
+    """
+    if antes == depois:
+        return
+    if antes is None or None in antes or None in depois:
+        reindexar(reservas)
+        return
+
+    antigo, novo = _juntar(antes), _juntar(depois)
+    if antigo == novo:
+        return
+
+    if inicio:
+        filtro_antigo = {'documento_busca__startswith': antigo + ' '}
+        filtro_novo = {'documento_busca__startswith': novo + ' '}
+        documento = Concat(Value(novo), Substr('documento_busca', len(antigo) + 1))
+    else:
+        filtro_antigo = {'documento_busca__endswith': ' ' + antigo}
+        filtro_novo = {'documento_busca__endswith': ' ' + novo}
+        documento = Concat(Substr('documento_busca', 1, Length('documento_busca') - len(antigo)), Value(novo))
+
+    with transaction.atomic():
+        reservas.filter(**filtro_antigo).update(documento_busca=documento)
+        reindexar(reservas.exclude(**filtro_novo))
+        sincronizar_reservas(reservas)
+
+
+@receiver(post_delete, sender='core.Reserva')
+def _reserva_removida(sender, instance, **kwargs):
+    if usa_fts():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABELA_FTS} WHERE rowid = %s', [instance.pk])
+
+
+def _usa_indice(termo):
+    return usa_fts() and len(termo) >= TAMANHO_MINIMO_FTS
+
+
+def _frase(termo):
+    return '"' + termo.replace('"', '""') + '"'
+
+
+def filtrar(reservas, q):
+    """
+    Filtra o queryset pelas reservas cujo documento contém `q` (ou cujo id é `q`).
+    """
+    termo = normalizar(q.strip())
+    if not termo:
+        return reservas
+
+    if _usa_indice(termo):
+        filtros = Q(id__in=RawSQL(
+            f'SELECT rowid FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s',
+            [_frase(termo)],
+        ))
+    else:
+        filtros = Q(documento_busca__contains=termo)
+
+    if termo.isdigit():
+        filtros = filtros | Q(id=int(termo))
+
+    return reservas.filter(filtros)
+
+
+def ranquear(reservas, q):
+    """
+    Como `filtrar`, e anota em cada reserva a `relevancia` do termo (maior é
+    melhor), para as filas mostrarem primeiro o que mais se parece com a busca:
+    - SQLite: bm25 do FTS5 (a coluna `rank`, negativa; por isso o sinal). A
+      tabela FTS entra no FROM, e o bm25 é calculado uma vez por resultado na
+      própria consulta do índice; uma subconsulta por linha refaria o MATCH
+      para cada reserva;
+    - Postgres: word_similarity do pg_trgm entre o termo e o documento.
+    Termos só com dígitos (NUSP, número da reserva) e o LIKE de reserva (sem
+    índice ou termo curto) não têm ranking: todas valem 0.
+    """
+    termo = normalizar(q.strip())
+    if not termo:
+        return reservas
+
+    if _usa_indice(termo) and not termo.isdigit():
+        return reservas.extra(
+            tables=[TABELA_FTS],
+            where=[f'{TABELA_FTS}.rowid = {reservas.model._meta.db_table}.id', f'{TABELA_FTS} MATCH %s'],
+            params=[_frase(termo)],
+        ).annotate(relevancia=RawSQL(f'-{TABELA_FTS}.rank', [], output_field=FloatField()))
+
+    reservas = filtrar(reservas, q)
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        return reservas.annotate(relevancia=TrigramWordSimilarity(termo, 'documento_busca'))
+    return reservas.annotate(relevancia=Value(0.0, output_field=FloatField()))
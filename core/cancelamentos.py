@@ -0,0 +1,104 @@
+"""
+Cancelamento de reservas.
+
+`cancelar` atende os cancelamentos feitos por uma pessoa (usuário, gestão ou
+admin). O resto do módulo trata do cancelamento automático das reservas
+pendentes que não foram retiradas.
+
+Cada reserva pendente guarda em `expira_em` o fim do prazo de retirada
+(24h a partir do início do dia previsto, ajustável em
+settings.RESERVA_PRAZO_RETIRADA_HORAS). O índice parcial sobre
+(expira_em) WHERE status = 'Pendente' deixa a busca das vencidas barata, e o
+cancelamento é um único UPDATE, sem carregar as reservas em memória, mais um
+UPDATE que devolve os dias de ocupação. Uma reserva pendente normalmente
+ainda não tem exemplar; se tiver um separado, ele volta a ficar disponível.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import disponibilidade, estoque
+from .models import Exemplar, Reserva
+
+
+MOTIVO = 'Cancelada automaticamente: não retirada no prazo.'
+
+
+def prazo_retirada(data_retirada):
+    horas = getattr(settings, 'RESERVA_PRAZO_RETIRADA_HORAS', 24)
+    inicio = timezone.make_aware(datetime.combine(data_retirada, time.min))
+    return inicio + timedelta(hours=horas)
+
+
+def cancelar(reserva, motivo, usuario=None):
+    """
+    Cancela uma reserva pendente ou confirmada e libera o exemplar que estava
+    separado para ela.
+    """
+    with transaction.atomic():
+        exemplar = reserva.exemplar
+        if exemplar is not None and exemplar.situacao == Exemplar.Situacao.RESERVADO:
+            exemplar.situacao = Exemplar.Situacao.DISPONIVEL
+            exemplar.save()
+
+        reserva.marcar_como_cancelada(motivo=motivo, automatico=False, usuario=usuario)
+
+
+def reservas_expiradas(agora=None):
+    return Reserva.objects.filter(
+        status=Reserva.Status.PENDENTE,
+        expira_em__lt=agora or timezone.now(),
+    )
+
+
+def cancelar_em_lote(reservas, motivo, automatico, usuario=None, agora=None):
+    """
+    Cancela as reservas pendentes do queryset com um único UPDATE, devolve os
+    dias de ocupação delas e libera os exemplares separados, tudo numa
+    transação. Reservas em outros status são ignoradas. Retorna quantas foram
+    canceladas.
+    """
+    agora = agora or timezone.now()
+
+    with transaction.atomic():
+        pendentes = Reserva.objects.filter(
+            pk__in=reservas.values('pk'),
+            status=Reserva.Status.PENDENTE,
+        )
+        item_ids = set(pendentes.values_list('item_id', flat=True).distinct())
+        if not item_ids:
+            return 0
+
+        # Mesma ordem de travas do resto do sistema (item, depois reserva):
+        # nenhuma dessas reservas muda até o fim, então o desconto da
+        # ocupação bate exatamente com o que o UPDATE cancela.
+        disponibilidade.travar_itens(item_ids)
+        list(pendentes.select_for_update().values_list('pk', flat=True))
+
+        disponibilidade.liberar_reservas(pendentes)
+        liberados = Exemplar.objects.filter(
+            reservas__in=pendentes,
+            situacao=Exemplar.Situacao.RESERVADO,
+        ).update(situacao=Exemplar.Situacao.DISPONIVEL)
+        if liberados:
+            estoque.recontar(item_ids)
+        canceladas = pendentes.update(
+            status=Reserva.Status.CANCELADA,
+            cancelada_em=agora,
+            motivo_cancelamento=motivo,
+            cancelamento_automatico=automatico,
+            usuario_cancelou=usuario,
+            expira_em=None,
+        )
+
+    return canceladas
+
+
+def cancelar_expiradas(agora=None):
+    """
+    Cancela todas as reservas pendentes vencidas. Retorna quantas foram canceladas.
+    """
+    agora = agora or timezone.now()
+    return cancelar_em_lote(reservas_expiradas(agora), MOTIVO, automatico=True, agora=agora)
@@ -0,0 +1,157 @@
+"""
+Correção de divergências entre a situação dos exemplares e as reservas.
+
+Três tipos de divergência são corrigidos, nesta ordem:
+- duas ou mais reservas confirmadas no mesmo exemplar: fica ativa só a mais
+  recente (maior id); as outras são concluídas com uma observação;
+- reserva confirmada cujo exemplar está DISPONIVEL: o exemplar volta a RESERVADO;
+- exemplar RESERVADO sem nenhuma reserva confirmada: volta a DISPONIVEL.
+
+Cada tipo é corrigido com um único UPDATE, e tudo roda numa transação, junto
+com a recontagem do estoque (e da ocupação, quando reservas são concluídas)
+dos itens afetados.
+
+Pode rodar com o site no ar:
+- no Postgres, um advisory lock de transação impede duas correções ao mesmo
+  tempo. Os itens com divergência são travados primeiro (travar_itens, na
+  mesma ordem de travas do resto do sistema: item, depois reserva e
+  exemplar), e só as linhas candidatas desses itens são travadas e
+  corrigidas; o que aparecer em outro item fica para a próxima execução. Com
+  os itens travados, nenhuma retirada, devolução ou cancelamento deles muda
+  os números entre o UPDATE e a recontagem. O UPDATE confere a condição de
+  novo, já vendo o que foi gravado enquanto esperava a trava;
+- no SQLite a transação começa com BEGIN IMMEDIATE (ver settings), que
+  serializa as escritas.
+"""
+from django.db import connection, transaction
+from django.db.models import Case, Exists, F, OuterRef, TextField, Value, When
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from . import disponibilidade, estoque
+from .models import Exemplar, Reserva
+
+
+# Chave do pg_try_advisory_xact_lock usada pela correção.
+CHAVE_TRAVA = 7_364_001
+
+OBSERVACAO_DUPLICADA = 'Concluída automaticamente: o exemplar está em outra reserva ativa mais recente.'
+
+TIPOS = (
+    'reservas_duplicadas',
+    'confirmadas_com_exemplar_disponivel',
+    'reservados_sem_reserva_ativa',
+)
+
+
+class CorrecaoEmAndamento(Exception):
+    pass
+
+
+def _confirmadas():
+    return Reserva.objects.filter(status=Reserva.Status.CONFIRMADO)
+
+
+def reservas_duplicadas():
+    """
+    Reservas confirmadas cujo exemplar tem outra reserva confirmada mais recente.
+    """
+    return _confirmadas().filter(
+        exemplar__isnull=False,
+    ).filter(Exists(
+        _confirmadas().filter(exemplar=OuterRef('exemplar'), pk__gt=OuterRef('pk'))
+    ))
+
+
+def confirmadas_com_exemplar_disponivel():
+    """
+    Exemplares DISPONIVEL que estão numa reserva confirmada.
+    """
+    return Exemplar.objects.filter(
+        situacao=Exemplar.Situacao.DISPONIVEL,
+    ).filter(Exists(_confirmadas().filter(exemplar=OuterRef('pk'))))
+
+
+def reservados_sem_reserva_ativa():
+    return Exemplar.objects.filter(
+        situacao=Exemplar.Situacao.RESERVADO,
+    ).exclude(Exists(_confirmadas().filter(exemplar=OuterRef('pk'))))
+
+
+def _travar():
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [CHAVE_TRAVA])
+        if not cursor.fetchone()[0]:
+            raise CorrecaoEmAndamento('Outra correção de exemplares está em andamento.')
+
+
+def _itens_com_divergencia():
+    item_ids = set()
+    for consulta in (reservas_duplicadas, confirmadas_com_exemplar_disponivel, reservados_sem_reserva_ativa):
+        item_ids.update(consulta().values_list('item_id', flat=True).distinct())
+    return item_ids
+
+
+def _candidatos(consulta, itens_travados):
+    """
+    Sem `itens_travados` (simulação), só lê. Senão, trava e retorna apenas as
+    linhas dos itens já travados.
+    """
+    if itens_travados is not None:
+        consulta = consulta.filter(item_id__in=itens_travados).select_for_update()
+    return list(consulta.order_by('pk').values_list('pk', 'item_id'))
+
+
+def corrigir(simular=False):
+    """
+    Corrige os três tipos de divergência e retorna {tipo: [ids afetados]}
+    (ids de reserva para 'reservas_duplicadas', de exemplar para os outros).
+    Com `simular=True`, só encontra as divergências, sem gravar nada.
+
+    Levanta CorrecaoEmAndamento se outra correção já estiver rodando.
+    """
+    encontrados = {}
+
+    with transaction.atomic():
+        itens_travados = None
+        if not simular:
+            _travar()
+            itens_travados = _itens_com_divergencia()
+            disponibilidade.travar_itens(itens_travados)
+
+        agora = timezone.now()
+
+        candidatos = _candidatos(reservas_duplicadas(), itens_travados)
+        encontrados['reservas_duplicadas'] = candidatos
+        itens_ocupacao = {item_id for _, item_id in candidatos}
+        if candidatos and not simular:
+            reservas_duplicadas().filter(pk__in=[pk for pk, _ in candidatos]).update(
+                status=Reserva.Status.CONCLUIDA,
+                data_confirmou_devolucao=agora,
+                observacoes=Case(
+                    When(observacoes='', then=Value(OBSERVACAO_DUPLICADA)),
+                    default=Concat(F('observacoes'), Value('\n' + OBSERVACAO_DUPLICADA)),
+                    output_field=TextField(),
+                ),
+            )
+
+        itens_estoque = set()
+        for tipo, consulta, situacao in (
+            ('confirmadas_com_exemplar_disponivel', confirmadas_com_exemplar_disponivel, Exemplar.Situacao.RESERVADO),
+            ('reservados_sem_reserva_ativa', reservados_sem_reserva_ativa, Exemplar.Situacao.DISPONIVEL),
+        ):
+            candidatos = _candidatos(consulta(), itens_travados)
+            encontrados[tipo] = candidatos
+            itens_estoque.update(item_id for _, item_id in candidatos)
+            if candidatos and not simular:
+                consulta().filter(pk__in=[pk for pk, _ in candidatos]).update(situacao=situacao)
+
+        if not simular:
+            if itens_estoque:
+                estoque.recontar(itens_estoque)
+            if itens_ocupacao:
+                disponibilidade.reconstruir(itens_ocupacao)
+
+    return {tipo: [pk for pk, _ in encontrados[tipo]] for tipo in TIPOS}
@@ -0,0 +1,557 @@
+"""
+Massa de dados sintética para reproduzir a carga de produção localmente
+(`manage.py gerar_dados` e `manage.py benchmark_views`).
+
+Tudo sai de um único random.Random(semente): a mesma semente e o mesmo `hoje`
+geram exatamente os mesmos dados. As distribuições imitam o uso real:
+- poucos itens e poucos usuários concentram a maior parte das reservas;
+- reservas se concentram nos dias úteis e nos meses de aula, e crescem com o tempo;
+- o status depende das datas: reservas futuras ficam pendentes, as de hoje
+  estão retiradas, as antigas foram concluídas ou canceladas, e algumas
+  devoluções recentes estão atrasadas.
+
+Usuários, itens e exemplares vão por bulk_create. As reservas são geradas em
+lotes e gravadas com INSERTs de várias linhas, sem instanciar o modelo (com
+milhões de linhas, montar objetos Reserva custa mais que o próprio banco), e
+com os índices da tabela desligados até o fim da carga. Depois a carga refaz
+os dados derivados: situação e uso dos exemplares, contadores de estoque,
+ocupação diária, estatísticas e índice de busca.
+"""
+import random
+import unicodedata
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from itertools import accumulate
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import busca, disponibilidade, estatisticas, estoque
+from .cancelamentos import MOTIVO, prazo_retirada
+from .models import (
+    ContagemUsuarioItem, EstatisticaDiaria, EstatisticaMensal, Exemplar, Item,
+    OcupacaoDiaria, Reserva, Usuario,
+)
+
+
+NOMES = [
+    'Ana', 'Beatriz', 'Bruno', 'Camila', 'Carlos', 'Conceição', 'Daniel', 'Eduarda', 'Felipe', 'Fernanda',
+    'Gabriel', 'Giovana', 'Gustavo', 'Helena', 'Igor', 'Isabela', 'João', 'Júlia', 'Larissa', 'Leonardo',
+    'Letícia', 'Lucas', 'Luísa', 'Marcelo', 'Mariana', 'Matheus', 'Natália', 'Otávio', 'Paula', 'Pedro',
+    'Rafael', 'Renata', 'Rodrigo', 'Sofia', 'Thiago', 'Valéria', 'Vinícius', 'Yasmin',
+]
+
+SOBRENOMES = [
+    'Almeida', 'Alves', 'Araújo', 'Barbosa', 'Cardoso', 'Carvalho', 'Castro', 'Costa', 'Dias', 'Fernandes',
+    'Ferreira', 'Gomes', 'Gonçalves', 'Lima', 'Lopes', 'Martins', 'Melo', 'Moreira', 'Nascimento', 'Oliveira',
+    'Pereira', 'Ribeiro', 'Rocha', 'Rodrigues', 'Santos', 'Silva', 'Soares', 'Souza', 'Teixeira', 'Vieira',
+]
+
+# (sigla, nome, variações)
+CATALOGO = [
+    ('JAL', 'Jaleco', ['P', 'M', 'G', 'GG']),
+    ('OCP', 'Óculos de proteção', ['incolor', 'fumê']),
+    ('CAL', 'Calculadora científica', ['Casio fx-82', 'HP 50g', 'Casio fx-991']),
+    ('GCH', 'Guarda-chuva', ['preto', 'azul', 'grande']),
+    ('CUC', 'Carregador USB-C', ['65W', '30W']),
+    ('CHD', 'Cabo HDMI', ['1,5m', '3m']),
+    ('ADP', 'Adaptador', ['HDMI-VGA', 'USB-C-HDMI', 'tomada universal']),
+    ('LCA', 'Livro de Cálculo', ['volume 1', 'volume 2', 'volume 3']),
+    ('LFI', 'Livro de Física', ['Halliday 1', 'Halliday 2', 'Moysés 1']),
+    ('FON', 'Fone de ouvido', ['com fio', 'bluetooth']),
+    ('EXT', 'Extensão elétrica', ['3m', '5m']),
+    ('MOU', 'Mouse', ['com fio', 'sem fio']),
+    ('TEC', 'Teclado', ['ABNT2', 'US']),
+    ('LUV', 'Luvas de laboratório', ['P', 'M', 'G']),
+    ('CAP', 'Capacete', ['branco', 'amarelo']),
+    ('PJT', 'Projetor', ['portátil']),
+    ('BOL', 'Bola', ['futebol', 'vôlei', 'basquete']),
+    ('RAQ', 'Raquete de tênis de mesa', ['par']),
+    ('JOG', 'Jogo de tabuleiro', ['xadrez', 'damas', 'War']),
+    ('TRE', 'Trena', ['5m', '30m']),
+    ('PAQ', 'Paquímetro', ['digital', 'analógico']),
+    ('MUL', 'Multímetro', ['digital']),
+    ('ARD', 'Kit Arduino', ['Uno', 'Mega']),
+    ('PEN', 'Pendrive', ['32GB', '64GB']),
+]
+
+# Peso de cada mês (1 = janeiro): férias têm bem menos movimento.
+PESO_MES = [0.25, 0.45, 1.0, 1.0, 1.0, 0.9, 0.35, 0.8, 1.0, 1.0, 1.0, 0.55]
+
+# Horas de atendimento e o peso de cada uma.
+HORAS = list(range(7, 23))
+PESO_HORA = [1, 3, 6, 7, 7, 5, 6, 7, 7, 6, 5, 4, 3, 2, 1, 1]
+ACUMULADO_HORA = list(accumulate(PESO_HORA))
+
+# Dias entre a reserva e a retirada, e duração do empréstimo.
+ANTECEDENCIA = [0, 0, 0, 1, 1, 1, 2, 2, 3, 5, 7]
+DURACAO = [0, 1, 1, 2, 2, 3, 3, 5, 7, 7, 14]
+
+LOTE = 5000
+
+PENDENTE = Reserva.Status.PENDENTE
+CONFIRMADO = Reserva.Status.CONFIRMADO
+CANCELADA = Reserva.Status.CANCELADA
+CONCLUIDA = Reserva.Status.CONCLUIDA
+
+
+def _ascii(texto):
+    decomposto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def _pesos_zipf(quantidade, aleatorio, expoente):
+    """
+    Pesos de popularidade (1/posição^expoente) em ordem aleatória.
+    """
+    pesos = [1 / (posicao ** expoente) for posicao in range(1, quantidade + 1)]
+    aleatorio.shuffle(pesos)
+    return pesos
+
+
+def tem_dados():
+    return (
+        Reserva.objects.exists()
+        or Item.objects.exists()
+        or Usuario.objects.filter(is_superuser=False).exists()
+    )
+
+
+def limpar():
+    """
+    Apaga reservas, exemplares, itens, usuários (menos superusuários) e as
+    tabelas derivadas. Apaga de baixo para cima, e as tabelas grandes com um
+    DELETE direto: pelo ORM, os sinais de Reserva (ocupação, busca,
+    estatísticas) carregariam e ajustariam cada uma das reservas.
+    """
+    nome = connection.ops.quote_name
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for modelo in (OcupacaoDiaria, EstatisticaDiaria, EstatisticaMensal, ContagemUsuarioItem, Reserva, Exemplar):
+                cursor.execute(f'DELETE FROM {nome(modelo._meta.db_table)}')
+        busca.reconstruir_indice()
+        Item.objects.all().delete()
+        Usuario.objects.filter(is_superuser=False).delete()
+
+
+class Gerador:
+    """
+    Gera e grava a massa de dados. Uso: Gerador(semente=1).gerar(reservas=1_000_000).
+    """
+
+    def __init__(self, semente=0, hoje=None, dias=730, senha='tem-no-cam', progresso=None):
+        self.aleatorio = random.Random(semente)
+        self.hoje = hoje or timezone.localdate()
+        self.dias = dias
+        self.senha = senha
+        self.progresso = progresso or (lambda mensagem: None)
+        self.fuso = timezone.get_current_timezone()
+
+    def gerar(self, usuarios=5000, itens=300, exemplares=30000, reservas=1_000_000):
+        self._criar_usuarios(usuarios)
+        self._criar_itens(itens)
+        self._criar_exemplares(exemplares)
+        self._criar_reservas(reservas)
+        self._derivar()
+        return {
+            'usuarios': len(self.usuarios),
+            'itens': len(self.itens),
+            'exemplares': sum(len(ids) for ids in self.exemplares_por_item.values()),
+            'reservas': reservas,
+        }
+
+    def _criar_usuarios(self, quantidade):
+        aleatorio = self.aleatorio
+        # Um hash só para todos: calcular PBKDF2 por usuário levaria minutos.
+        senha = make_password(self.senha)
+        inicio = timezone.make_aware(datetime.combine(self.hoje - timedelta(days=self.dias), time(8)))
+
+        novos = []
+        for i in range(quantidade):
+            nome = aleatorio.choice(NOMES)
+            sobrenome = aleatorio.choice(SOBRENOMES)
+            username = _ascii(f'{nome}.{sobrenome}{i}').lower()
+            if i < 2:
+                tipo = Usuario.TiposAcesso.DIRETORIA
+            elif i < 2 + max(1, quantidade // 100):
+                tipo = Usuario.TiposAcesso.MEMBRO_GESTAO
+            else:
+                tipo = Usuario.TiposAcesso.ALUNO
+            novos.append(Usuario(
+                username=username,
+                nusp=str(10_000_000 + i),
+                email=f'{username}@usp.br',
+                first_name=nome,
+                last_name=sobrenome,
+                password=senha,
+                tipo_acesso=tipo,
+                telefone=f'(11) 9{aleatorio.randint(1000, 9999)}-{aleatorio.randint(1000, 9999)}',
+                date_joined=inicio + timedelta(minutes=aleatorio.randint(0, self.dias * 24 * 60)),
+            ))
+        Usuario.objects.bulk_create(novos, batch_size=1000)
+
+        self.usuarios = list(Usuario.objects.filter(nusp__in=[u.nusp for u in novos]).order_by('nusp'))
+        self.gestores = [u.id for u in self.usuarios if u.tipo_acesso != Usuario.TiposAcesso.ALUNO]
+        self.acumulados_usuarios = list(accumulate(_pesos_zipf(len(self.usuarios), aleatorio, 0.6)))
+        self.progresso(f'{len(self.usuarios)} usuários')
+
+    def _criar_itens(self, quantidade):
+        novos = []
+        for i in range(quantidade):
+            sigla, nome, variacoes = CATALOGO[i % len(CATALOGO)]
+            variacao = variacoes[(i // len(CATALOGO)) % len(variacoes)]
+            lote = i // (len(CATALOGO) * len(variacoes))
+            novos.append(Item(
+                nome=f'{nome} {variacao}' + (f' ({lote + 1})' if lote else ''),
+                codigo_tipo=f'{sigla}{i:04d}',
+                descricao=f'{nome} ({variacao}) para empréstimo no CAM.',
+            ))
+        Item.objects.bulk_create(novos, batch_size=1000)
+
+        self.itens = list(Item.objects.filter(codigo_tipo__in=[i.codigo_tipo for i in novos]).order_by('codigo_tipo'))
+        self.pesos_itens = _pesos_zipf(len(self.itens), self.aleatorio, 0.8)
+        self.acumulados_itens = list(accumulate(self.pesos_itens))
+        self.progresso(f'{len(self.itens)} itens')
+
+    def _criar_exemplares(self, quantidade):
+        """
+        Distribui os exemplares proporcionalmente à popularidade do item (pelo menos um por item).
+        """
+        aleatorio = self.aleatorio
+        total_pesos = sum(self.pesos_itens)
+
+        novos = []
+        for item, peso in zip(self.itens, self.pesos_itens):
+            for n in range(max(1, round(quantidade * peso / total_pesos))):
+                defeituoso = aleatorio.random() < 0.03
+                novos.append(Exemplar(
+                    item_id=item.id,
+                    codigo_exemplar=f'{item.codigo_tipo}-{n + 1:04d}',
+                    condicao=Exemplar.Condicao.DEFEITUOSO if defeituoso else Exemplar.Condicao.BOM,
+                    situacao=(
+                        Exemplar.Situacao.EM_MANUTENCAO
+                        if defeituoso and aleatorio.random() < 0.7
+                        else Exemplar.Situacao.DISPONIVEL
+                    ),
+                ))
+        Exemplar.objects.bulk_create(novos, batch_size=1000)
+
+        self.exemplares_por_item = defaultdict(list)
+        self.livres_por_item = defaultdict(list)
+        for exemplar_id, item_id, situacao, condicao in (
+            Exemplar.objects.filter(item__in=self.itens).order_by('id')
+            .values_list('id', 'item_id', 'situacao', 'condicao').iterator(chunk_size=LOTE)
+        ):
+            self.exemplares_por_item[item_id].append(exemplar_id)
+            if situacao == Exemplar.Situacao.DISPONIVEL and condicao == Exemplar.Condicao.BOM:
+                self.livres_por_item[item_id].append(exemplar_id)
+        self.progresso(f'{len(novos)} exemplares')
+
+    def _dias_ponderados(self):
+        dias = [self.hoje - timedelta(days=self.dias - 1 - i) for i in range(self.dias)]
+        pesos = []
+        for i, dia in enumerate(dias):
+            peso = PESO_MES[dia.month - 1] * (0.2 if dia.weekday() >= 5 else 1.0)
+            pesos.append(peso * (0.6 + 0.4 * i / self.dias))
+        return dias, list(accumulate(pesos))
+
+    def _criar_reservas(self, quantidade):
+        aleatorio = self.aleatorio
+        dias, acumulados_dias = self._dias_ponderados()
+        documentos_usuarios = [
+            busca.normalizar(' '.join(getattr(u, c) for c in busca.CAMPOS_USUARIO if getattr(u, c)))
+            for u in self.usuarios
+        ]
+        documentos_itens = [
+            busca.normalizar(' '.join(getattr(i, c) for c in busca.CAMPOS_ITEM if getattr(i, c)))
+            for i in self.itens
+        ]
+        self._preparar_datas()
+        self._ids_usuarios = [u.id for u in self.usuarios]
+        self._ids_itens = [i.id for i in self.itens]
+        indices_usuarios = range(len(self.usuarios))
+        indices_itens = range(len(self.itens))
+
+        # Contagens para as tabelas de estatísticas, montadas enquanto as
+        # reservas são geradas (ver _gravar_estatisticas).
+        self.por_item_dia = Counter()
+        self.por_usuario_item = Counter()
+
+        gravadas = 0
+        with _sem_indices(Reserva):
+            while gravadas < quantidade:
+                tamanho = min(LOTE, quantidade - gravadas)
+                sorteios = zip(
+                    aleatorio.choices(dias, cum_weights=acumulados_dias, k=tamanho),
+                    aleatorio.choices(indices_usuarios, cum_weights=self.acumulados_usuarios, k=tamanho),
+                    aleatorio.choices(indices_itens, cum_weights=self.acumulados_itens, k=tamanho),
+                    aleatorio.choices(ANTECEDENCIA, k=tamanho),
+                    aleatorio.choices(DURACAO, k=tamanho),
+                    aleatorio.choices(HORAS, cum_weights=ACUMULADO_HORA, k=tamanho),
+                )
+                linhas = [
+                    self._reserva(dia, u, i, antecedencia, duracao, hora, documentos_usuarios[u], documentos_itens[i])
+                    for dia, u, i, antecedencia, duracao, hora in sorteios
+                ]
+                with transaction.atomic():
+                    _inserir(Reserva, CAMPOS_RESERVA, linhas)
+                gravadas += tamanho
+                if gravadas % (LOTE * 20) == 0 or gravadas == quantidade:
+                    self.progresso(f'{gravadas} reservas')
+            self.progresso('recriando os índices de reservas')
+
+    def _preparar_datas(self):
+        """
+        As datas e horas das reservas são montadas já no fuso do banco e sem
+        tzinfo (como o SQLite as guarda), a partir de uma tabela (dia, hora)
+        calculada uma vez: converter e formatar cada valor pelo Django custava
+        mais que gerar a reserva.
+        """
+        fuso_banco = connection.timezone
+        self._horas = {}
+        self._prazos = {}
+        self._converter = lambda momento: timezone.make_naive(momento, fuso_banco)
+        if connection.vendor == 'sqlite':
+            self._datahora = lambda valor: None if valor is None else str(valor)
+        else:
+            self._datahora = lambda valor: None if valor is None else connection.ops.adapt_datetimefield_value(
+                valor.replace(tzinfo=fuso_banco)
+            )
+        self._data = connection.ops.adapt_datefield_value
+
+    def _hora(self, dia, hora):
+        chave = (dia, hora)
+        valor = self._horas.get(chave)
+        if valor is None:
+            valor = self._horas[chave] = self._converter(datetime.combine(dia, time(hora, tzinfo=self.fuso)))
+        return valor
+
+    def _prazo(self, retirada):
+        valor = self._prazos.get(retirada)
+        if valor is None:
+            valor = self._prazos[retirada] = self._converter(prazo_retirada(retirada))
+        return valor
+
+    def _momento(self, dia, hora=None):
+        """
+        Data e hora no fuso do banco (hora sorteada entre as de atendimento se não vier).
+        """
+        if hora is None:
+            hora = self.aleatorio.choices(HORAS, cum_weights=ACUMULADO_HORA)[0]
+        return self._hora(dia, hora) + timedelta(seconds=self.aleatorio.randrange(3600))
+
+    def _reserva(self, dia, indice_usuario, indice_item, antecedencia, duracao, hora, documento_usuario, documento_item):
+        aleatorio = self.aleatorio
+        hoje = self.hoje
+        usuario_id = self._ids_usuarios[indice_usuario]
+        item_id = self._ids_itens[indice_item]
+        self.por_item_dia[(item_id, dia)] += 1
+        self.por_usuario_item[(usuario_id, item_id)] += 1
+
+        criada = self._momento(dia, hora)
+        retirada = dia + timedelta(days=antecedencia)
+        devolucao = retirada + timedelta(days=duracao)
+        sorteio = aleatorio.random()
+
+        if retirada > hoje:
+            status = PENDENTE if sorteio < 0.92 else CANCELADA
+        elif retirada == hoje:
+            status = PENDENTE if sorteio < 0.6 else CONFIRMADO if sorteio < 0.95 else CANCELADA
+        elif devolucao >= hoje:
+            status = CONFIRMADO if sorteio < 0.85 else CANCELADA
+        elif devolucao >= hoje - timedelta(days=30) and sorteio < 0.03:
+            status = CONFIRMADO  # devolução atrasada
+        else:
+            status = CONCLUIDA if sorteio < 0.85 else CANCELADA
+
+        exemplar_id = None
+        if status == CONFIRMADO:
+            # Empréstimo em andamento: segura um exemplar livre de verdade.
+            livres = self.livres_por_item[item_id]
+            if livres:
+                exemplar_id = livres.pop(aleatorio.randrange(len(livres)))
+            else:
+                status = CANCELADA
+        elif status == CONCLUIDA:
+            exemplar_id = aleatorio.choice(self.exemplares_por_item[item_id])
+
+        cancelada_em = usuario_cancelou = None
+        motivo = ''
+        automatico = False
+        if status == CANCELADA:
+            if retirada < hoje and sorteio < 0.5:
+                automatico = True
+                motivo = MOTIVO
+                cancelada_em = self._prazo(retirada)
+            else:
+                usuario_cancelou = usuario_id
+                motivo = 'Cancelada pelo usuário.'
+                cancelada_em = criada + timedelta(minutes=aleatorio.randint(5, 2 * 24 * 60))
+
+        confirmou_retirada = data_confirmou_retirada = None
+        if status == CONFIRMADO or status == CONCLUIDA:
+            confirmou_retirada = aleatorio.choice(self.gestores)
+            data_confirmou_retirada = max(criada, self._momento(retirada))
+
+        confirmou_devolucao = data_confirmou_devolucao = None
+        if status == CONCLUIDA:
+            confirmou_devolucao = aleatorio.choice(self.gestores)
+            data_confirmou_devolucao = max(
+                data_confirmou_retirada,
+                self._momento(devolucao - timedelta(days=1) if sorteio < 0.2 else devolucao),
+            )
+
+        datahora = self._datahora
+        data = self._data
+        return (
+            usuario_id,
+            item_id,
+            exemplar_id,
+            datahora(criada),
+            data(retirada),
+            data(devolucao),
+            status,
+            '',
+            datahora(cancelada_em),
+            motivo,
+            automatico,
+            usuario_cancelou,
+            confirmou_retirada,
+            datahora(data_confirmou_retirada),
+            confirmou_devolucao,
+            datahora(data_confirmou_devolucao),
+            datahora(self._prazo(retirada)) if status == PENDENTE else None,
+            None,
+            f'{documento_usuario} {documento_item}',
+        )
+
+    def _gravar_estatisticas(self):
+        """
+        Mesmo resultado de estatisticas.reconstruir(), mas a partir das
+        contagens feitas durante a geração, sem reler todas as reservas.
+        """
+        por_item_mes = Counter()
+        for (item_id, dia), total in self.por_item_dia.items():
+            por_item_mes[(item_id, dia.replace(day=1))] += total
+        por_usuario = Counter()
+        for (usuario_id, _), total in self.por_usuario_item.items():
+            por_usuario[usuario_id] += total
+
+        # Em ordem de chave, cada INSERT cai perto do anterior nos índices únicos.
+        data = connection.ops.adapt_datefield_value
+        with transaction.atomic():
+            with _sem_indices(EstatisticaDiaria):
+                _inserir(EstatisticaDiaria, ('item_id', 'dia', 'total'), [
+                    (item_id, data(dia), total) for (item_id, dia), total in sorted(self.por_item_dia.items())
+                ])
+            with _sem_indices(EstatisticaMensal):
+                _inserir(EstatisticaMensal, ('item_id', 'mes', 'total'), [
+                    (item_id, data(mes), total) for (item_id, mes), total in sorted(por_item_mes.items())
+                ])
+            with _sem_indices(ContagemUsuarioItem):
+                _inserir(ContagemUsuarioItem, ('usuario_id', 'item_id', 'total'), [
+                    (usuario_id, item_id, total)
+                    for (usuario_id, item_id), total in sorted(self.por_usuario_item.items())
+                ] + [
+                    (usuario_id, None, total) for usuario_id, total in sorted(por_usuario.items())
+                ])
+            estatisticas.nova_versao()
+
+    def _derivar(self):
+        """
+        Refaz, com consultas agregadas, tudo que as telas leem pronto.
+        """
+        usos = (
+            Reserva.objects
+            .filter(exemplar=OuterRef('pk'), status__in=(CONFIRMADO, CONCLUIDA))
+            .order_by()
+            .values('exemplar')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        with transaction.atomic():
+            exemplares = Exemplar.objects.filter(item__in=self.itens)
+            exemplares.update(vezes_retirado=Coalesce(Subquery(usos, output_field=IntegerField()), 0))
+            exemplares.filter(reservas__status=CONFIRMADO).update(situacao=Exemplar.Situacao.RESERVADO)
+            estoque.recontar()
+            disponibilidade.reconstruir()
+        self.progresso('exemplares, estoque e ocupação atualizados')
+
+        self._gravar_estatisticas()
+        self.progresso('estatísticas gravadas')
+
+        busca.reconstruir_indice()
+        self.progresso('índice de busca refeito')
+
+
+CAMPOS_RESERVA = (
+    'usuario_id', 'item_id', 'exemplar_id', 'data_reserva', 'data_retirada', 'data_devolucao', 'status',
+    'observacoes', 'cancelada_em', 'motivo_cancelamento', 'cancelamento_automatico', 'usuario_cancelou_id',
+    'usuario_confirmou_retirada_id', 'data_confirmou_retirada', 'usuario_confirmou_devolucao_id',
+    'data_confirmou_devolucao', 'expira_em', 'ultimo_lembrete_em', 'documento_busca',
+)
+
+
+@contextmanager
+def _sem_indices(modelo):
+    """
+    Apaga os índices secundários da tabela durante a carga e os recria no
+    fim: montar cada índice uma vez, com todas as linhas, é muito mais rápido
+    que atualizar uma dúzia de índices a cada INSERT.
+    """
+    tabela = modelo._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT indexname, indexdef FROM pg_indexes "
+                "WHERE schemaname = current_schema() AND tablename = %s AND indexdef NOT LIKE 'CREATE UNIQUE%%'",
+                [tabela],
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%%'",
+                [tabela],
+            )
+        indices = cursor.fetchall() if connection.vendor in ('postgresql', 'sqlite') else []
+        for nome, _ in indices:
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(nome)}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for _, definicao in indices:
+                cursor.execute(definicao)
+
+
+def _inserir(modelo, campos, linhas):
+    """
+    Grava tuplas já convertidas para o banco com INSERTs de várias linhas
+    (o mesmo SQL do bulk_create, sem montar instâncias do modelo).
+
+    Usa direto o cursor do driver, sem o wrapper do Django: com DEBUG ligado
+    ele formataria e guardaria em connection.queries cada INSERT (com
+    milhares de parâmetros), e no SQLite ainda reescreveria cada "%s" do SQL.
+    """
+    nome = connection.ops.quote_name
+    colunas = ', '.join(nome(modelo._meta.get_field(campo).column) for campo in campos)
+    por_comando = min(1000, (connection.features.max_query_params or 65535) // len(campos))
+    marcador = '?' if connection.vendor == 'sqlite' else '%s'
+    marcadores = '(' + ', '.join([marcador] * len(campos)) + ')'
+
+    connection.ensure_connection()
+    cursor = connection.connection.cursor()
+    try:
+        for inicio in range(0, len(linhas), por_comando):
+            lote = linhas[inicio:inicio + por_comando]
+            cursor.execute(
+                f'INSERT INTO {nome(modelo._meta.db_table)} ({colunas}) VALUES '
+                + ', '.join([marcadores] * len(lote)),
+                [valor for linha in lote for valor in linha],
+            )
+    finally:
+        cursor.close()
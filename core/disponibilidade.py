@@ -0,0 +1,183 @@
+"""
+Controle de disponibilidade dos itens por período.
+
+Cada reserva ativa (pendente ou confirmada) ocupa uma unidade do item em todos
+os dias entre a retirada e a devolução. A tabela OcupacaoDiaria guarda esse
+total por (item, dia), então verificar um pedido custa uma busca no índice
+único (item, dia) e a leitura de no máximo ~15 linhas, não importa quantas
+reservas o item já teve.
+
+A ocupação acompanha a própria Reserva: Reserva.save() chama `mover` com a
+situação anterior e a nova (criação, cancelamento, devolução, troca de datas
+ou de item, inclusive pelo admin), e a remoção de uma reserva (direta ou em
+cascata, ao apagar usuário ou item) devolve os dias dela. Toda mudança trava
+antes a linha do Item, então pedidos simultâneos do mesmo item são atendidos
+um de cada vez e nunca veem a mesma sobra. UPDATEs em lote em Reserva devem
+ajustar a ocupação por conta própria, com `liberar_reservas` (ver
+core.cancelamentos).
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import Exemplar, Item, OcupacaoDiaria, Reserva
+
+
+STATUS_ATIVOS = (Reserva.Status.PENDENTE, Reserva.Status.CONFIRMADO)
+
+
+def _janela(item_id, inicio, fim):
+    return OcupacaoDiaria.objects.filter(item_id=item_id, dia__range=(inicio, fim))
+
+
+def travar_itens(item_ids=None):
+    """
+    SELECT ... FOR UPDATE nas linhas dos itens, sempre na mesma ordem (sem
+    deadlock entre duas transações que travam os mesmos itens). Sem
+    `item_ids`, trava o catálogo inteiro.
+    """
+    itens = Item.objects.select_for_update()
+    if item_ids is not None:
+        itens = itens.filter(pk__in=item_ids)
+    list(itens.order_by('pk').values_list('pk', flat=True))
+
+
+def capacidade(item_id):
+    """
+    Exemplares que podem ser emprestados: em bom estado e fora de manutenção.
+    """
+    return (Exemplar.objects
+            .filter(item_id=item_id, condicao=Exemplar.Condicao.BOM)
+            .exclude(situacao=Exemplar.Situacao.EM_MANUTENCAO)
+            .count())
+
+
+def demanda_maxima(item_id, inicio, fim):
+    """
+    Maior número de reservas ativas num mesmo dia dentro de [inicio, fim].
+    """
+    return _janela(item_id, inicio, fim).aggregate(maximo=Max('quantidade'))['maximo'] or 0
+
+
+def periodo_ocupado(estado):
+    """
+    (item_id, retirada, devolução) que a reserva ocupa, a partir de
+    (item_id, status, data_retirada, data_devolucao); None se ela não ocupa nada.
+    """
+    if estado is None:
+        return None
+    item_id, status, inicio, fim = estado
+    if status not in STATUS_ATIVOS:
+        return None
+    return item_id, inicio, fim
+
+
+def _ocupar(item_id, inicio, fim):
+    dias = (fim - inicio).days + 1
+    OcupacaoDiaria.objects.bulk_create(
+        [OcupacaoDiaria(item_id=item_id, dia=inicio + timedelta(days=i)) for i in range(dias)],
+        ignore_conflicts=True,
+    )
+    _janela(item_id, inicio, fim).update(quantidade=F('quantidade') + 1)
+
+
+def _liberar(item_id, inicio, fim):
+    _janela(item_id, inicio, fim).filter(quantidade__gt=0).update(quantidade=F('quantidade') - 1)
+
+
+def mover(anterior, atual):
+    """
+    Ajusta a ocupação de uma reserva que passou do estado `anterior` para
+    `atual`, ambos no formato (item_id, status, data_retirada, data_devolucao).
+    None significa que a reserva não existia (criação) ou deixou de existir
+    (remoção). Não confere capacidade: quem precisa, usa `reservar`.
+    """
+    antes, depois = periodo_ocupado(anterior), periodo_ocupado(atual)
+    if antes == depois:
+        return
+
+    with transaction.atomic():
+        travar_itens({periodo[0] for periodo in (antes, depois) if periodo})
+        if antes:
+            _liberar(*antes)
+        if depois:
+            _ocupar(*depois)
+
+
+def liberar_reservas(reservas):
+    """
+    Devolve de uma vez os dias ocupados pelas reservas ativas do queryset:
+    um único UPDATE subtrai, de cada (item, dia), quantas delas caem naquele
+    dia. Deve rodar antes do UPDATE que as desativa, na mesma transação e com
+    os itens e as reservas já travados.
+    """
+    no_dia = reservas.filter(
+        status__in=STATUS_ATIVOS,
+        item_id=OuterRef('item_id'),
+        data_retirada__lte=OuterRef('dia'),
+        data_devolucao__gte=OuterRef('dia'),
+    )
+    quantas = no_dia.order_by().values('item_id').annotate(n=Count('pk')).values('n')
+    return (OcupacaoDiaria.objects
+            .filter(item_id__in=reservas.values('item_id'))
+            .filter(Exists(no_dia))
+            .update(quantidade=Greatest(F('quantidade') - Subquery(quantas), 0)))
+
+
+def reservar(reserva):
+    """
+    Salva uma nova reserva somente se houver exemplar livre em todo o período.
+    Retorna False (sem salvar nada) quando o item está lotado.
+    """
+    with transaction.atomic():
+        travar_itens([reserva.item_id])
+        demanda = demanda_maxima(reserva.item_id, reserva.data_retirada, reserva.data_devolucao)
+        if demanda >= capacidade(reserva.item_id):
+            return False
+        reserva.save()
+    return True
+
+
+# pre_delete: a linha ainda existe (campos adiados podem ser lidos) e o
+# ajuste entra na mesma transação do DELETE, inclusive nas cascatas.
+@receiver(pre_delete, sender=Reserva)
+def _reserva_removida(sender, instance, **kwargs):
+    mover(instance._ocupacao_no_banco(), None)
+
+
+def reconstruir(item_ids=None):
+    """
+    Recalcula a ocupação diária a partir das reservas ativas.
+    Usado na migração inicial e quando o estado sai de sincronia (ex.: edição pelo admin).
+    Os itens ficam travados da leitura até a gravação: nenhuma reserva deles
+    muda no meio da contagem.
+    """
+    reservas = Reserva.objects.filter(status__in=STATUS_ATIVOS)
+    ocupacoes = OcupacaoDiaria.objects.all()
+    if item_ids is not None:
+        reservas = reservas.filter(item_id__in=item_ids)
+        ocupacoes = ocupacoes.filter(item_id__in=item_ids)
+
+    with transaction.atomic():
+        travar_itens(item_ids)
+
+        contagem = Counter()
+        for item_id, inicio, fim in reservas.values_list('item_id', 'data_retirada', 'data_devolucao').iterator():
+            for i in range((fim - inicio).days + 1):
+                contagem[(item_id, inicio + timedelta(days=i))] += 1
+
+        ocupacoes.delete()
+        OcupacaoDiaria.objects.bulk_create(
+            [
+                OcupacaoDiaria(item_id=item_id, dia=dia, quantidade=quantidade)
+                for (item_id, dia), quantidade in contagem.items()
+            ],
+            batch_size=1000,
+        )
+
+    return len(contagem)
@@ -0,0 +1,138 @@
+"""
+Envio assíncrono de e-mails.
+
+As views chamam `enfileirar`, que só grava um EmailPendente (na mesma
+transação do que gerou o e-mail). O comando `manage.py enviar_emails` pega
+os pendentes em lotes e envia todos por uma única conexão SMTP. Falhas são
+tentadas de novo com espera crescente (1, 2, 4, 8... minutos, até 1h) e
+desistidas depois de MAX_TENTATIVAS.
+
+Em produção o comando roda fora do servidor web, supervisionado por quem
+reinicia processos que caem, de um destes jeitos:
+- serviço próprio (background worker da hospedagem, systemd com
+  Restart=always, supervisor...) rodando `manage.py enviar_emails --continuo`;
+- cron a cada minuto com `manage.py enviar_emails`, que esvazia a fila e sai.
+Os dois podem rodar juntos ou em mais de uma máquina: cada lote é reservado
+por quem o pegou (ver `_reservar_lote`).
+
+Para testar localmente sem Gmail, suba um servidor SMTP de teste e aponte
+as variáveis de ambiente para ele:
+
+    python -m aiosmtpd -n -l localhost:1025
+    EMAIL_HOST=localhost EMAIL_PORT=1025 EMAIL_USE_TLS=False EMAIL_HOST_USER= EMAIL_HOST_PASSWORD= \
+        python manage.py enviar_emails
+"""
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmailPendente
+
+
+MAX_TENTATIVAS = 8
+
+# Tempo que um lote fica reservado para um worker antes de poder ser pego por outro.
+RESERVA_LOTE = timedelta(minutes=5)
+
+# Recusas do servidor que dizem respeito só àquele e-mail (destinatário ou
+# conteúdo): a conexão continua boa para o resto do lote. Qualquer outro erro
+# é tratado como problema de conexão, e ela é reaberta.
+ERROS_DA_MENSAGEM = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+def enfileirar(destinatario, assunto, mensagem):
+    return EmailPendente.objects.create(
+        destinatario=destinatario,
+        assunto=assunto,
+        mensagem=mensagem,
+    )
+
+
+def _espera(tentativas):
+    return timedelta(minutes=min(2 ** (tentativas - 1), 60))
+
+
+def _reservar_lote(tamanho):
+    """
+    Pega até `tamanho` e-mails vencidos e adia a próxima tentativa deles, para
+    que outro worker rodando ao mesmo tempo não envie os mesmos.
+    """
+    agora = timezone.now()
+    with transaction.atomic():
+        pendentes = EmailPendente.objects.filter(
+            enviado_em__isnull=True,
+            proxima_tentativa__lte=agora,
+            tentativas__lt=MAX_TENTATIVAS,
+        ).order_by('proxima_tentativa')
+        if connection.features.has_select_for_update_skip_locked:
+            pendentes = pendentes.select_for_update(skip_locked=True)
+
+        lote = list(pendentes[:tamanho])
+        EmailPendente.objects.filter(pk__in=[e.pk for e in lote]).update(
+            proxima_tentativa=agora + RESERVA_LOTE
+        )
+    return lote
+
+
+def _abrir(conexao):
+    try:
+        conexao.open()
+    except Exception:
+        # Servidor fora do ar: cada envio abaixo tenta reabrir e registra o erro.
+        pass
+
+
+def enviar_pendentes(tamanho_lote=50):
+    """
+    Envia um lote de e-mails pendentes. Retorna (enviados, falhas).
+
+    Cada e-mail é marcado como enviado logo depois do envio: se o processo
+    cair no meio do lote, os já entregues não são mandados de novo.
+    """
+    lote = _reservar_lote(tamanho_lote)
+    if not lote:
+        return 0, 0
+
+    enviados = 0
+    falhas = 0
+    conexao = get_connection()
+    _abrir(conexao)
+
+    try:
+        for email in lote:
+            mensagem = EmailMessage(
+                email.assunto,
+                email.mensagem,
+                settings.DEFAULT_FROM_EMAIL,
+                [email.destinatario],
+                connection=conexao,
+            )
+            try:
+                mensagem.send()
+            except Exception as erro:
+                falhas += 1
+                tentativas = email.tentativas + 1
+                EmailPendente.objects.filter(pk=email.pk).update(
+                    tentativas=F('tentativas') + 1,
+                    proxima_tentativa=timezone.now() + _espera(tentativas),
+                    ultimo_erro=f'{type(erro).__name__}: {erro}'[:1000],
+                )
+                if not isinstance(erro, ERROS_DA_MENSAGEM):
+                    conexao.close()
+                    _abrir(conexao)
+            else:
+                enviados += 1
+                EmailPendente.objects.filter(pk=email.pk).update(
+                    enviado_em=timezone.now(),
+                    tentativas=F('tentativas') + 1,
+                    ultimo_erro='',
+                )
+    finally:
+        conexao.close()
+
+    return enviados, falhas
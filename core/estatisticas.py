@@ -0,0 +1,218 @@
+"""
+Estatísticas de reservas pré-agregadas para a api_estatisticas.
+
+Cada reserva criada soma 1 em EstatisticaDiaria (item, dia), em
+EstatisticaMensal (item, mês) e em ContagemUsuarioItem (usuário, item e
+usuário no total), na mesma transação do INSERT. A API lê só essas tabelas
+em vez de agrupar Reserva e Usuario inteiras a cada requisição; o ranking de
+usuários é uma leitura do índice (item, -total).
+
+As contagens são de reservas *criadas*: mudanças de status não alteram os
+totais. Reservas apagadas (inclusive em cascata, ao apagar usuário ou item)
+são descontadas pelo sinal pre_delete. Se reservas forem inseridas em lote
+(bulk_create) ou apagadas com SQL direto, rode `manage.py reconstruir_estatisticas`.
+
+Cada mudança incrementa a versão do item afetado (VersaoDados
+'estatisticas:<id do item>'); reconstruções incrementam a 'estatisticas'
+geral. A API usa a soma das versões relevantes como chave de cache e ETag.
+Uma versão por item evita que todas as reservas disputem a mesma linha.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BigIntegerField, Count, F, Q, Sum, Value
+from django.db.models.functions import Cast, TruncDate, TruncMonth
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ContagemUsuarioItem, EstatisticaDiaria, EstatisticaMensal, Reserva, VersaoDados
+
+
+CHAVE_VERSAO = 'estatisticas'
+
+
+def incrementar(modelo, delta=1, **chaves):
+    """
+    Soma `delta` ao campo `total` da linha identificada por `chaves`,
+    criando a linha se ainda não existir.
+    """
+    if modelo.objects.filter(**chaves).update(total=F('total') + delta):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(total=delta, **chaves)
+    except IntegrityError:
+        # Outra transação criou a linha entre o UPDATE e o INSERT.
+        modelo.objects.filter(**chaves).update(total=F('total') + delta)
+
+
+def descontar(modelo, **chaves):
+    """
+    Tira 1 do `total` da linha, se existir (nunca cria linha nem fica negativo).
+    """
+    modelo.objects.filter(total__gt=0, **chaves).update(total=F('total') - 1)
+
+
+def _chave_versao(item_id=None):
+    return f'{CHAVE_VERSAO}:{item_id}' if item_id else CHAVE_VERSAO
+
+
+def versao(item_id=None):
+    """
+    Muda sempre que as estatísticas do item (ou de qualquer item, sem
+    `item_id`) mudam: é a soma da versão geral com as versões por item.
+    """
+    if item_id:
+        filtro = Q(chave__in=[CHAVE_VERSAO, _chave_versao(item_id)])
+    else:
+        filtro = Q(chave=CHAVE_VERSAO) | Q(chave__startswith=f'{CHAVE_VERSAO}:')
+    return VersaoDados.objects.filter(filtro).aggregate(total=Sum('versao'))['total'] or 0
+
+
+def nova_versao(item_id=None):
+    chave = _chave_versao(item_id)
+    if VersaoDados.objects.filter(chave=chave).update(versao=F('versao') + 1):
+        return
+    try:
+        with transaction.atomic():
+            VersaoDados.objects.create(chave=chave, versao=1)
+    except IntegrityError:
+        VersaoDados.objects.filter(chave=chave).update(versao=F('versao') + 1)
+
+
+def registrar_reserva(reserva):
+    dia = timezone.localtime(reserva.data_reserva).date()
+    incrementar(EstatisticaDiaria, item_id=reserva.item_id, dia=dia)
+    incrementar(EstatisticaMensal, item_id=reserva.item_id, mes=dia.replace(day=1))
+    incrementar(ContagemUsuarioItem, usuario_id=reserva.usuario_id, item_id=reserva.item_id)
+    incrementar(ContagemUsuarioItem, usuario_id=reserva.usuario_id, item_id=None)
+    nova_versao(reserva.item_id)
+
+
+def remover_reserva(item_id, usuario_id, data_reserva):
+    dia = timezone.localtime(data_reserva).date()
+    descontar(EstatisticaDiaria, item_id=item_id, dia=dia)
+    descontar(EstatisticaMensal, item_id=item_id, mes=dia.replace(day=1))
+    descontar(ContagemUsuarioItem, usuario_id=usuario_id, item_id=item_id)
+    descontar(ContagemUsuarioItem, usuario_id=usuario_id, item_id=None)
+    nova_versao(item_id)
+
+
+@receiver(pre_delete, sender=Reserva)
+def _reserva_removida(sender, instance, **kwargs):
+    campos = ('item_id', 'usuario_id', 'data_reserva')
+    if instance.get_deferred_fields() & set(campos):
+        valores = Reserva.objects.filter(pk=instance.pk).values_list(*campos).first()
+    else:
+        valores = tuple(getattr(instance, campo) for campo in campos)
+    if valores is not None:
+        remover_reserva(*valores)
+
+
+def _inserir_agregado(modelo, colunas, consulta):
+    """
+    INSERT INTO <tabela do modelo> (colunas) <SELECT da consulta>: o banco
+    agrupa e grava sem trazer as linhas para o Python.
+    """
+    sql, params = consulta.query.sql_with_params()
+    nome = connection.ops.quote_name
+    destino = ', '.join(nome(modelo._meta.get_field(c).column) for c in colunas)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {nome(modelo._meta.db_table)} ({destino}) {sql}', params)
+        return cursor.rowcount
+
+
+def reconstruir():
+    """
+    Refaz as tabelas de estatísticas a partir de Reserva (usado para backfill).
+    Cada tabela é preenchida por um único INSERT ... SELECT agrupado.
+    """
+    por_dia = (
+        Reserva.objects
+        .annotate(dia=TruncDate('data_reserva'))
+        .values_list('item_id', 'dia')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    por_mes = (
+        EstatisticaDiaria.objects
+        .annotate(mes=TruncMonth('dia'))
+        .values_list('item_id', 'mes')
+        .annotate(total=Sum('total'))
+        .order_by()
+    )
+    por_usuario_item = Reserva.objects.values_list('usuario_id', 'item_id').annotate(total=Count('id')).order_by()
+    por_usuario = (
+        Reserva.objects
+        .values_list('usuario_id')
+        .annotate(sem_item=Cast(Value(None), BigIntegerField()), total=Count('id'))
+        .order_by()
+    )
+
+    with transaction.atomic():
+        EstatisticaDiaria.objects.all().delete()
+        EstatisticaMensal.objects.all().delete()
+        ContagemUsuarioItem.objects.all().delete()
+        linhas = _inserir_agregado(EstatisticaDiaria, ['item', 'dia', 'total'], por_dia)
+        _inserir_agregado(EstatisticaMensal, ['item', 'mes', 'total'], por_mes)
+        _inserir_agregado(ContagemUsuarioItem, ['usuario', 'item', 'total'], por_usuario_item)
+        _inserir_agregado(ContagemUsuarioItem, ['usuario', 'item', 'total'], por_usuario)
+        nova_versao()
+
+    return linhas
+
+
+def resumo(item_id=None):
+    """
+    Dados de reservas por dia, por mês, top 10 itens, top 10 usuários e
+    total, opcionalmente de um só item.
+    """
+    diarias = EstatisticaDiaria.objects.all()
+    mensais = EstatisticaMensal.objects.all()
+    if item_id:
+        diarias = diarias.filter(item_id=item_id)
+        mensais = mensais.filter(item_id=item_id)
+
+    reservas_por_dia = [
+        {"dia": r["dia"].strftime("%Y-%m-%d"), "total": r["total"]}
+        for r in diarias.values('dia').annotate(total=Sum('total')).order_by('dia')
+    ]
+
+    reservas_por_mes = [
+        {"mes": r["mes"].strftime("%Y-%m"), "total": r["total"]}
+        for r in mensais.values('mes').annotate(total=Sum('total')).order_by('mes')
+    ]
+
+    top_itens = [
+        {
+            "item": f"{r['item__codigo_tipo']} - {r['item__nome']}",
+            "total": r["total"],
+        }
+        for r in (
+            mensais
+            .values('item__nome', 'item__codigo_tipo')
+            .annotate(total=Sum('total'))
+            .order_by('-total')[:10]
+        )
+    ]
+
+    top_usuarios = [
+        {
+            "nusp": c.usuario.nusp,
+            "nome": c.usuario.get_full_name() or c.usuario.username or c.usuario.nusp,
+            "total": c.total,
+        }
+        for c in (
+            ContagemUsuarioItem.objects
+            .filter(item_id=item_id or None, total__gt=0)
+            .select_related('usuario')
+            .order_by('-total', 'usuario_id')[:10]
+        )
+    ]
+
+    return {
+        "total_reservas": mensais.aggregate(total=Sum('total'))['total'] or 0,
+        "reservas_por_dia": reservas_por_dia,
+        "top_itens": top_itens,
+        "reservas_por_mes": reservas_por_mes,
+        "top_usuarios": top_usuarios,
+    }
@@ -0,0 +1,100 @@
+"""
+Contadores de estoque por item (total, disponíveis, reservados, em manutenção).
+
+O catálogo lê esses campos direto da tabela Item, sem agregar exemplares.
+Quem muda `Exemplar.situacao` deve manter os contadores na mesma transação:
+- Exemplar.save()/delete() já chamam `mover`;
+- UPDATEs em lote (queryset.update) devem chamar `recontar` com os itens
+  afetados, como faz `atualizar_em_lote`.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .disponibilidade import travar_itens
+from .models import Exemplar, Item
+
+
+CAMPOS = {
+    Exemplar.Situacao.DISPONIVEL: 'disponiveis',
+    Exemplar.Situacao.RESERVADO: 'reservados',
+    Exemplar.Situacao.EM_MANUTENCAO: 'em_manutencao',
+}
+
+
+def _somar(item_id, situacao, delta, alteracoes):
+    campos = alteracoes.setdefault(item_id, {})
+    for campo in ('total_exemplares', CAMPOS.get(situacao)):
+        if campo:
+            campos[campo] = campos.get(campo, 0) + delta
+
+
+def mover(anterior, atual):
+    """
+    Ajusta os contadores para um exemplar que passou de `anterior` para
+    `atual`, ambos no formato (item_id, situacao). None significa que o
+    exemplar não existia (criação) ou deixou de existir (remoção).
+    """
+    if anterior == atual:
+        return
+
+    alteracoes = {}
+    if anterior is not None:
+        _somar(*anterior, -1, alteracoes)
+    if atual is not None:
+        _somar(*atual, 1, alteracoes)
+
+    for item_id, campos in alteracoes.items():
+        campos = {campo: F(campo) + delta for campo, delta in campos.items() if delta}
+        if campos:
+            Item.objects.filter(pk=item_id).update(**campos)
+
+
+def recontar(item_ids=None):
+    """
+    Recalcula os contadores a partir da tabela Exemplar com uma única consulta
+    agregada. Os itens ficam travados da contagem até a gravação, então uma
+    retirada ou devolução simultânea espera e ajusta o valor já recontado.
+    """
+    itens = Item.objects.all()
+    if item_ids is not None:
+        itens = itens.filter(pk__in=item_ids)
+
+    with transaction.atomic():
+        travar_itens(item_ids)
+
+        contagens = itens.annotate(
+            n_total=Count('exemplares'),
+            n_disponiveis=Count('exemplares', filter=Q(exemplares__situacao=Exemplar.Situacao.DISPONIVEL)),
+            n_reservados=Count('exemplares', filter=Q(exemplares__situacao=Exemplar.Situacao.RESERVADO)),
+            n_em_manutencao=Count('exemplares', filter=Q(exemplares__situacao=Exemplar.Situacao.EM_MANUTENCAO)),
+        ).only('pk')
+
+        atualizados = []
+        for item in contagens:
+            item.total_exemplares = item.n_total
+            item.disponiveis = item.n_disponiveis
+            item.reservados = item.n_reservados
+            item.em_manutencao = item.n_em_manutencao
+            atualizados.append(item)
+
+        Item.objects.bulk_update(
+            atualizados,
+            Item.CONTADORES,
+            batch_size=500,
+        )
+    return len(atualizados)
+
+
+def atualizar_em_lote(exemplares, **campos):
+    """
+    Um único UPDATE nos exemplares e recontagem do estoque dos itens afetados.
+    Exemplares emprestados ficam de fora: só mudam de situação na devolução.
+    Retorna quantos foram alterados.
+    """
+    exemplares = exemplares.exclude(situacao=Exemplar.Situacao.RESERVADO)
+    with transaction.atomic():
+        item_ids = set(exemplares.values_list('item_id', flat=True).distinct())
+        travar_itens(item_ids)
+        alterados = exemplares.update(**campos)
+        recontar(item_ids)
+    return alterados
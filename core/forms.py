@@ -45,7 +45,8 @@ class ReservaRetiradaForm(forms.ModelForm):
     """
     exemplar = forms.ModelChoiceField(
         queryset=Exemplar.objects.none(),
-        required=True,
+        required=False,
+        empty_label="Automático (exemplar menos usado)",
         label="Exemplar entregue"
     )
 
@@ -60,7 +61,7 @@ class ReservaRetiradaForm(forms.ModelForm):
             item=item,
             situacao=Exemplar.Situacao.DISPONIVEL,
             condicao=Exemplar.Condicao.BOM,
-        )
+        ).select_related('item').order_by('vezes_retirado', 'codigo_exemplar')
 
 
 class DevolucaoForm(forms.Form):
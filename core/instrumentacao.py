@@ -0,0 +1,220 @@
+"""
+Medição de SQL e tempo por requisição.
+
+O InstrumentacaoMiddleware envolve cada requisição com um
+`connection.execute_wrapper` que conta as consultas, soma o tempo gasto no
+banco e agrupa o SQL pela "forma" (sem valores e com listas IN colapsadas).
+Com isso:
+- com settings.INSTRUMENTACAO_SERVER_TIMING ligado, as respostas para a
+  gestão (e para staff) ganham o cabeçalho Server-Timing (db, view e total),
+  que aparece na aba Rede do navegador. Alunos e visitantes nunca o recebem:
+  os tempos e a contagem de consultas dizem muito sobre o servidor;
+- as últimas requisições ficam numa tabela em memória, vista pela diretoria
+  em /gestao/desempenho/ (a memória é de cada processo: com vários workers,
+  cada um mostra as suas). Respostas em streaming são registradas quando o
+  corpo termina de sair, com as consultas feitas durante a leitura;
+- se uma mesma forma de SQL se repete mais que
+  settings.INSTRUMENTACAO_LIMITE_REPETICOES vezes na requisição (o sinal
+  clássico de N+1), um aviso vai para o log 'core.instrumentacao'.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+_LISTA_IN = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def forma(sql):
+    """
+    SQL sem valores: consultas que só mudam nos parâmetros ficam iguais.
+    """
+    return _LITERAIS.sub('?', _LISTA_IN.sub('IN (...)', sql))
+
+
+class MedidorConsultas:
+    """
+    Execute wrapper que registra quantidade, tempo e forma de cada consulta.
+    """
+
+    def __init__(self):
+        self.quantidade = 0
+        self.tempo = 0.0
+        self.formas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo += time.perf_counter() - inicio
+            self.quantidade += 1
+            self.formas[forma(sql)] += 1
+
+
+@dataclass
+class Registro:
+    momento: object
+    metodo: str
+    caminho: str
+    status: int
+    consultas: int
+    # Tempos em milissegundos.
+    banco_ms: float
+    view_ms: float
+    total_ms: float
+    repetidas: list = field(default_factory=list)
+
+    @property
+    def maior_repeticao(self):
+        return self.repetidas[0][1] if self.repetidas else 0
+
+
+class Historico:
+    """
+    As últimas requisições medidas neste processo.
+    """
+
+    def __init__(self, tamanho):
+        self._registros = deque(maxlen=tamanho)
+        self._trava = threading.Lock()
+
+    def adicionar(self, registro):
+        with self._trava:
+            self._registros.append(registro)
+
+    def registros(self):
+        with self._trava:
+            return list(reversed(self._registros))
+
+    def por_caminho(self):
+        """
+        Resumo por caminho: requisições, médias e piores casos.
+        """
+        grupos = {}
+        for registro in self.registros():
+            grupos.setdefault(registro.caminho, []).append(registro)
+
+        resumo = []
+        for caminho, registros in grupos.items():
+            n = len(registros)
+            resumo.append({
+                'caminho': caminho,
+                'requisicoes': n,
+                'consultas_media': sum(r.consultas for r in registros) / n,
+                'consultas_max': max(r.consultas for r in registros),
+                'banco_medio_ms': sum(r.banco_ms for r in registros) / n,
+                'total_medio_ms': sum(r.total_ms for r in registros) / n,
+                'total_max_ms': max(r.total_ms for r in registros),
+            })
+        return sorted(resumo, key=lambda linha: linha['total_medio_ms'], reverse=True)
+
+    def limpar(self):
+        with self._trava:
+            self._registros.clear()
+
+
+historico = Historico(getattr(settings, 'INSTRUMENTACAO_HISTORICO', 200))
+
+
+@contextmanager
+def _medindo(medidor):
+    with ExitStack() as pilha:
+        for alias in connections:
+            pilha.enter_context(connections[alias].execute_wrapper(medidor))
+        yield
+
+
+def pode_ver_tempos(usuario):
+    """
+    Staff e gestão (membros e diretoria) podem receber o Server-Timing.
+    """
+    if usuario is None or not usuario.is_authenticated:
+        return False
+    return usuario.is_staff or usuario.tipo_acesso != usuario.TiposAcesso.ALUNO
+
+
+class InstrumentacaoMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limite = getattr(settings, 'INSTRUMENTACAO_LIMITE_REPETICOES', 10)
+        self.server_timing = getattr(settings, 'INSTRUMENTACAO_SERVER_TIMING', False)
+
+    def __call__(self, request):
+        medidor = MedidorConsultas()
+        inicio = time.perf_counter()
+        request._inicio_view = None
+
+        with _medindo(medidor):
+            response = self.get_response(request)
+
+        if self.server_timing and pode_ver_tempos(getattr(request, 'user', None)):
+            # Numa resposta em streaming, vai só até o corpo começar a sair.
+            banco_ms, view_ms, total_ms = self._tempos(request, medidor, inicio)
+            response['Server-Timing'] = (
+                f'db;dur={banco_ms:.1f};desc="{medidor.quantidade} consultas", '
+                f'view;dur={view_ms:.1f}, '
+                f'total;dur={total_ms:.1f}'
+            )
+
+        if response.streaming and not response.is_async:
+            # As consultas de um StreamingHttpResponse (ex.: a exportação do
+            # histórico) rodam enquanto o corpo é lido: a medição e o registro
+            # acompanham a leitura até o fim.
+            response.streaming_content = self._medir_corpo(response.streaming_content, request, response, medidor, inicio)
+        else:
+            self._registrar(request, response, medidor, inicio)
+        return response
+
+    def _medir_corpo(self, conteudo, request, response, medidor, inicio):
+        try:
+            with _medindo(medidor):
+                yield from conteudo
+        finally:
+            self._registrar(request, response, medidor, inicio)
+
+    @staticmethod
+    def _tempos(request, medidor, inicio):
+        fim = time.perf_counter()
+        banco_ms = medidor.tempo * 1000
+        view_ms = (fim - request._inicio_view) * 1000 if request._inicio_view else 0.0
+        total_ms = (fim - inicio) * 1000
+        return banco_ms, view_ms, total_ms
+
+    def _registrar(self, request, response, medidor, inicio):
+        banco_ms, view_ms, total_ms = self._tempos(request, medidor, inicio)
+
+        repetidas = [(sql, n) for sql, n in medidor.formas.most_common(3) if n > 1]
+        for sql, n in repetidas:
+            if n > self.limite:
+                logger.warning(
+                    '%s %s: a mesma consulta rodou %d vezes (possível N+1): %s',
+                    request.method, request.path, n, sql[:500],
+                )
+
+        historico.adicionar(Registro(
+            momento=timezone.now(),
+            metodo=request.method,
+            caminho=request.path,
+            status=response.status_code,
+            consultas=medidor.quantidade,
+            banco_ms=banco_ms,
+            view_ms=view_ms,
+            total_ms=total_ms,
+            repetidas=repetidas,
+        ))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._inicio_view = time.perf_counter()
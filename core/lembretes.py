@@ -0,0 +1,82 @@
+"""
+Empréstimos atrasados e lembretes de devolução.
+
+`reservas_atrasadas` é a mesma consulta usada pela fila de reservas ativas
+(filtro "atrasadas") e pelo job noturno `manage.py enviar_lembretes`. Ambas
+passam pelo índice parcial (data_devolucao) WHERE status = 'Confirmado'.
+
+O job junta, por usuário, os empréstimos atrasados e os que vencem amanhã e
+manda um único aviso para cada um. Cada reserva avisada recebe
+`ultimo_lembrete_em = hoje`, então rodar de novo no mesmo dia continua de onde
+o limite parou, sem repetir ninguém.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Reserva
+from .notificacoes import Aviso, obter_notificador
+
+
+def reservas_atrasadas(hoje=None):
+    hoje = hoje or timezone.localdate()
+    return Reserva.objects.filter(
+        status=Reserva.Status.CONFIRMADO,
+        data_devolucao__lt=hoje,
+    )
+
+
+def _montar_aviso(usuario, reservas, hoje):
+    atrasadas = [r for r in reservas if r.data_devolucao < hoje]
+    amanha = [r for r in reservas if r.data_devolucao >= hoje]
+
+    linhas = [f"Olá, {usuario.get_full_name() or usuario.username}!", ""]
+    if atrasadas:
+        linhas.append("Os itens abaixo já deveriam ter sido devolvidos:")
+        linhas += [f"- {r.item.nome} ({r.item.codigo_tipo}): devolução em {r.data_devolucao:%d/%m/%Y}" for r in atrasadas]
+        linhas.append("")
+    if amanha:
+        linhas.append("Os itens abaixo devem ser devolvidos amanhã:")
+        linhas += [f"- {r.item.nome} ({r.item.codigo_tipo}): devolução em {r.data_devolucao:%d/%m/%Y}" for r in amanha]
+        linhas.append("")
+    linhas.append("Procure a gestão do CAM para fazer a devolução.")
+
+    assunto = "Devolução atrasada no TEM NO CAM" if atrasadas else "Lembrete de devolução no TEM NO CAM"
+    return Aviso(usuario=usuario, assunto=assunto, mensagem="\n".join(linhas))
+
+
+def enviar_lembretes(limite=500, hoje=None, notificador=None):
+    """
+    Envia um aviso por usuário com empréstimos atrasados ou vencendo amanhã,
+    até `limite` usuários por execução. Retorna (usuários avisados, reservas incluídas).
+    """
+    hoje = hoje or timezone.localdate()
+    notificador = notificador or obter_notificador()
+
+    candidatas = (
+        Reserva.objects
+        .filter(status=Reserva.Status.CONFIRMADO, data_devolucao__lte=hoje + timedelta(days=1))
+        .exclude(ultimo_lembrete_em=hoje)
+        .select_related('usuario', 'item')
+        .order_by('usuario_id', 'data_devolucao', 'id')
+    )
+
+    avisos = []
+    reserva_ids = []
+    for _, grupo in groupby(candidatas.iterator(chunk_size=500), key=lambda r: r.usuario_id):
+        if len(avisos) >= limite:
+            break
+        grupo = list(grupo)
+        avisos.append(_montar_aviso(grupo[0].usuario, grupo, hoje))
+        reserva_ids += [r.id for r in grupo]
+
+    if not avisos:
+        return 0, 0
+
+    with transaction.atomic():
+        notificador.enviar(avisos)
+        Reserva.objects.filter(id__in=reserva_ids).update(ultimo_lembrete_em=hoje)
+
+    return len(avisos), len(reserva_ids)
@@ -0,0 +1,91 @@
+"""
+Resolve qual arquivo de static/core/logos corresponde a cada item.
+
+O mapa nome -> arquivo é montado uma vez (no ready() do app) e só é refeito
+quando a data de modificação da pasta muda. Cada renderização do catálogo
+faz um stat() da pasta e depois apenas buscas em dicionário por item.
+"""
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.text import slugify
+
+
+# Ordem de preferência quando existe mais de um arquivo com o mesmo nome.
+EXTENSOES = ['png', 'jpg', 'jpeg', 'svg', 'webp']
+
+
+class ResolvedorLogos:
+
+    def __init__(self, pasta):
+        self.pasta = Path(pasta)
+        self._versao = None
+        self._por_nome = {}
+        self._por_prefixo = {}
+        self._lock = threading.Lock()
+
+    def _versao_atual(self):
+        try:
+            return self.pasta.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def carregar(self):
+        """
+        Refaz os mapas se a pasta mudou desde a última leitura.
+        """
+        versao = self._versao_atual()
+        if versao == self._versao:
+            return
+
+        with self._lock:
+            if versao == self._versao:
+                return
+
+            try:
+                arquivos = sorted(f.name for f in self.pasta.iterdir() if f.is_file()) if versao else []
+            except OSError:
+                arquivos = []
+
+            por_nome = {}
+            por_prefixo = {}
+            for nome in arquivos:
+                base, _, ext = nome.rpartition('.')
+                if ext in EXTENSOES:
+                    atual = por_nome.get(base)
+                    if atual is None or EXTENSOES.index(ext) < EXTENSOES.index(atual.rpartition('.')[2]):
+                        por_nome[base] = nome
+                for i in range(1, len(nome) + 1):
+                    por_prefixo.setdefault(nome[:i], nome)
+
+            self._por_nome = por_nome
+            self._por_prefixo = por_prefixo
+            self._versao = versao
+
+    def resolver(self, item, slug=None):
+        """
+        Procura, nesta ordem: "<id>.<ext>", "<slug do nome>.<ext>" e qualquer
+        arquivo que comece com o slug. Retorna o nome do arquivo ou None.
+        """
+        nome = self._por_nome.get(str(item.id))
+        if nome:
+            return nome
+
+        slug = slug if slug is not None else slugify(item.nome or '')
+        if not slug:
+            return None
+        return self._por_nome.get(slug) or self._por_prefixo.get(slug)
+
+
+resolvedor = ResolvedorLogos(Path(settings.BASE_DIR) / 'static' / 'core' / 'logos')
+
+
+def anotar_logos(itens):
+    """
+    Preenche `item.logo_filename` em cada item da lista.
+    """
+    resolvedor.carregar()
+    for item in itens:
+        item.logo_filename = resolvedor.resolver(item)
+    return itens
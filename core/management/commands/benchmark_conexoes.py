@@ -0,0 +1,92 @@
+import copy
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+from core.models import Item
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede quanto cada requisição gasta abrindo conexão com o banco, sem persistência, '
+        'com conexões persistentes (CONN_MAX_AGE) e com pool (Postgres + psycopg 3). '
+        'Simula o ciclo de conexões de uma requisição (sinais request_started/request_finished) '
+        'em volta de uma consulta pequena; só lê do banco configurado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições simuladas por modo (padrão: 200)')
+        parser.add_argument('--max-age', type=int, default=60, help='CONN_MAX_AGE do modo persistente (padrão: 60)')
+
+    def handle(self, *args, **options):
+        if options['requisicoes'] < 2:
+            raise CommandError('Use pelo menos 2 requisições.')
+
+        original = copy.deepcopy(connection.settings_dict)
+        sem_pool = {k: v for k, v in original['OPTIONS'].items() if k != 'pool'}
+
+        modos = [
+            ('sem persistência', {'CONN_MAX_AGE': 0, 'OPTIONS': sem_pool}),
+            (f'persistente ({options["max_age"]}s)', {'CONN_MAX_AGE': options['max_age'], 'OPTIONS': sem_pool}),
+        ]
+        if connection.vendor == 'postgresql':
+            pool = original['OPTIONS'].get('pool') or True
+            modos.append(('pool', {'CONN_MAX_AGE': 0, 'OPTIONS': {**sem_pool, 'pool': pool}}))
+        else:
+            self.stdout.write(self.style.WARNING(f'Banco {connection.vendor}: pool só existe no Postgres, modo ignorado.'))
+
+        self.stdout.write(
+            f'{"modo":24} {"p50 (ms)":>9} {"p95 (ms)":>9} {"conexão/req. (ms)":>18} {"conexões abertas":>17}'
+        )
+        try:
+            for nome, ajustes in modos:
+                self._configurar(original, ajustes)
+                resultado = self._medir(options['requisicoes'])
+                self.stdout.write(
+                    f'{nome:24} {resultado["p50_ms"]:9.2f} {resultado["p95_ms"]:9.2f} '
+                    f'{resultado["conexao_ms"]:18.3f} {resultado["conexoes"]:17}'
+                )
+        finally:
+            self._configurar(original, {})
+
+    def _configurar(self, original, ajustes):
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+        connection.settings_dict.clear()
+        connection.settings_dict.update(copy.deepcopy(original), **ajustes)
+
+    def _medir(self, requisicoes):
+        """
+        Tempo de cada requisição simulada e o gasto dentro de connection.connect()
+        (abrir a conexão, ou pegá-la do pool, e configurá-la).
+        """
+        conectar = connection.connect
+        gasto = []
+
+        def connect_medido():
+            inicio = time.perf_counter()
+            conectar()
+            gasto.append(time.perf_counter() - inicio)
+
+        connection.connect = connect_medido
+        tempos = []
+        try:
+            for _ in range(requisicoes):
+                inicio = time.perf_counter()
+                request_started.send(sender=self.__class__)
+                list(Item.objects.order_by('pk').values_list('pk', flat=True)[:1])
+                request_finished.send(sender=self.__class__)
+                tempos.append(time.perf_counter() - inicio)
+        finally:
+            del connection.connect
+
+        return {
+            'p50_ms': statistics.median(tempos) * 1000,
+            'p95_ms': statistics.quantiles(tempos, n=20)[18] * 1000,
+            'conexao_ms': sum(gasto) / requisicoes * 1000,
+            'conexoes': len(gasto),
+        }
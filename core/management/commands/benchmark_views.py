@@ -0,0 +1,143 @@
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from core.dados_sinteticos import Gerador
+from core.models import Usuario
+
+
+# (nome no relatório, nome da url, parâmetros GET)
+VIEWS = [
+    ('lista_itens', 'core:lista_itens', {}),
+    ('reservas_pendentes', 'core:reservas_pendentes', {}),
+    ('reservas_pendentes_busca', 'core:reservas_pendentes', {'q': 'silva'}),
+    ('reservas_ativas', 'core:reservas_ativas', {}),
+    ('reservas_ativas_atrasadas', 'core:reservas_ativas', {'atrasadas': '1'}),
+    ('historico_reservas', 'core:historico_reservas', {}),
+    ('historico_reservas_completo', 'core:historico_reservas_completo', {}),
+    ('historico_reservas_completo_status', 'core:historico_reservas_completo', {'status': 'Concluida'}),
+    ('lista_usuarios', 'core:lista_usuarios', {}),
+    ('api_estatisticas', 'core:api_estatisticas', {}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o tempo das principais views (p50/p95, consultas e bytes) com bancos de vários tamanhos. '
+        'Roda num banco de teste descartável e grava um relatório JSON para comparar entre commits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reservas', type=int, nargs='+', default=[10_000],
+            help='Quantidades de reservas a testar (ex.: --reservas 10000 100000 1000000)',
+        )
+        parser.add_argument('--repeticoes', type=int, default=20, help='Requisições medidas por view (padrão: 20)')
+        parser.add_argument('--semente', type=int, default=0, help='Semente dos dados gerados')
+        parser.add_argument('--saida', default='benchmark_views.json', help='Arquivo do relatório JSON')
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 2:
+            raise CommandError('Use pelo menos 2 repetições.')
+
+        # Em SQLite o banco de teste padrão fica em memória; um arquivo se
+        # parece mais com produção (cache de páginas, fsync).
+        arquivo_temporario = None
+        if connection.vendor == 'sqlite':
+            arquivo_temporario = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False).name
+            connection.settings_dict['TEST']['NAME'] = arquivo_temporario
+
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        bancos = runner.setup_databases()
+        try:
+            relatorio = {
+                'banco': connection.vendor,
+                'repeticoes': options['repeticoes'],
+                'semente': options['semente'],
+                'tamanhos': {},
+            }
+            for total in options['reservas']:
+                call_command('flush', interactive=False, verbosity=0)
+                self.stdout.write(f'Gerando {total} reservas...')
+                inicio = time.perf_counter()
+                dados = self._semear(total, options['semente'])
+                self.stdout.write(f'  pronto em {time.perf_counter() - inicio:.1f}s')
+
+                relatorio['tamanhos'][str(total)] = {
+                    'dados': dados,
+                    'views': self._medir(options['repeticoes']),
+                }
+        finally:
+            runner.teardown_databases(bancos)
+            teardown_test_environment()
+            if arquivo_temporario and os.path.exists(arquivo_temporario):
+                os.remove(arquivo_temporario)
+
+        with open(options['saida'], 'w', encoding='utf-8') as saida:
+            json.dump(relatorio, saida, indent=2, sort_keys=True, ensure_ascii=False)
+            saida.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'✅ Relatório gravado em {options["saida"]}'))
+
+    def _semear(self, total_reservas, semente):
+        """
+        Massa de core.dados_sinteticos com usuários, itens e exemplares
+        proporcionais ao número de reservas.
+        """
+        return Gerador(semente=semente).gerar(
+            usuarios=max(100, total_reservas // 200),
+            itens=max(20, min(300, total_reservas // 3000)),
+            exemplares=max(200, total_reservas // 30),
+            reservas=total_reservas,
+        )
+
+    def _medir(self, repeticoes):
+        cliente = Client()
+        cliente.force_login(Usuario.objects.filter(tipo_acesso=Usuario.TiposAcesso.DIRETORIA).first())
+
+        resultados = {}
+        for nome, url, parametros in VIEWS:
+            cache.clear()
+            caminho = reverse(url)
+
+            # A primeira requisição vai sem cache (contagens, estatísticas).
+            inicio = time.perf_counter()
+            resposta = cliente.get(caminho, parametros)
+            primeira = time.perf_counter() - inicio
+            if resposta.status_code != 200:
+                raise CommandError(f'{nome}: status {resposta.status_code}')
+
+            tempos = []
+            for _ in range(repeticoes):
+                with CaptureQueriesContext(connection) as consultas:
+                    inicio = time.perf_counter()
+                    resposta = cliente.get(caminho, parametros)
+                    corpo = b''.join(resposta) if resposta.streaming else resposta.content
+                    tempos.append(time.perf_counter() - inicio)
+
+            resultados[nome] = {
+                'url': caminho,
+                'parametros': parametros,
+                'primeira_ms': round(primeira * 1000, 2),
+                'p50_ms': round(statistics.median(tempos) * 1000, 2),
+                'p95_ms': round(statistics.quantiles(tempos, n=20)[18] * 1000, 2),
+                'consultas': len(consultas),
+                'bytes': len(corpo),
+            }
+            self.stdout.write(
+                f'  {nome:38} p50 {resultados[nome]["p50_ms"]:8.2f} ms  '
+                f'p95 {resultados[nome]["p95_ms"]:8.2f} ms  '
+                f'{len(consultas):3} consultas  {len(corpo):8} bytes'
+            )
+        return resultados
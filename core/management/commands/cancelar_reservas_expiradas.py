@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from core.cancelamentos import cancelar_expiradas, reservas_expiradas
+
+
+class Command(BaseCommand):
+    help = (
+        'Cancela reservas pendentes cujo prazo de retirada já passou. '
+        'Feito para rodar periodicamente (ex.: cron a cada 15 minutos).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Só mostra quantas seriam canceladas')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            total = reservas_expiradas().count()
+            self.stdout.write(f'{total} reservas pendentes seriam canceladas')
+            return
+
+        total = cancelar_expiradas()
+        self.stdout.write(self.style.SUCCESS(f'✅ {total} reservas pendentes canceladas por prazo vencido'))
@@ -1,39 +1,56 @@
-from django.core.management.base import BaseCommand
-from core.models import Exemplar, Reserva
+from django.core.management.base import BaseCommand, CommandError
+
+from core.consistencia import CorrecaoEmAndamento, corrigir
+from core.models import Exemplar
+
+
+DESCRICOES = {
+    'reservas_duplicadas': 'reservas confirmadas no mesmo exemplar que outra mais recente (→ Concluída)',
+    'confirmadas_com_exemplar_disponivel': 'exemplares DISPONIVEL com reserva confirmada (→ Reservado)',
+    'reservados_sem_reserva_ativa': 'exemplares RESERVADO sem reserva ativa (→ Disponível)',
+}
+
+# Quantos exemplares/reservas listar por tipo.
+AMOSTRA = 20
 
 
 class Command(BaseCommand):
-    help = 'Corrige exemplares com situação incorreta (RESERVADO sem reserva ativa)'
+    help = (
+        'Corrige divergências entre exemplares e reservas (ver core.consistencia), '
+        'um UPDATE por tipo numa única transação. Pode rodar com o site no ar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Só mostra o que seria corrigido, sem gravar nada')
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS('\n=== CORRIGINDO EXEMPLARES ===\n'))
-
-        # Encontrar exemplares marcados como RESERVADO mas sem reserva ativa
-        exemplares_incorretos = Exemplar.objects.filter(
-            situacao=Exemplar.Situacao.RESERVADO
-        ).exclude(
-            reservas__status=Reserva.Status.CONFIRMADO
-        ).distinct()
-
-        if exemplares_incorretos.exists():
-            self.stdout.write(self.style.WARNING(
-                f'Encontrados {exemplares_incorretos.count()} exemplares para corrigir:\n'
-            ))
-            
-            for exemplar in exemplares_incorretos:
-                old_situacao = exemplar.get_situacao_display()
-                exemplar.situacao = Exemplar.Situacao.DISPONIVEL
-                exemplar.save()
-                
-                self.stdout.write(
-                    f'✅ {exemplar.codigo_exemplar} ({exemplar.item.nome}): '
-                    f'{old_situacao} → {exemplar.get_situacao_display()}'
-                )
-            
-            self.stdout.write(self.style.SUCCESS(
-                f'\n✅ {exemplares_incorretos.count()} exemplares corrigidos com sucesso!\n'
-            ))
+        simular = options['dry_run']
+        self.stdout.write(self.style.SUCCESS(
+            '\n=== CORRIGINDO EXEMPLARES ===\n' if not simular else '\n=== CORRIGINDO EXEMPLARES (simulação) ===\n'
+        ))
+
+        try:
+            encontrados = corrigir(simular=simular)
+        except CorrecaoEmAndamento as erro:
+            raise CommandError(str(erro))
+
+        for tipo, ids in encontrados.items():
+            if not ids:
+                self.stdout.write(self.style.SUCCESS(f'✅ Nenhum caso: {DESCRICOES[tipo]}'))
+                continue
+
+            self.stdout.write(self.style.WARNING(f'⚠️  {len(ids)} {DESCRICOES[tipo]}'))
+            if tipo == 'reservas_duplicadas':
+                amostra = [f'Reserva #{pk}' for pk in ids[:AMOSTRA]]
+            else:
+                amostra = Exemplar.objects.filter(pk__in=ids[:AMOSTRA]).order_by('pk').values_list('codigo_exemplar', flat=True)
+            for linha in amostra:
+                self.stdout.write(f'   - {linha}')
+            if len(ids) > AMOSTRA:
+                self.stdout.write(f'   ... e mais {len(ids) - AMOSTRA}')
+
+        total = sum(len(ids) for ids in encontrados.values())
+        if simular:
+            self.stdout.write(self.style.SUCCESS(f'\n{total} correções seriam feitas (nada foi gravado).\n'))
         else:
-            self.stdout.write(self.style.SUCCESS(
-                '✅ Nenhum exemplar incorreto encontrado\n'
-            ))
+            self.stdout.write(self.style.SUCCESS(f'\n✅ {total} correções feitas.\n'))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from core.emails import enviar_pendentes
+
+
+class Command(BaseCommand):
+    help = 'Envia os e-mails pendentes da fila de saída, em lotes, por uma única conexão SMTP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50, help='E-mails por lote (padrão: 50)')
+        parser.add_argument('--continuo', action='store_true', help='Não termina: fica verificando a fila')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos entre verificações no modo contínuo')
+
+    def handle(self, *args, **options):
+        if not options['continuo']:
+            self._esvaziar(options['lote'], sempre_relatar=True)
+            return
+
+        while True:
+            # Conexões vencidas (CONN_MAX_AGE) ou derrubadas pelo banco são
+            # refeitas aqui; fora de uma requisição ninguém mais faz isso.
+            close_old_connections()
+            try:
+                self._esvaziar(options['lote'])
+            except Exception as erro:
+                # Um erro (banco fora do ar, etc.) não pode parar o envio.
+                self.stderr.write(f'❌ Erro ao enviar a fila: {type(erro).__name__}: {erro}')
+                connections.close_all()
+            time.sleep(options['intervalo'])
+
+    def _esvaziar(self, lote, sempre_relatar=False):
+        total_enviados = total_falhas = 0
+        while True:
+            enviados, falhas = enviar_pendentes(lote)
+            total_enviados += enviados
+            total_falhas += falhas
+            if enviados + falhas < lote:
+                break
+
+        if total_enviados or total_falhas or sempre_relatar:
+            self.stdout.write(
+                f'✅ {total_enviados} e-mails enviados'
+                + (f', ⚠️  {total_falhas} falharam (serão tentados de novo)' if total_falhas else '')
+            )
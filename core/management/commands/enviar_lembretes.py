@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from core.lembretes import enviar_lembretes
+
+
+class Command(BaseCommand):
+    help = (
+        'Avisa os usuários com empréstimos atrasados ou que vencem amanhã (um aviso por usuário). '
+        'Feito para rodar uma vez por noite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, default=500, help='Máximo de usuários avisados nesta execução')
+
+    def handle(self, *args, **options):
+        usuarios, reservas = enviar_lembretes(limite=options['limite'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {usuarios} usuários avisados ({reservas} empréstimos)'
+        ))
@@ -0,0 +1,53 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.dados_sinteticos import Gerador, limpar, tem_dados
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera uma massa de dados sintética (usuários, itens, exemplares e reservas) para testes de carga. '
+        'A mesma semente gera sempre os mesmos dados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=5000, help='Quantidade de usuários (padrão: 5000)')
+        parser.add_argument('--itens', type=int, default=300, help='Quantidade de itens (padrão: 300)')
+        parser.add_argument('--exemplares', type=int, default=30000, help='Quantidade de exemplares (padrão: 30000)')
+        parser.add_argument('--reservas', type=int, default=1_000_000, help='Quantidade de reservas (padrão: 1000000)')
+        parser.add_argument('--dias', type=int, default=730, help='Dias de histórico até hoje (padrão: 730)')
+        parser.add_argument('--semente', type=int, default=0, help='Semente do gerador (padrão: 0)')
+        parser.add_argument('--hoje', type=date.fromisoformat, help='Data usada como "hoje" (AAAA-MM-DD); fixe para repetir a mesma massa')
+        parser.add_argument('--senha', default='tem-no-cam', help='Senha de todos os usuários gerados')
+        parser.add_argument('--limpar', action='store_true', help='Apaga os dados atuais (menos superusuários) antes de gerar')
+
+    def handle(self, *args, **options):
+        if options['usuarios'] < 3 or options['itens'] < 1:
+            raise CommandError('Gere pelo menos 3 usuários e 1 item.')
+
+        if options['limpar']:
+            limpar()
+        elif tem_dados():
+            raise CommandError('O banco já tem usuários, itens ou reservas. Use --limpar para apagá-los antes.')
+
+        inicio = time.perf_counter()
+        gerador = Gerador(
+            semente=options['semente'],
+            hoje=options['hoje'],
+            dias=options['dias'],
+            senha=options['senha'],
+            progresso=lambda mensagem: self.stdout.write(f'  {time.perf_counter() - inicio:6.1f}s  {mensagem}'),
+        )
+        totais = gerador.gerar(
+            usuarios=options['usuarios'],
+            itens=options['itens'],
+            exemplares=options['exemplares'],
+            reservas=options['reservas'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {totais["usuarios"]} usuários, {totais["itens"]} itens, {totais["exemplares"]} exemplares '
+            f'e {totais["reservas"]} reservas em {time.perf_counter() - inicio:.1f}s'
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core.miniaturas import atualizar
+from core.models import Item
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera as miniaturas (80px e 160px) das imagens dos itens que ainda não têm. '
+        'Itens novos já ganham miniaturas ao salvar a imagem.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Refaz também as miniaturas que já existem')
+        parser.add_argument('--item', type=int, action='append', help='ID do item (pode repetir). Padrão: todos.')
+
+    def handle(self, *args, **options):
+        itens = Item.objects.exclude(imagem='').exclude(imagem__isnull=True)
+        if not options['todas']:
+            itens = itens.filter(miniatura__isnull=True) | itens.filter(miniatura='')
+        if options['item']:
+            itens = itens.filter(pk__in=options['item'])
+
+        geradas = falhas = 0
+        for item in itens.only('id', 'imagem', 'miniatura', 'miniatura_2x').order_by('id').iterator():
+            if atualizar(item):
+                geradas += 1
+            else:
+                self.stdout.write(self.style.WARNING(f'⚠️  Não foi possível ler {item.imagem.name} (item {item.id})'))
+                falhas += 1
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Miniaturas geradas para {geradas} itens ({falhas} falhas)'))
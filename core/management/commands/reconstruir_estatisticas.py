@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.estatisticas import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula as tabelas de estatísticas (reservas por item/dia e item/mês) a partir das reservas'
+
+    def handle(self, *args, **options):
+        linhas = reconstruir()
+        self.stdout.write(self.style.SUCCESS(f'✅ Estatísticas recalculadas ({linhas} combinações item/dia)'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.disponibilidade import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula a ocupação diária dos itens a partir das reservas ativas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--item', type=int, action='append', help='ID do item (pode repetir). Padrão: todos.')
+
+    def handle(self, *args, **options):
+        dias = reconstruir(options['item'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Ocupação recalculada ({dias} dias com reservas ativas)'))
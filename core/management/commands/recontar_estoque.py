@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.estoque import recontar
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os contadores de exemplares (total, disponíveis, reservados, em manutenção) de cada item'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--item', type=int, action='append', help='ID do item (pode repetir). Padrão: todos.')
+
+    def handle(self, *args, **options):
+        total = recontar(options['item'])
+        self.stdout.write(self.style.SUCCESS(f'✅ Contadores recalculados para {total} itens'))
@@ -1,49 +1,147 @@
+import json
+
 from django.core.management.base import BaseCommand
+from django.db.models import Count, Exists, OuterRef, Prefetch, Q
+
 from core.models import Exemplar, Reserva
-from django.db.models import Q
+
+
+# Linhas buscadas por vez nas listagens (iterator), para não carregar o estoque inteiro.
+LOTE = 2000
 
 
 class Command(BaseCommand):
-    help = 'Verifica exemplares com situação possivelmente incorreta no banco'
+    help = (
+        'Verifica exemplares com situação possivelmente incorreta no banco. '
+        'Com --format json, serve de verificação periódica (ex.: cron ou monitoramento).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--item', type=int, action='append', help='ID do item (pode repetir). Padrão: todos.')
+        parser.add_argument('--format', choices=('texto', 'json'), default='texto', help='Formato da saída (padrão: texto)')
 
     def handle(self, *args, **options):
+        exemplares = Exemplar.objects.all()
+        reservas_ativas = Reserva.objects.filter(status=Reserva.Status.CONFIRMADO)
+        if options['item']:
+            exemplares = exemplares.filter(item_id__in=options['item'])
+            reservas_ativas = reservas_ativas.filter(item_id__in=options['item'])
+
+        emprestado = Exists(Reserva.objects.filter(exemplar=OuterRef('pk'), status=Reserva.Status.CONFIRMADO))
+        reservado_sem_reserva = Q(situacao=Exemplar.Situacao.RESERVADO) & ~emprestado
+
+        resumo = self._resumo(exemplares, reservado_sem_reserva)
+        resumo['reservas_ativas'] = reservas_ativas.count()
+
+        sem_reserva = (exemplares
+                       .filter(reservado_sem_reserva)
+                       .select_related('item')
+                       .only('codigo_exemplar', 'item__nome')
+                       .prefetch_related(Prefetch(
+                           'reservas',
+                           queryset=Reserva.objects.only('id', 'status', 'exemplar_id').order_by('id'),
+                       ))
+                       .order_by('codigo_exemplar'))
+        em_manutencao = (exemplares
+                         .filter(situacao=Exemplar.Situacao.EM_MANUTENCAO)
+                         .select_related('item')
+                         .only('codigo_exemplar', 'condicao', 'item__nome')
+                         .order_by('codigo_exemplar'))
+        ativas = (reservas_ativas
+                  .select_related('usuario', 'item', 'exemplar')
+                  .only('id', 'usuario__nusp', 'item__codigo_tipo', 'exemplar__codigo_exemplar')
+                  .order_by('id'))
+
+        if options['format'] == 'json':
+            self._json(resumo, sem_reserva, em_manutencao, ativas)
+        else:
+            self._texto(resumo, sem_reserva, em_manutencao, ativas)
+
+    def _resumo(self, exemplares, reservado_sem_reserva):
+        """
+        Todas as contagens de exemplares numa única consulta agrupada por situação.
+        """
+        resumo = {
+            'total': 0,
+            'disponiveis': 0,
+            'reservados': 0,
+            'em_manutencao': 0,
+            'reservados_sem_reserva_ativa': 0,
+        }
+        campos = {
+            Exemplar.Situacao.DISPONIVEL: 'disponiveis',
+            Exemplar.Situacao.RESERVADO: 'reservados',
+            Exemplar.Situacao.EM_MANUTENCAO: 'em_manutencao',
+        }
+        grupos = (exemplares
+                  .order_by()
+                  .values('situacao')
+                  .annotate(n=Count('id'), sem_reserva=Count('id', filter=reservado_sem_reserva)))
+        for grupo in grupos:
+            resumo['total'] += grupo['n']
+            if grupo['situacao'] in campos:
+                resumo[campos[grupo['situacao']]] = grupo['n']
+            resumo['reservados_sem_reserva_ativa'] += grupo['sem_reserva']
+        return resumo
+
+    def _json(self, resumo, sem_reserva, em_manutencao, ativas):
+        relatorio = {
+            'resumo': resumo,
+            'reservados_sem_reserva_ativa': [
+                {
+                    'codigo_exemplar': exemplar.codigo_exemplar,
+                    'item': exemplar.item.nome,
+                    'reservas': [{'id': r.id, 'status': r.status} for r in exemplar.reservas.all()],
+                }
+                for exemplar in sem_reserva.iterator(chunk_size=LOTE)
+            ] if resumo['reservados_sem_reserva_ativa'] else [],
+            'em_manutencao': [
+                {
+                    'codigo_exemplar': exemplar.codigo_exemplar,
+                    'item': exemplar.item.nome,
+                    'condicao': exemplar.condicao,
+                }
+                for exemplar in em_manutencao.iterator(chunk_size=LOTE)
+            ] if resumo['em_manutencao'] else [],
+            'reservas_ativas': [
+                {
+                    'id': r.id,
+                    'nusp': r.usuario.nusp,
+                    'item': r.item.codigo_tipo,
+                    'exemplar': r.exemplar.codigo_exemplar if r.exemplar else None,
+                }
+                for r in ativas.iterator(chunk_size=LOTE)
+            ] if resumo['reservas_ativas'] else [],
+        }
+        self.stdout.write(json.dumps(relatorio, indent=2, ensure_ascii=False))
+
+    def _texto(self, resumo, sem_reserva, em_manutencao, ativas):
         self.stdout.write(self.style.SUCCESS('\n=== VERIFICAÇÃO DE EXEMPLARES ===\n'))
 
         # 1. Exemplares marcados como RESERVADO mas sem reserva ativa
-        exemplares_reservado_sem_reserva = Exemplar.objects.filter(
-            situacao=Exemplar.Situacao.RESERVADO
-        ).exclude(
-            reservas__status=Reserva.Status.CONFIRMADO
-        ).distinct()
-
-        if exemplares_reservado_sem_reserva.exists():
+        if resumo['reservados_sem_reserva_ativa']:
             self.stdout.write(self.style.WARNING(
-                f'\n⚠️  {exemplares_reservado_sem_reserva.count()} EXEMPLARES marcados como RESERVADO mas SEM reserva ativa:\n'
+                f'\n⚠️  {resumo["reservados_sem_reserva_ativa"]} EXEMPLARES marcados como RESERVADO mas SEM reserva ativa:\n'
             ))
-            for exemplar in exemplares_reservado_sem_reserva:
+            for exemplar in sem_reserva.iterator(chunk_size=LOTE):
                 self.stdout.write(f'   - {exemplar.codigo_exemplar} ({exemplar.item.nome})')
-                # Mostrar reservas relacionadas
                 reservas = exemplar.reservas.all()
-                if reservas.exists():
+                if reservas:
                     for r in reservas:
                         self.stdout.write(f'     Reserva #{r.id}: {r.get_status_display()}')
                 else:
-                    self.stdout.write(f'     Nenhuma reserva vinculada')
+                    self.stdout.write('     Nenhuma reserva vinculada')
         else:
             self.stdout.write(self.style.SUCCESS(
                 '✅ Nenhum exemplar RESERVADO sem reserva ativa encontrado'
             ))
 
         # 2. Exemplares em EM_MANUTENCAO
-        em_manutencao = Exemplar.objects.filter(
-            situacao=Exemplar.Situacao.EM_MANUTENCAO
-        )
-        
-        if em_manutencao.exists():
+        if resumo['em_manutencao']:
             self.stdout.write(self.style.WARNING(
-                f'\n⚠️  {em_manutencao.count()} EXEMPLARES em manutenção:\n'
+                f'\n⚠️  {resumo["em_manutencao"]} EXEMPLARES em manutenção:\n'
             ))
-            for exemplar in em_manutencao:
+            for exemplar in em_manutencao.iterator(chunk_size=LOTE):
                 self.stdout.write(f'   - {exemplar.codigo_exemplar} ({exemplar.item.nome}) - Condição: {exemplar.get_condicao_display()}')
         else:
             self.stdout.write(self.style.SUCCESS(
@@ -51,29 +149,20 @@ class Command(BaseCommand):
             ))
 
         # 3. Resumo geral
-        total = Exemplar.objects.count()
-        disponiveis = Exemplar.objects.filter(situacao=Exemplar.Situacao.DISPONIVEL).count()
-        reservados = Exemplar.objects.filter(situacao=Exemplar.Situacao.RESERVADO).count()
-        manutencao = Exemplar.objects.filter(situacao=Exemplar.Situacao.EM_MANUTENCAO).count()
-
         self.stdout.write(self.style.SUCCESS(
             f'\n=== RESUMO ===\n'
-            f'Total de exemplares: {total}\n'
-            f'✅ Disponíveis: {disponiveis}\n'
-            f'🔒 Reservados: {reservados}\n'
-            f'🔧 Em manutenção: {manutencao}\n'
+            f'Total de exemplares: {resumo["total"]}\n'
+            f'✅ Disponíveis: {resumo["disponiveis"]}\n'
+            f'🔒 Reservados: {resumo["reservados"]}\n'
+            f'🔧 Em manutenção: {resumo["em_manutencao"]}\n'
         ))
 
         # 4. Reservas ativas
-        reservas_ativas = Reserva.objects.filter(
-            status=Reserva.Status.CONFIRMADO
-        )
-        
-        if reservas_ativas.exists():
+        if resumo['reservas_ativas']:
             self.stdout.write(self.style.WARNING(
-                f'\n⚠️  {reservas_ativas.count()} RESERVAS ATIVAS encontradas:\n'
+                f'\n⚠️  {resumo["reservas_ativas"]} RESERVAS ATIVAS encontradas:\n'
             ))
-            for r in reservas_ativas:
+            for r in ativas.iterator(chunk_size=LOTE):
                 self.stdout.write(f'   Reserva #{r.id}: {r.usuario.nusp} - {r.item.codigo_tipo}')
                 self.stdout.write(f'   Exemplar: {r.exemplar.codigo_exemplar if r.exemplar else "Nenhum"}')
         else:
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:01
+
+from collections import Counter
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_ocupacao(apps, schema_editor):
+    Reserva = apps.get_model('core', 'Reserva')
+    OcupacaoDiaria = apps.get_model('core', 'OcupacaoDiaria')
+
+    contagem = Counter()
+    ativas = Reserva.objects.filter(status__in=['Pendente', 'Confirmado'])
+    for item_id, inicio, fim in ativas.values_list('item_id', 'data_retirada', 'data_devolucao').iterator():
+        for i in range((fim - inicio).days + 1):
+            contagem[(item_id, inicio + timedelta(days=i))] += 1
+
+    OcupacaoDiaria.objects.bulk_create(
+        [
+            OcupacaoDiaria(item_id=item_id, dia=dia, quantidade=quantidade)
+            for (item_id, dia), quantidade in contagem.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_reserva_usuario_cancelou'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacaoDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(verbose_name='Dia')),
+                ('quantidade', models.PositiveIntegerField(default=0, verbose_name='Reservas no dia')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ocupacoes', to='core.item', verbose_name='Tipo de item')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('item', 'dia'), name='ocupacao_item_dia_unica')],
+            },
+        ),
+        migrations.RunPython(preencher_ocupacao, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def contar_retiradas(apps, schema_editor):
+    Exemplar = apps.get_model('core', 'Exemplar')
+    Reserva = apps.get_model('core', 'Reserva')
+
+    retiradas = (
+        Reserva.objects
+        .filter(exemplar=OuterRef('pk'))
+        .values('exemplar')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    Exemplar.objects.update(vezes_retirado=Coalesce(Subquery(retiradas), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_ocupacaodiaria'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exemplar',
+            name='vezes_retirado',
+            field=models.PositiveIntegerField(default=0, help_text='Usado para entregar primeiro os exemplares menos usados.', verbose_name='Vezes retirado'),
+        ),
+        migrations.RunPython(contar_retiradas, migrations.RunPython.noop),
+    ]
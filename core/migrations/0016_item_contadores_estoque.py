@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def recontar_estoque(apps, schema_editor):
+    Item = apps.get_model('core', 'Item')
+    Exemplar = apps.get_model('core', 'Exemplar')
+
+    def contagem(**filtros):
+        return Coalesce(Subquery(
+            Exemplar.objects
+            .filter(item=OuterRef('pk'), **filtros)
+            .values('item')
+            .annotate(total=Count('id'))
+            .values('total')
+        ), 0)
+
+    Item.objects.update(
+        total_exemplares=contagem(),
+        disponiveis=contagem(situacao='Disponivel'),
+        reservados=contagem(situacao='Reservado'),
+        em_manutencao=contagem(situacao='Em manutencao'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_exemplar_vezes_retirado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='disponiveis',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Exemplares disponíveis'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='em_manutencao',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Exemplares em manutenção'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='reservados',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Exemplares reservados'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='total_exemplares',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Total de exemplares'),
+        ),
+        migrations.RunPython(recontar_estoque, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:04
+
+import sqlite3
+import unicodedata
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+
+def _normalizar(texto):
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def preencher_documentos(apps, schema_editor):
+    Reserva = apps.get_model('core', 'Reserva')
+
+    lote = []
+    for reserva in Reserva.objects.select_related('usuario', 'item').iterator(chunk_size=1000):
+        u, i = reserva.usuario, reserva.item
+        partes = [u.nusp, u.username, u.email, u.first_name, u.last_name, i.codigo_tipo, i.nome]
+        reserva.documento_busca = _normalizar(' '.join(p for p in partes if p))
+        lote.append(reserva)
+        if len(lote) >= 1000:
+            Reserva.objects.bulk_update(lote, ['documento_busca'])
+            lote = []
+    Reserva.objects.bulk_update(lote, ['documento_busca'])
+
+
+def criar_indice_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS core_reserva_documento_busca_trgm '
+            'ON core_reserva USING gin (documento_busca gin_trgm_ops)'
+        )
+    elif vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 34):
+        # Sem FTS5/trigram no SQLite local, core.busca usa LIKE na coluna.
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE core_reserva_busca USING fts5(documento, tokenize='trigram')"
+            )
+        except OperationalError:
+            return
+        schema_editor.execute(
+            'INSERT INTO core_reserva_busca (rowid, documento) '
+            'SELECT id, documento_busca FROM core_reserva'
+        )
+
+
+def remover_indice_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS core_reserva_documento_busca_trgm')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS core_reserva_busca')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_item_contadores_estoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='documento_busca',
+            field=models.TextField(blank=True, editable=False, help_text='Dados do usuário e do item sem acentos, usados pela busca da gestão (ver core.busca).', verbose_name='Texto de busca'),
+        ),
+        migrations.RunPython(preencher_documentos, migrations.RunPython.noop),
+        migrations.RunPython(criar_indice_busca, remover_indice_busca),
+    ]
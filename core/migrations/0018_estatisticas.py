@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:06
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def preencher_estatisticas(apps, schema_editor):
+    Reserva = apps.get_model('core', 'Reserva')
+    EstatisticaDiaria = apps.get_model('core', 'EstatisticaDiaria')
+    EstatisticaMensal = apps.get_model('core', 'EstatisticaMensal')
+
+    por_dia = (
+        Reserva.objects
+        .annotate(dia=TruncDate('data_reserva'))
+        .values_list('item_id', 'dia')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+
+    diarias = []
+    mensais = Counter()
+    for item_id, dia, total in por_dia:
+        diarias.append(EstatisticaDiaria(item_id=item_id, dia=dia, total=total))
+        mensais[(item_id, dia.replace(day=1))] += total
+
+    EstatisticaDiaria.objects.bulk_create(diarias, batch_size=1000)
+    EstatisticaMensal.objects.bulk_create(
+        [EstatisticaMensal(item_id=item_id, mes=mes, total=total) for (item_id, mes), total in mensais.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_reserva_documento_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(verbose_name='Dia')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Reservas')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estatisticas_diarias', to='core.item', verbose_name='Tipo de item')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('item', 'dia'), name='estatistica_item_dia_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EstatisticaMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Reservas')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estatisticas_mensais', to='core.item', verbose_name='Tipo de item')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('item', 'mes'), name='estatistica_item_mes_unica')],
+            },
+        ),
+        migrations.RunPython(preencher_estatisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_estatisticas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoDados',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=50, unique=True, verbose_name='Chave')),
+                ('versao', models.PositiveBigIntegerField(default=0, verbose_name='Versão')),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:07
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def preencher_contagens(apps, schema_editor):
+    Reserva = apps.get_model('core', 'Reserva')
+    ContagemUsuarioItem = apps.get_model('core', 'ContagemUsuarioItem')
+
+    contagens = Counter()
+    por_usuario = Reserva.objects.values_list('usuario_id', 'item_id').annotate(total=Count('id')).order_by()
+    for usuario_id, item_id, total in por_usuario:
+        contagens[(usuario_id, item_id)] += total
+        contagens[(usuario_id, None)] += total
+
+    ContagemUsuarioItem.objects.bulk_create(
+        [
+            ContagemUsuarioItem(usuario_id=usuario_id, item_id=item_id, total=total)
+            for (usuario_id, item_id), total in contagens.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_versaodados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContagemUsuarioItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Reservas')),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='contagens_usuarios', to='core.item', verbose_name='Tipo de item')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contagens_reservas', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', '-total'], name='contagem_ranking_idx')],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'item'), name='contagem_usuario_item_unica'), models.UniqueConstraint(condition=models.Q(('item__isnull', True)), fields=('usuario',), name='contagem_usuario_total_unica')],
+            },
+        ),
+        migrations.RunPython(preencher_contagens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_contagemusuarioitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailPendente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destinatario', models.EmailField(max_length=254, verbose_name='Destinatário')),
+                ('assunto', models.CharField(max_length=255, verbose_name='Assunto')),
+                ('mensagem', models.TextField(verbose_name='Mensagem')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('enviado_em', models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')),
+                ('tentativas', models.PositiveSmallIntegerField(default=0, verbose_name='Tentativas de envio')),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('ultimo_erro', models.TextField(blank=True, verbose_name='Último erro')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('enviado_em__isnull', True)), fields=['proxima_tentativa'], name='email_pendente_fila_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:09
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def preencher_prazos(apps, schema_editor):
+    Reserva = apps.get_model('core', 'Reserva')
+    horas = getattr(settings, 'RESERVA_PRAZO_RETIRADA_HORAS', 24)
+
+    pendentes = list(Reserva.objects.filter(status='Pendente').only('id', 'data_retirada'))
+    for reserva in pendentes:
+        inicio = timezone.make_aware(datetime.combine(reserva.data_retirada, time.min))
+        reserva.expira_em = inicio + timedelta(hours=horas)
+    Reserva.objects.bulk_update(pendentes, ['expira_em'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_emailpendente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='expira_em',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Depois disso, a reserva pendente é cancelada por `manage.py cancelar_reservas_expiradas`.', null=True, verbose_name='Prazo para retirada'),
+        ),
+        migrations.RunPython(preencher_prazos, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(condition=models.Q(('status', 'Pendente')), fields=['expira_em'], name='reserva_pendente_expira_idx'),
+        ),
+    ]
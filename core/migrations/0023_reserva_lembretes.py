@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_reserva_expira_em'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='ultimo_lembrete_em',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Último lembrete de devolução'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(condition=models.Q(('status', 'Confirmado')), fields=['data_devolucao'], name='reserva_confirmada_devol_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_reserva_lembretes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exemplar',
+            index=models.Index(fields=['item', 'situacao', 'condicao', 'vezes_retirado'], name='exemplar_item_situacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['nome'], name='item_nome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['status', '-data_reserva', '-id'], name='reserva_status_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['status', '-data_retirada', '-id'], name='reserva_status_retirada_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['usuario', '-data_reserva', '-id'], name='reserva_usuario_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['-data_reserva', '-id'], name='reserva_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['item', 'data_reserva'], name='reserva_item_data_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_indices_caminhos_de_acesso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='imagem_altura',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Altura da imagem (px)'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='imagem_largura',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Largura da imagem (px)'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='miniatura',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='itens/miniaturas/', verbose_name='Miniatura (80px)'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='miniatura_2x',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='itens/miniaturas/', verbose_name='Miniatura (160px)'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+"""
+Miniaturas das imagens dos itens.
+
+O catálogo mostra cada imagem num quadrado de 80px, mas o upload é guardado
+como veio (às vezes vários MB). Quando um item ganha imagem nova, Item.save
+chama `gerar`, que recorta o centro da imagem em dois quadrados (80px e 160px,
+para telas comuns e de alta densidade), grava em WebP (JPEG se o Pillow não
+tiver WebP) ao lado do original e guarda no item os nomes e as dimensões do
+original. Os templates usam as miniaturas com `srcset` e caem no original
+enquanto elas não existem (`manage.py gerar_miniaturas` gera as que faltam).
+"""
+import io
+import logging
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+
+logger = logging.getLogger(__name__)
+
+# Lado, em px CSS, do quadrado onde o catálogo mostra a imagem.
+TAMANHO = 80
+
+PASTA = 'itens/miniaturas'
+
+FORMATO, EXTENSAO = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+QUALIDADE = 80
+
+CAMPOS = ('miniatura', 'miniatura_2x', 'imagem_largura', 'imagem_altura')
+
+
+def _nome(imagem, lado):
+    return f'{PASTA}/{PurePosixPath(imagem.name).stem}-{lado}.{EXTENSAO}'
+
+
+def _modo(original):
+    """
+    RGB, ou RGBA se houver transparência e o formato suportar (imagens com
+    paleta também precisam virar RGB(A) para o redimensionamento suavizar).
+    """
+    if FORMATO == 'WEBP' and original.has_transparency_data:
+        return 'RGBA'
+    return 'RGB'
+
+
+def _gravar(storage, nome, imagem):
+    conteudo = io.BytesIO()
+    if FORMATO == 'WEBP':
+        imagem.save(conteudo, FORMATO, quality=QUALIDADE, method=6)
+    else:
+        imagem.save(conteudo, FORMATO, quality=QUALIDADE, optimize=True, progressive=True)
+
+    if storage.exists(nome):
+        storage.delete(nome)
+    return storage.save(nome, ContentFile(conteudo.getvalue()))
+
+
+def gerar(item):
+    """
+    Gera as miniaturas de `item.imagem` e preenche os CAMPOS do item (sem
+    salvar). Retorna False se a imagem não puder ser lida; nesse caso os
+    campos ficam vazios, as miniaturas antigas são apagadas e os templates
+    usam o original.
+    """
+    storage = item.imagem.storage
+    anteriores = {item.miniatura.name, item.miniatura_2x.name} - {None, ''}
+
+    try:
+        with item.imagem.open('rb'), Image.open(item.imagem) as original:
+            original = ImageOps.exif_transpose(original)
+            original = original.convert(_modo(original))
+            largura, altura = original.size
+            nomes = [
+                _gravar(storage, _nome(item.imagem, lado), ImageOps.fit(original, (lado, lado), Image.Resampling.LANCZOS))
+                for lado in (TAMANHO, 2 * TAMANHO)
+            ]
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as erro:
+        # DecompressionBombError: imagem com mais pixels do que o Pillow aceita
+        # abrir (Image.MAX_IMAGE_PIXELS); o upload fica, sem miniaturas.
+        logger.warning('Não foi possível gerar as miniaturas de %s: %s', item.imagem.name, erro)
+        _limpar(item)
+        for nome in anteriores:
+            storage.delete(nome)
+        return False
+
+    item.miniatura, item.miniatura_2x = nomes
+    item.imagem_largura, item.imagem_altura = largura, altura
+    for nome in anteriores - set(nomes):
+        storage.delete(nome)
+    return True
+
+
+def _limpar(item):
+    for campo in CAMPOS:
+        setattr(item, campo, None)
+
+
+def atualizar(item):
+    """
+    Refaz as miniaturas do item (ou as tira, se ele ficou sem imagem) e grava
+    só esses campos, com um UPDATE. Retorna False se a imagem não pôde ser lida.
+    """
+    gerou = True
+    if item.imagem:
+        gerou = gerar(item)
+    else:
+        _limpar(item)
+    type(item).objects.filter(pk=item.pk).update(**{campo: getattr(item, campo) for campo in CAMPOS})
+    return gerou
@@ -1,5 +1,5 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 
@@ -36,6 +36,27 @@ class Usuario(AbstractUser):
     def __str__(self):
         return f'{self.nusp} - {self.get_full_name() or self.username}'
 
+    # Valores de CAMPOS_USUARIO como estão no banco; None enquanto não foi salvo.
+    _busca_salva = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        from .busca import CAMPOS_USUARIO, valores_salvos
+
+        usuario = super().from_db(db, field_names, values)
+        usuario._busca_salva = valores_salvos(usuario, CAMPOS_USUARIO)
+        return usuario
+
+    def save(self, *args, **kwargs):
+        from .busca import CAMPOS_USUARIO, trocar_parte, valores_salvos
+
+        novo = self._state.adding
+        super().save(*args, **kwargs)
+        salvos = valores_salvos(self, CAMPOS_USUARIO, self._busca_salva, kwargs.get('update_fields'))
+        if not novo:
+            trocar_parte(self.reservas.all(), self._busca_salva, salvos, inicio=True)
+        self._busca_salva = salvos
+
 class Item(models.Model):
 
     nome = models.CharField(
@@ -62,8 +83,120 @@ class Item(models.Model):
         verbose_name='Imagem do item'
     )
 
+    # Gerados a partir de `imagem` por core.miniaturas (ver Item.save).
+    imagem_largura = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Largura da imagem (px)'
+    )
+
+    imagem_altura = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Altura da imagem (px)'
+    )
+
+    miniatura = models.ImageField(
+        upload_to='itens/miniaturas/',
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='Miniatura (80px)'
+    )
+
+    miniatura_2x = models.ImageField(
+        upload_to='itens/miniaturas/',
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name='Miniatura (160px)'
+    )
+
+    # Contadores de exemplares por situação, mantidos por core.estoque na
+    # mesma transação de cada mudança em Exemplar (`manage.py recontar_estoque` refaz).
+    total_exemplares = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Total de exemplares'
+    )
+
+    disponiveis = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Exemplares disponíveis'
+    )
+
+    reservados = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Exemplares reservados'
+    )
+
+    em_manutencao = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Exemplares em manutenção'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nome'], name='item_nome_idx'),
+        ]
+
+    # Mantidos só por core.estoque, com UPDATE ... SET campo = campo + n.
+    CONTADORES = ('total_exemplares', 'disponiveis', 'reservados', 'em_manutencao')
+
+    # Nome de `imagem` como está no banco; None enquanto não foi salvo.
+    _imagem_salva = None
+
     def __str__(self):
         return f'{self.codigo_tipo} - {self.nome}'
+
+    # Valores de CAMPOS_ITEM como estão no banco; None enquanto não foi salvo.
+    _busca_salva = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        from .busca import CAMPOS_ITEM, valores_salvos
+
+        item = super().from_db(db, field_names, values)
+        item._imagem_salva = item.__dict__.get('imagem')
+        item._busca_salva = valores_salvos(item, CAMPOS_ITEM)
+        return item
+
+    def save(self, *args, **kwargs):
+        from .busca import CAMPOS_ITEM, trocar_parte, valores_salvos
+
+        novo = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        if not novo and update_fields is None:
+            # Um save completo regravaria os contadores com os valores lidos
+            # antes, desfazendo o que outras transações somaram no meio tempo.
+            adiados = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                campo.attname for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.attname not in self.CONTADORES and campo.attname not in adiados
+            ]
+        super().save(*args, **kwargs)
+        salvos = valores_salvos(self, CAMPOS_ITEM, self._busca_salva, update_fields)
+        if not novo:
+            trocar_parte(self.reservas.all(), self._busca_salva, salvos, inicio=False)
+        self._busca_salva = salvos
+        if update_fields is None or 'imagem' in update_fields:
+            self._atualizar_miniaturas()
+
+    def _atualizar_miniaturas(self):
+        from .miniaturas import atualizar
+
+        if 'imagem' in self.get_deferred_fields():
+            return
+
+        nome = self.imagem.name or None
+        if nome != self._imagem_salva or (nome and not self.miniatura):
+            atualizar(self)
+        self._imagem_salva = nome
     
     
 class Exemplar(models.Model):
@@ -108,9 +241,60 @@ class Exemplar(models.Model):
         verbose_name='Observações',
     )
 
+    vezes_retirado = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Vezes retirado',
+        help_text='Usado para entregar primeiro os exemplares menos usados.'
+    )
+
+    # (item_id, situacao) como estão no banco; None enquanto não foi salvo.
+    _estoque_salvo = None
+
+    class Meta:
+        indexes = [
+            # Exemplares livres de um item, já na ordem de entrega (core.alocacao).
+            models.Index(fields=['item', 'situacao', 'condicao', 'vezes_retirado'], name='exemplar_item_situacao_idx'),
+        ]
+
     def __str__(self):
         return f'{self.codigo_exemplar} ({self.item.nome}) - {self.situacao} / {self.condicao}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        exemplar = super().from_db(db, field_names, values)
+        exemplar._estoque_salvo = (exemplar.__dict__.get('item_id'), exemplar.__dict__.get('situacao'))
+        return exemplar
+
+    def _estoque_no_banco(self):
+        if self._estoque_salvo is not None and None in self._estoque_salvo:
+            # Carregado com .only()/.defer(): busca o que falta.
+            return Exemplar.objects.filter(pk=self.pk).values_list('item_id', 'situacao').first()
+        return self._estoque_salvo
+
+    def save(self, *args, **kwargs):
+        from .estoque import mover
+
+        with transaction.atomic():
+            anterior = self._estoque_no_banco()
+            super().save(*args, **kwargs)
+            mover(anterior, (self.item_id, self.situacao))
+        self._estoque_salvo = (self.item_id, self.situacao)
+
+    def delete(self, *args, **kwargs):
+        from .estoque import mover
+
+        with transaction.atomic():
+            anterior = self._estoque_no_banco()
+            resultado = super().delete(*args, **kwargs)
+            mover(anterior, None)
+        self._estoque_salvo = None
+        return resultado
+
+# Campos de Reserva que definem a ocupação do item (ver core.disponibilidade).
+CAMPOS_OCUPACAO = ('item_id', 'status', 'data_retirada', 'data_devolucao')
+CAMPOS_DONO = ('usuario_id', 'item_id')
+
+
 class Reserva(models.Model):
 
     class Status(models.TextChoices):
@@ -224,9 +408,127 @@ class Reserva(models.Model):
         verbose_name='Data/hora que confirmou a devolução'
     )
 
+    expira_em = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Prazo para retirada',
+        help_text='Depois disso, a reserva pendente é cancelada por `manage.py cancelar_reservas_expiradas`.'
+    )
+
+    ultimo_lembrete_em = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Último lembrete de devolução'
+    )
+
+    documento_busca = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Texto de busca',
+        help_text='Dados do usuário e do item sem acentos, usados pela busca da gestão (ver core.busca).'
+    )
+
+    class Meta:
+        # Um índice por caminho de acesso das views (ver core.tests.PlanoDeConsultaTests).
+        indexes = [
+            models.Index(fields=['status', '-data_reserva', '-id'], name='reserva_status_data_idx'),
+            models.Index(fields=['status', '-data_retirada', '-id'], name='reserva_status_retirada_idx'),
+            models.Index(fields=['usuario', '-data_reserva', '-id'], name='reserva_usuario_data_idx'),
+            models.Index(fields=['-data_reserva', '-id'], name='reserva_data_idx'),
+            models.Index(fields=['item', 'data_reserva'], name='reserva_item_data_idx'),
+            models.Index(
+                fields=['expira_em'],
+                condition=models.Q(status='Pendente'),
+                name='reserva_pendente_expira_idx',
+            ),
+            models.Index(
+                fields=['data_devolucao'],
+                condition=models.Q(status='Confirmado'),
+                name='reserva_confirmada_devol_idx',
+            ),
+        ]
+
+    # (item_id, status, data_retirada, data_devolucao) como estão no banco;
+    # None enquanto não foi salva. Usado por core.disponibilidade.
+    _ocupacao_salva = None
+
+    # (usuario_id, item_id) como estão no banco; None enquanto não foi salva.
+    # Usado para refazer o documento de busca quando a reserva muda de dono.
+    _busca_salva = None
+
     def __str__(self):
         return f'Reserva #{self.id} - {self.usuario.nusp} - {self.item.codigo_tipo} ({self.status})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        reserva = super().from_db(db, field_names, values)
+        reserva._ocupacao_salva = tuple(reserva.__dict__.get(campo) for campo in CAMPOS_OCUPACAO)
+        reserva._busca_salva = tuple(reserva.__dict__.get(campo) for campo in CAMPOS_DONO)
+        return reserva
+
+    def _dono_mudou(self, update_fields):
+        if self._state.adding:
+            return False
+        if update_fields is not None and not {'usuario', 'usuario_id', 'item', 'item_id'} & set(update_fields):
+            return False
+        salvo = self._busca_salva
+        if salvo is None or None in salvo:
+            # Carregada com .only()/.defer(): busca o que falta.
+            salvo = Reserva.objects.filter(pk=self.pk).values_list(*CAMPOS_DONO).first()
+        return salvo != tuple(getattr(self, campo) for campo in CAMPOS_DONO)
+
+    def _ocupacao(self):
+        return tuple(getattr(self, campo) for campo in CAMPOS_OCUPACAO)
+
+    def _ocupacao_no_banco(self):
+        if self._ocupacao_salva is not None and None in self._ocupacao_salva:
+            # Carregada com .only()/.defer(): busca o que falta.
+            return Reserva.objects.filter(pk=self.pk).values_list(*CAMPOS_OCUPACAO).first()
+        return self._ocupacao_salva
+
+    def save(self, *args, **kwargs):
+        from .busca import montar_documento, sincronizar
+        from .cancelamentos import prazo_retirada
+        from .disponibilidade import mover
+        from .estatisticas import registrar_reserva
+
+        nova = self._state.adding
+
+        # Monta o documento quando ainda não existe ou quando a reserva passou
+        # para outro usuário/item; mudanças nos dados do próprio usuário ou
+        # item são propagadas por Usuario.save/Item.save.
+        update_fields = kwargs.get('update_fields')
+        indexar = (
+            (not self.documento_busca and update_fields is None)
+            or self._dono_mudou(update_fields)
+        )
+        if indexar:
+            self.documento_busca = montar_documento(self.usuario, self.item)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'documento_busca'}
+
+        if kwargs.get('update_fields') is None:
+            self.expira_em = prazo_retirada(self.data_retirada) if self.status == self.Status.PENDENTE else None
+
+        with transaction.atomic():
+            anterior = self._ocupacao_no_banco()
+            super().save(*args, **kwargs)
+            if kwargs.get('update_fields') is None:
+                atual = self._ocupacao()
+            else:
+                # Só parte dos campos foi gravada: o que vale é o que ficou no banco.
+                atual = Reserva.objects.filter(pk=self.pk).values_list(*CAMPOS_OCUPACAO).first()
+            mover(anterior, atual)
+            if indexar:
+                sincronizar([(self.id, self.documento_busca)])
+            if nova:
+                registrar_reserva(self)
+        self._ocupacao_salva = atual
+        if update_fields is None or indexar:
+            self._busca_salva = tuple(getattr(self, campo) for campo in CAMPOS_DONO)
+
     def marcar_como_cancelada(self, motivo: str = '', automatico: bool = False, usuario=None):
         """
         Marca a reserva como cancelada, atualizando campos relacionados e salvando no banco.
@@ -244,8 +546,216 @@ class Reserva(models.Model):
                 self.usuario_cancelou = usuario
             except Exception:
                 pass
+
+        # Reserva.save devolve os dias que ela ocupava (core.disponibilidade).
         self.save()
         
+class OcupacaoDiaria(models.Model):
+    """
+    Quantas reservas ativas (pendentes ou confirmadas) ocupam o item em cada dia.
+    Mantida por core.disponibilidade; pode ser refeita com `manage.py reconstruir_ocupacao`.
+    """
+    item = models.ForeignKey(
+        Item,
+        on_delete=models.CASCADE,
+        related_name='ocupacoes',
+        verbose_name='Tipo de item'
+    )
+
+    dia = models.DateField(
+        verbose_name='Dia'
+    )
+
+    quantidade = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Reservas no dia'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'dia'], name='ocupacao_item_dia_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.item_id} - {self.dia}: {self.quantidade}'
+
+class EstatisticaDiaria(models.Model):
+    """
+    Reservas criadas por item em cada dia. Alimenta a api_estatisticas;
+    mantida por core.estatisticas (`manage.py reconstruir_estatisticas` refaz).
+    """
+    item = models.ForeignKey(
+        Item,
+        on_delete=models.CASCADE,
+        related_name='estatisticas_diarias',
+        verbose_name='Tipo de item'
+    )
+
+    dia = models.DateField(
+        verbose_name='Dia'
+    )
+
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Reservas'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'dia'], name='estatistica_item_dia_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.item_id} - {self.dia}: {self.total}'
+
+
+class EstatisticaMensal(models.Model):
+    """
+    Reservas criadas por item em cada mês (`mes` é sempre o dia 1).
+    """
+    item = models.ForeignKey(
+        Item,
+        on_delete=models.CASCADE,
+        related_name='estatisticas_mensais',
+        verbose_name='Tipo de item'
+    )
+
+    mes = models.DateField(
+        verbose_name='Mês'
+    )
+
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Reservas'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'mes'], name='estatistica_item_mes_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.item_id} - {self.mes:%Y-%m}: {self.total}'
+
+class ContagemUsuarioItem(models.Model):
+    """
+    Quantas reservas cada usuário já fez de cada item. A linha com item vazio
+    guarda o total do usuário em todos os itens. Alimenta o ranking de
+    usuários da api_estatisticas (ver core.estatisticas).
+    """
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        related_name='contagens_reservas',
+        verbose_name='Usuário'
+    )
+
+    item = models.ForeignKey(
+        Item,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='contagens_usuarios',
+        verbose_name='Tipo de item'
+    )
+
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Reservas'
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'item'], name='contagem_usuario_item_unica'),
+            models.UniqueConstraint(
+                fields=['usuario'],
+                condition=models.Q(item__isnull=True),
+                name='contagem_usuario_total_unica',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['item', '-total'], name='contagem_ranking_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.usuario_id} / {self.item_id or "todos"}: {self.total}'
+
+
+class VersaoDados(models.Model):
+    """
+    Contador que muda sempre que um conjunto de dados muda (ex.: 'estatisticas').
+    Serve de chave para caches e ETags; fica no banco para valer em todos os workers.
+    """
+    chave = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name='Chave'
+    )
+
+    versao = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Versão'
+    )
+
+    def __str__(self):
+        return f'{self.chave} v{self.versao}'
+
+class EmailPendente(models.Model):
+    """
+    Fila de saída de e-mails. As views só gravam aqui; o envio é feito em
+    lote por `manage.py enviar_emails` (ver core.emails).
+    """
+    destinatario = models.EmailField(
+        verbose_name='Destinatário'
+    )
+
+    assunto = models.CharField(
+        max_length=255,
+        verbose_name='Assunto'
+    )
+
+    mensagem = models.TextField(
+        verbose_name='Mensagem'
+    )
+
+    criado_em = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Criado em'
+    )
+
+    enviado_em = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Enviado em'
+    )
+
+    tentativas = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Tentativas de envio'
+    )
+
+    proxima_tentativa = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Próxima tentativa'
+    )
+
+    ultimo_erro = models.TextField(
+        blank=True,
+        verbose_name='Último erro'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['proxima_tentativa'],
+                condition=models.Q(enviado_em__isnull=True),
+                name='email_pendente_fila_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.destinatario} - {self.assunto}'
+
 class ReservaHistorico(models.Model):
     """
     DESCONTINUADO: Os dados foram consolidados no modelo Reserva.
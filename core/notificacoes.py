@@ -0,0 +1,39 @@
+"""
+Canais de notificação para avisos em lote (ex.: lembretes de devolução).
+
+Um notificador recebe uma lista de Aviso e entrega todos de uma vez. O
+padrão é NotificadorEmail, que grava os avisos na fila de saída (um único
+INSERT); outros canais podem ser ligados em settings.NOTIFICADOR_LEMBRETES.
+"""
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import EmailPendente
+
+
+@dataclass
+class Aviso:
+    usuario: object
+    assunto: str
+    mensagem: str
+
+
+class NotificadorEmail:
+
+    def enviar(self, avisos):
+        EmailPendente.objects.bulk_create(
+            [
+                EmailPendente(destinatario=a.usuario.email, assunto=a.assunto, mensagem=a.mensagem)
+                for a in avisos
+                if a.usuario.email
+            ],
+            batch_size=500,
+        )
+        return len(avisos)
+
+
+def obter_notificador():
+    caminho = getattr(settings, 'NOTIFICADOR_LEMBRETES', 'core.notificacoes.NotificadorEmail')
+    return import_string(caminho)()
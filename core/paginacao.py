@@ -0,0 +1,193 @@
+"""
+Paginação por cursor (keyset) para listas grandes.
+
+Em vez de OFFSET, cada página guarda os valores de ordenação da primeira e da
+última linha num token; a próxima página é buscada com
+`WHERE (chaves) < (valores do token)`, que o banco resolve pelo índice. A
+página N custa o mesmo que a página 1 e não há COUNT(*).
+
+A ordenação precisa terminar numa coluna única (ex.: ('-data_reserva', '-id')),
+senão linhas com o mesmo valor podem sumir entre páginas.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+PARAMETRO = 'cursor'
+
+# Por quanto tempo (s) uma contagem em cache é considerada atual.
+VALIDADE_CONTAGEM = 60
+
+
+def _codificar(direcao, valores):
+    dados = json.dumps({'d': direcao, 'v': valores}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip('=')
+
+
+def _decodificar(token):
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return dados['d'], dados['v']
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None, None
+
+
+class PaginaCursor:
+
+    def __init__(self, itens, request, proximo, anterior):
+        self.itens = itens
+        self.proximo = proximo
+        self.anterior = anterior
+        self._request = request
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    def __bool__(self):
+        return bool(self.itens)
+
+    @property
+    def tem_outras_paginas(self):
+        return bool(self.proximo or self.anterior)
+
+    def _url(self, token):
+        if token is None:
+            return None
+        parametros = self._request.GET.copy()
+        parametros[PARAMETRO] = token
+        return f'?{parametros.urlencode()}'
+
+    @property
+    def url_proxima(self):
+        return self._url(self.proximo)
+
+    @property
+    def url_anterior(self):
+        return self._url(self.anterior)
+
+
+def _filtro_keyset(campos, valores, depois):
+    """
+    Monta (a > x) OR (a = x AND b > y) OR ... respeitando o sentido de cada campo.
+    `depois=False` inverte tudo (página anterior).
+    """
+    filtro = Q()
+    iguais = {}
+    for (campo, decrescente), valor in zip(campos, valores):
+        maior = decrescente != depois
+        filtro |= Q(**iguais, **{f'{campo}__{"gt" if maior else "lt"}': valor})
+        iguais[campo] = valor
+    return filtro
+
+
+def _valor(modelo, campo, valor):
+    try:
+        campo_modelo = modelo._meta.get_field(campo)
+    except FieldDoesNotExist:
+        # Anotação numérica (ex.: relevancia de core.busca): o JSON já traz o tipo.
+        if not isinstance(valor, (int, float)):
+            raise ValueError(campo)
+        return valor
+    return campo_modelo.to_python(valor)
+
+
+def paginar_por_cursor(queryset, request, ordem, por_pagina=50):
+    """
+    Retorna uma PaginaCursor com até `por_pagina` objetos do queryset,
+    ordenados por `ordem` e a partir do token em request.GET['cursor'].
+    A ordem pode começar por uma anotação numérica do queryset.
+    """
+    campos = [(c.lstrip('-'), c.startswith('-')) for c in ordem]
+    modelo = queryset.model
+
+    direcao, valores = _decodificar(request.GET.get(PARAMETRO, ''))
+    if direcao not in ('p', 'a') or not isinstance(valores, list) or len(valores) != len(campos):
+        direcao, valores = None, None
+    else:
+        try:
+            valores = [_valor(modelo, campo, v) for (campo, _), v in zip(campos, valores)]
+        except Exception:
+            direcao, valores = None, None
+
+    if direcao == 'a':
+        invertida = [c[1:] if c.startswith('-') else f'-{c}' for c in ordem]
+        qs = queryset.filter(_filtro_keyset(campos, valores, depois=False)).order_by(*invertida)
+        itens = list(qs[:por_pagina + 1])
+        tem_anterior = len(itens) > por_pagina
+        itens = itens[:por_pagina][::-1]
+        tem_proxima = True
+    else:
+        qs = queryset
+        if direcao == 'p':
+            qs = qs.filter(_filtro_keyset(campos, valores, depois=True))
+        itens = list(qs.order_by(*ordem)[:por_pagina + 1])
+        tem_proxima = len(itens) > por_pagina
+        itens = itens[:por_pagina]
+        tem_anterior = direcao == 'p'
+
+    def chave(obj):
+        return [getattr(obj, campo) for campo, _ in campos]
+
+    proximo = _codificar('p', chave(itens[-1])) if itens and tem_proxima else None
+    anterior = _codificar('a', chave(itens[0])) if itens and tem_anterior else None
+    return PaginaCursor(itens, request, proximo, anterior)
+
+
+# Uma única thread por processo refaz as contagens vencidas, uma de cada vez;
+# sob carga as recontagens esperam na fila em vez de abrir conexões em paralelo.
+_recontagens = ThreadPoolExecutor(max_workers=1, thread_name_prefix='contagem')
+
+
+def _recontar(chave, queryset):
+    try:
+        cache.set(chave, (queryset.count(), time.time()), None)
+    finally:
+        connections.close_all()
+
+
+def contagem_em_cache(queryset, validade=VALIDADE_CONTAGEM):
+    """
+    COUNT(*) do queryset guardado em cache por filtro.
+
+    Só a primeira chamada conta na hora. Depois, se o valor tiver mais de
+    `validade` segundos, devolve o valor antigo e agenda a recontagem na
+    thread de `_recontagens` (no máximo uma por filtro, entre todos os
+    processos que dividem o cache), então nenhuma página espera pelo COUNT.
+    """
+    chave = 'contagem:' + hashlib.sha1(str(queryset.query).encode()).hexdigest()
+
+    guardado = cache.get(chave)
+    if guardado is None:
+        total = queryset.count()
+        cache.set(chave, (total, time.time()), None)
+        return total
+
+    total, calculado_em = guardado
+    if time.time() - calculado_em > validade and cache.add(f'{chave}:recontando', True, validade):
+        _recontagens.submit(_recontar, chave, queryset.all())
+    return total
+
+
+class PaginadorContagemEmCache(Paginator):
+    """
+    Paginator com o total vindo de `contagem_em_cache`, para as listas do
+    admin sobre tabelas grandes (ModelAdmin.paginator).
+    """
+
+    @cached_property
+    def count(self):
+        return contagem_em_cache(self.object_list)
@@ -1,3 +1,1125 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import smtplib
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    alocacao, busca, cancelamentos, consistencia, disponibilidade, emails, estatisticas, exportacao,
+    instrumentacao, lembretes, logos, miniaturas, paginacao,
+)
+from .models import (
+    ContagemUsuarioItem, EmailPendente, EstatisticaDiaria, EstatisticaMensal, Exemplar, Item, OcupacaoDiaria, Reserva,
+    Usuario,
+)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Lê o formato do EXPLAIN QUERY PLAN do SQLite.')
+class PlanoDeConsultaTests(TestCase):
+    """
+    Roda EXPLAIN em cada SELECT feito pelas views principais e falha se alguma
+    tabela grande for percorrida (SCAN, mesmo que pelo índice).
+    """
+
+    # Tabelas que crescem com o uso. As de estatísticas/contadores são pequenas
+    # por construção, e core_item é o catálogo de tipos, listado inteiro.
+    TABELAS_GRANDES = ('core_reserva', 'core_exemplar', 'core_usuario')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.diretor = Usuario.objects.create_user(
+            username='diretor', nusp='1', email='diretor@usp.br', password='x',
+            tipo_acesso=Usuario.TiposAcesso.DIRETORIA,
+        )
+        cls.item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        Exemplar.objects.create(item=cls.item, codigo_exemplar='JAL-1')
+
+        hoje = date.today()
+        cls.pendente = Reserva.objects.create(
+            usuario=cls.diretor, item=cls.item, data_retirada=hoje, data_devolucao=hoje,
+        )
+        Reserva.objects.create(
+            usuario=cls.diretor, item=cls.item, status=Reserva.Status.CONFIRMADO,
+            data_retirada=hoje - timedelta(days=3), data_devolucao=hoje - timedelta(days=1),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.diretor)
+
+    def _planos(self, url, params=None):
+        # A primeira visita calcula as contagens em cache (contagem_em_cache);
+        # as seguintes, que são as que importam, só leem o cache.
+        self.client.get(url, params or {})
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url, params or {})
+            if resposta.streaming:
+                b''.join(resposta.streaming_content)
+        self.assertIn(resposta.status_code, (200, 304))
+
+        for consulta in consultas.captured_queries:
+            sql = consulta['sql']
+            if not sql.startswith('SELECT') or 'django_session' in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                yield sql, [linha[-1] for linha in cursor.fetchall()]
+
+    def assertSemVarreduraCompleta(self, url, params=None):
+        for sql, plano in self._planos(url, params):
+            ordenado_pelo_indice = not any('TEMP B-TREE' in passo for passo in plano)
+            for passo in plano:
+                partes = passo.split()
+                if partes[0] != 'SCAN' or partes[1] not in self.TABELAS_GRANDES:
+                    continue
+                # A paginação por cursor percorre o índice na ordem pedida e
+                # para no LIMIT: só lê a página.
+                if 'LIMIT' in sql and 'INDEX' in partes and ordenado_pelo_indice:
+                    continue
+                self.fail(f'{url}: varredura de {partes[1]}\n{sql}\n{plano}')
+
+    def test_catalogo(self):
+        self.assertSemVarreduraCompleta(reverse('core:lista_itens'))
+
+    def test_reservas_pendentes(self):
+        self.assertSemVarreduraCompleta(reverse('core:reservas_pendentes'))
+        self.assertSemVarreduraCompleta(reverse('core:reservas_pendentes'), {'q': 'jaleco'})
+
+    def test_reservas_ativas(self):
+        self.assertSemVarreduraCompleta(reverse('core:reservas_ativas'))
+        self.assertSemVarreduraCompleta(reverse('core:reservas_ativas'), {'atrasadas': '1'})
+
+    def test_historico_do_usuario(self):
+        self.assertSemVarreduraCompleta(reverse('core:historico_reservas'))
+
+    def test_historico_completo(self):
+        url = reverse('core:historico_reservas_completo')
+        self.assertSemVarreduraCompleta(url)
+        self.assertSemVarreduraCompleta(url, {'status': Reserva.Status.CONCLUIDA})
+
+    def test_historico_completo_filtrado(self):
+        url = reverse('core:historico_reservas_completo')
+        self.assertSemVarreduraCompleta(url, {'usuario': '123'})
+        self.assertSemVarreduraCompleta(url, {'item': 'jal'})
+        self.assertSemVarreduraCompleta(url, {'status': Reserva.Status.PENDENTE, 'usuario': '123', 'item': 'jal'})
+
+    def test_filtros_do_historico_completo_acham_as_mesmas_reservas(self):
+        url = reverse('core:historico_reservas_completo')
+        todas = {self.pendente.id, self.pendente.id + 1}
+        for params, esperado in (
+            ({'usuario': '1'}, todas),
+            ({'item': 'JAL'}, todas),
+            ({'item': 'jaleco'}, set()),  # está no nome, não no código
+            ({'usuario': '999'}, set()),
+        ):
+            resposta = self.client.get(url, params)
+            self.assertEqual({r.id for r in resposta.context['reservas']}, esperado, params)
+
+    def test_exportar_historico(self):
+        # Sem filtro, a exportação lê todas as reservas por definição.
+        url = reverse('core:exportar_historico_reservas')
+        self.assertSemVarreduraCompleta(url, {'status': Reserva.Status.CONCLUIDA})
+        self.assertSemVarreduraCompleta(url, {'usuario': '123', 'item': 'jal'})
+
+    def test_lista_usuarios(self):
+        self.assertSemVarreduraCompleta(reverse('core:lista_usuarios'))
+
+    def test_estoque(self):
+        self.assertSemVarreduraCompleta(reverse('core:modificar_estoque'))
+        self.assertSemVarreduraCompleta(reverse('core:detalhe_item_estoque', args=[self.item.id]))
+
+    def test_confirmar_retirada(self):
+        self.assertSemVarreduraCompleta(reverse('core:confirmar_retirada', args=[self.pendente.id]))
+
+    def test_estatisticas(self):
+        self.assertSemVarreduraCompleta(reverse('core:api_estatisticas'))
+        self.assertSemVarreduraCompleta(reverse('core:api_estatisticas'), {'item_id': self.item.id})
+
+
+class EstoqueTests(TestCase):
+    """
+    Os contadores de Item só mudam por core.estoque.
+    """
+
+    def test_save_do_item_nao_sobrescreve_os_contadores(self):
+        Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        item = Item.objects.get(codigo_tipo='JAL')
+        Exemplar.objects.create(item=item, codigo_exemplar='JAL-1')
+        Exemplar.objects.create(item=item, codigo_exemplar='JAL-2', situacao=Exemplar.Situacao.RESERVADO)
+
+        # `item` foi lido antes dos exemplares existirem.
+        item.nome = 'Jaleco branco'
+        item.save()
+
+        item = Item.objects.get(pk=item.pk)
+        self.assertEqual(item.nome, 'Jaleco branco')
+        self.assertEqual((item.total_exemplares, item.disponiveis, item.reservados), (2, 1, 1))
+
+
+class BuscaTests(TestCase):
+    """
+    Busca das filas da gestão: sem acentos, por trecho, e acompanhando
+    mudanças no usuário, no item e remoções.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(
+            username='joao', nusp='12345', email='joao@usp.br', password='x',
+            first_name='João', last_name='Conceição',
+        )
+        cls.item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        hoje = date.today()
+        cls.reserva = Reserva.objects.create(usuario=cls.aluno, item=cls.item, data_retirada=hoje, data_devolucao=hoje)
+
+    def _achadas(self, q):
+        return list(busca.filtrar(Reserva.objects.all(), q).values_list('id', flat=True))
+
+    def _linhas_fts(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {busca.TABELA_FTS}')
+            return cursor.fetchone()[0]
+
+    def test_usa_o_indice_de_trigramas(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Índice FTS5 só existe no SQLite.')
+        self.assertTrue(busca.usa_fts())
+        self.assertIn(busca.TABELA_FTS, str(busca.filtrar(Reserva.objects.all(), 'alec').query))
+
+    def test_ignora_acentos_e_maiusculas(self):
+        for q in ('joão', 'JOAO', 'conceicao', 'Conceição'):
+            self.assertEqual(self._achadas(q), [self.reserva.id], q)
+
+    def test_trecho_no_meio_da_palavra(self):
+        self.assertEqual(self._achadas('alec'), [self.reserva.id])
+        self.assertEqual(self._achadas('ncei'), [self.reserva.id])
+        self.assertEqual(self._achadas('xyz'), [])
+
+    def test_termo_curto_e_numero_da_reserva(self):
+        self.assertEqual(self._achadas('ja'), [self.reserva.id])
+        self.assertEqual(self._achadas(str(self.reserva.id)), [self.reserva.id])
+
+    def test_mudanca_no_usuario_e_no_item(self):
+        aluno = Usuario.objects.get(pk=self.aluno.pk)
+        aluno.last_name = 'Ribeiro'
+        aluno.save()
+        item = Item.objects.get(pk=self.item.pk)
+        item.nome = 'Óculos de proteção'
+        item.save()
+
+        reserva = Reserva.objects.get(pk=self.reserva.pk)
+        self.assertEqual(reserva.documento_busca, busca.montar_documento(aluno, item))
+        self.assertEqual(self._achadas('ribeiro'), [self.reserva.id])
+        self.assertEqual(self._achadas('oculos'), [self.reserva.id])
+        self.assertEqual(self._achadas('conceicao'), [])
+        self.assertEqual(self._achadas('jaleco'), [])
+
+    def test_save_sem_mudanca_nos_campos_indexados_nao_reindexa(self):
+        aluno = Usuario.objects.get(pk=self.aluno.pk)
+        aluno.is_active = False
+        with CaptureQueriesContext(connection) as consultas:
+            aluno.save()
+        self.assertFalse([c for c in consultas.captured_queries if 'core_reserva' in c['sql']])
+
+    def test_remocao_sai_do_indice(self):
+        if not busca.usa_fts():
+            self.skipTest('Requer FTS5 com tokenizer trigram.')
+        self.assertEqual(self._linhas_fts(), 1)
+        Reserva.objects.get(pk=self.reserva.pk).delete()
+        self.assertEqual(self._linhas_fts(), 0)
+
+    def test_reserva_passada_para_outro_usuario_e_item(self):
+        maria = Usuario.objects.create_user(
+            username='maria', nusp='54321', email='maria@usp.br', password='x', first_name='Maria',
+        )
+        oculos = Item.objects.create(nome='Óculos', codigo_tipo='OCU')
+
+        reserva = Reserva.objects.get(pk=self.reserva.pk)
+        reserva.usuario = maria
+        reserva.item = oculos
+        reserva.save()
+
+        self.assertEqual(self._achadas('maria'), [self.reserva.id])
+        self.assertEqual(self._achadas('oculos'), [self.reserva.id])
+        self.assertEqual(self._achadas('joao'), [])
+        self.assertEqual(self._achadas('jaleco'), [])
+
+    def test_resultados_ordenados_por_relevancia(self):
+        if not busca.usa_fts():
+            self.skipTest('Requer FTS5 com tokenizer trigram.')
+        # Quem tem o termo mais vezes vem primeiro, mesmo sendo a reserva mais antiga.
+        self.aluno.last_name = 'Jaleco'
+        self.aluno.save()
+        outro = Usuario.objects.create_user(username='outro', nusp='2', email='outro@usp.br', password='x')
+        hoje = date.today()
+        recente = Reserva.objects.create(usuario=outro, item=self.item, data_retirada=hoje, data_devolucao=hoje)
+
+        ranqueadas = busca.ranquear(Reserva.objects.all(), 'jaleco').order_by('-relevancia', '-data_reserva', '-id')
+        self.assertEqual(list(ranqueadas.values_list('id', flat=True)), [self.reserva.id, recente.id])
+
+        self.client.force_login(Usuario.objects.create_user(
+            username='gestor', nusp='3', email='gestor@usp.br', password='x',
+            tipo_acesso=Usuario.TiposAcesso.MEMBRO_GESTAO,
+        ))
+        resposta = self.client.get(reverse('core:reservas_pendentes'), {'q': 'jaleco'})
+        self.assertEqual([r.id for r in resposta.context['reservas']], [self.reserva.id, recente.id])
+
+
+class PaginacaoTests(TestCase):
+    """
+    Paginação por cursor com empates na coluna de ordenação, nos dois sentidos.
+    """
+
+    ORDEM = ('-data_reserva', '-id')
+
+    @classmethod
+    def setUpTestData(cls):
+        aluno = Usuario.objects.create_user(username='aluno', nusp='2', email='aluno@usp.br', password='x')
+        item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        hoje = date.today()
+        for _ in range(8):
+            Reserva.objects.create(usuario=aluno, item=item, data_retirada=hoje, data_devolucao=hoje)
+
+        # Três grupos de reservas feitas no mesmo instante.
+        ids = list(Reserva.objects.order_by('id').values_list('id', flat=True))
+        for grupo, instante in ((ids[:3], 1), (ids[3:6], 2), (ids[6:], 3)):
+            Reserva.objects.filter(id__in=grupo).update(data_reserva=timezone.now() - timedelta(hours=instante))
+
+        cls.esperado = list(Reserva.objects.order_by(*cls.ORDEM).values_list('id', flat=True))
+
+    def _pagina(self, cursor=None):
+        request = RequestFactory().get('/', {paginacao.PARAMETRO: cursor} if cursor else {})
+        return paginacao.paginar_por_cursor(Reserva.objects.all(), request, self.ORDEM, por_pagina=3)
+
+    def test_avanca_e_volta_sem_repetir_nem_pular(self):
+        paginas = [self._pagina()]
+        while paginas[-1].proximo:
+            paginas.append(self._pagina(paginas[-1].proximo))
+
+        self.assertEqual([[r.id for r in p] for p in paginas], [self.esperado[i:i + 3] for i in range(0, 8, 3)])
+        self.assertIsNone(paginas[0].anterior)
+
+        voltando = [paginas[-1]]
+        while voltando[-1].anterior:
+            voltando.append(self._pagina(voltando[-1].anterior))
+        self.assertEqual([[r.id for r in p] for p in voltando], [[r.id for r in p] for p in reversed(paginas)])
+
+    def test_cursor_invalido_volta_para_o_inicio(self):
+        self.assertEqual([r.id for r in self._pagina('lixo')], self.esperado[:3])
+
+    def test_contagem_vencida_e_refeita_uma_vez_em_segundo_plano(self):
+        cache.clear()
+        reservas = Reserva.objects.all()
+        self.assertEqual(paginacao.contagem_em_cache(reservas), 8)
+
+        # Uma hora depois, a contagem está vencida.
+        relogio = mock.patch.object(paginacao, 'time', mock.Mock(time=lambda: time.time() + 3600))
+        with relogio, mock.patch.object(paginacao._recontagens, 'submit') as agendar:
+            self.assertEqual(paginacao.contagem_em_cache(reservas), 8)
+            self.assertEqual(paginacao.contagem_em_cache(reservas), 8)
+        agendar.assert_called_once()
+
+
+class EstatisticasTests(TestCase):
+    """
+    As tabelas pré-agregadas batem com uma reconstrução completa depois de
+    reservas criadas e apagadas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno', nusp='2', email='aluno@usp.br', password='x')
+        cls.outro = Usuario.objects.create_user(username='outro', nusp='3', email='outro@usp.br', password='x')
+        cls.item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        hoje = date.today()
+        for usuario in (cls.aluno, cls.aluno, cls.outro):
+            Reserva.objects.create(usuario=usuario, item=cls.item, data_retirada=hoje, data_devolucao=hoje)
+
+    def _tabelas(self):
+        return (
+            set(EstatisticaDiaria.objects.filter(total__gt=0).values_list('item_id', 'dia', 'total')),
+            set(EstatisticaMensal.objects.filter(total__gt=0).values_list('item_id', 'mes', 'total')),
+            set(ContagemUsuarioItem.objects.filter(total__gt=0).values_list('usuario_id', 'item_id', 'total')),
+        )
+
+    def assertIgualAReconstrucao(self):
+        mantidas = self._tabelas()
+        estatisticas.reconstruir()
+        self.assertEqual(mantidas, self._tabelas())
+
+    def test_criacao(self):
+        self.assertEqual(estatisticas.resumo()['total_reservas'], 3)
+        self.assertIgualAReconstrucao()
+
+    def test_remocao_direta(self):
+        versao = estatisticas.versao()
+        Reserva.objects.filter(usuario=self.aluno).only('id').first().delete()
+
+        self.assertEqual(estatisticas.resumo()['total_reservas'], 2)
+        self.assertGreater(estatisticas.versao(), versao)
+        self.assertIgualAReconstrucao()
+
+    def test_etag_por_item(self):
+        diretor = Usuario.objects.create_user(
+            username='diretor', nusp='1', email='diretor@usp.br', password='x',
+            tipo_acesso=Usuario.TiposAcesso.DIRETORIA,
+        )
+        outro_item = Item.objects.create(nome='Óculos', codigo_tipo='OCU')
+        self.client.force_login(diretor)
+        url = reverse('core:api_estatisticas')
+
+        def etag(**params):
+            resposta = self.client.get(url, params)
+            self.assertEqual(resposta.status_code, 200)
+            return resposta['ETag']
+
+        geral, do_item = etag(), etag(item_id=self.item.id)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=geral).status_code, 304)
+
+        hoje = date.today()
+        Reserva.objects.create(usuario=self.outro, item=outro_item, data_retirada=hoje, data_devolucao=hoje)
+
+        self.assertNotEqual(etag(), geral)
+        self.assertEqual(etag(item_id=self.item.id), do_item)
+        self.assertEqual(
+            self.client.get(url, {'item_id': self.item.id}, HTTP_IF_NONE_MATCH=do_item).status_code, 304,
+        )
+
+    def test_remocao_em_cascata_do_usuario(self):
+        self.aluno.delete()
+
+        resumo = estatisticas.resumo()
+        self.assertEqual(resumo['total_reservas'], 1)
+        self.assertEqual([u['nusp'] for u in resumo['top_usuarios']], ['3'])
+        self.assertIgualAReconstrucao()
+
+
+class EnvioEmailsTests(TestCase):
+    """
+    `manage.py enviar_emails` esvazia a fila de saída.
+    """
+
+    def _enviar(self):
+        call_command('enviar_emails', stdout=io.StringIO())
+
+    def test_envia_a_fila_e_nao_repete(self):
+        for i in range(3):
+            emails.enfileirar(f'aluno{i}@usp.br', 'Reserva confirmada', 'Sua reserva foi confirmada.')
+
+        self._enviar()
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'aluno{i}@usp.br' for i in range(3)])
+        self.assertFalse(EmailPendente.objects.filter(enviado_em__isnull=True).exists())
+
+        self._enviar()
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_falha_fica_para_depois(self):
+        emails.enfileirar('aluno@usp.br', 'Reserva confirmada', 'Sua reserva foi confirmada.')
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('fora do ar')):
+            self._enviar()
+
+        pendente = EmailPendente.objects.get()
+        self.assertIsNone(pendente.enviado_em)
+        self.assertEqual(pendente.tentativas, 1)
+        self.assertGreater(pendente.proxima_tentativa, timezone.now())
+        self.assertEqual(mail.outbox, [])
+
+    def _enviar_com(self, *resultados):
+        conexao = mock.Mock()
+        with mock.patch.object(emails, 'get_connection', return_value=conexao), \
+                mock.patch('django.core.mail.EmailMessage.send', side_effect=resultados):
+            enviados = emails.enviar_pendentes()
+        return conexao, enviados
+
+    def test_recusa_de_destinatario_mantem_a_conexao(self):
+        for i in range(3):
+            emails.enfileirar(f'aluno{i}@usp.br', 'Reserva confirmada', 'Sua reserva foi confirmada.')
+
+        conexao, enviados = self._enviar_com(1, smtplib.SMTPRecipientsRefused({}), 1)
+        self.assertEqual(enviados, (2, 1))
+        self.assertEqual(conexao.open.call_count, 1)
+
+        EmailPendente.objects.update(proxima_tentativa=timezone.now())
+        conexao, enviados = self._enviar_com(smtplib.SMTPServerDisconnected('caiu'))
+        self.assertEqual(enviados, (0, 1))
+        self.assertEqual(conexao.open.call_count, 2)
+
+    def test_queda_no_meio_do_lote_nao_reenvia_os_entregues(self):
+        class Queda(BaseException):
+            pass
+
+        for i in range(2):
+            emails.enfileirar(f'aluno{i}@usp.br', 'Reserva confirmada', 'Sua reserva foi confirmada.')
+
+        with self.assertRaises(Queda):
+            self._enviar_com(1, Queda())
+        self.assertEqual(EmailPendente.objects.filter(enviado_em__isnull=False).count(), 1)
+
+
+class DisponibilidadeTests(TestCase):
+    """
+    A ocupação diária acompanha toda criação, mudança e remoção de reserva.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno', nusp='2', email='aluno@usp.br', password='x')
+        cls.item = Item.objects.create(nome='Calculadora', codigo_tipo='CAL')
+        Exemplar.objects.create(item=cls.item, codigo_exemplar='CAL-1')
+        cls.dia = date.today() + timedelta(days=5)
+
+    def _nova(self, inicio=0, fim=2, usuario=None):
+        return Reserva(
+            usuario=usuario or self.aluno, item=self.item,
+            data_retirada=self.dia + timedelta(days=inicio),
+            data_devolucao=self.dia + timedelta(days=fim),
+        )
+
+    def _ocupacao(self):
+        return dict(OcupacaoDiaria.objects.filter(item=self.item, quantidade__gt=0).values_list('dia', 'quantidade'))
+
+    def _dias(self, inicio, fim, quantidade=1):
+        return {self.dia + timedelta(days=i): quantidade for i in range(inicio, fim + 1)}
+
+    def test_item_lotado_recusa_reserva(self):
+        self.assertTrue(disponibilidade.reservar(self._nova(0, 2)))
+        self.assertFalse(disponibilidade.reservar(self._nova(2, 4)))
+        self.assertTrue(disponibilidade.reservar(self._nova(3, 4)))
+
+        self.assertEqual(Reserva.objects.count(), 2)
+        self.assertEqual(self._ocupacao(), self._dias(0, 4))
+
+    def test_segundo_exemplar_aumenta_a_capacidade(self):
+        Exemplar.objects.create(item=self.item, codigo_exemplar='CAL-2')
+        self.assertTrue(disponibilidade.reservar(self._nova()))
+        self.assertTrue(disponibilidade.reservar(self._nova()))
+        self.assertFalse(disponibilidade.reservar(self._nova()))
+        self.assertEqual(self._ocupacao(), self._dias(0, 2, quantidade=2))
+
+    def test_cancelamento_libera(self):
+        reserva = self._nova()
+        disponibilidade.reservar(reserva)
+        Reserva.objects.get(pk=reserva.pk).marcar_como_cancelada('teste')
+
+        self.assertEqual(self._ocupacao(), {})
+        self.assertTrue(disponibilidade.reservar(self._nova()))
+
+    def test_mudanca_de_status_e_de_datas_pelo_save(self):
+        reserva = self._nova()
+        reserva.save()
+        self.assertEqual(self._ocupacao(), self._dias(0, 2))
+
+        reserva = Reserva.objects.get(pk=reserva.pk)
+        reserva.data_devolucao = self.dia + timedelta(days=3)
+        reserva.save()
+        self.assertEqual(self._ocupacao(), self._dias(0, 3))
+
+        reserva.status = Reserva.Status.CONCLUIDA
+        reserva.save()
+        self.assertEqual(self._ocupacao(), {})
+
+    def test_cancelamento_em_lote(self):
+        for inicio, fim in ((0, 2), (1, 3), (1, 1)):
+            self._nova(inicio, fim).save()
+        confirmada = self._nova(2, 4)
+        confirmada.status = Reserva.Status.CONFIRMADO
+        confirmada.save()
+
+        canceladas = cancelamentos.cancelar_em_lote(Reserva.objects.all(), 'teste', automatico=False)
+
+        self.assertEqual(canceladas, 3)
+        self.assertEqual(Reserva.objects.filter(status=Reserva.Status.CANCELADA).count(), 3)
+        self.assertEqual(self._ocupacao(), self._dias(2, 4))
+        disponibilidade.reconstruir([self.item.id])
+        self.assertEqual(self._ocupacao(), self._dias(2, 4))
+
+    def test_remocao_libera(self):
+        reserva = self._nova()
+        disponibilidade.reservar(reserva)
+        Reserva.objects.only('id').get(pk=reserva.pk).delete()
+        self.assertEqual(self._ocupacao(), {})
+
+    def test_remocao_do_usuario_libera(self):
+        outro = Usuario.objects.create_user(username='outro', nusp='3', email='outro@usp.br', password='x')
+        disponibilidade.reservar(self._nova(usuario=outro))
+        outro.delete()
+        self.assertEqual(self._ocupacao(), {})
+        self.assertTrue(disponibilidade.reservar(self._nova()))
+
+
+class AlocacaoTests(TestCase):
+    """
+    Cada retirada confirmada recebe um exemplar diferente.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gestor = Usuario.objects.create_user(
+            username='gestor', nusp='1', email='gestor@usp.br', password='x',
+            tipo_acesso=Usuario.TiposAcesso.MEMBRO_GESTAO,
+        )
+        cls.item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        cls.primeiro = Exemplar.objects.create(item=cls.item, codigo_exemplar='JAL-1')
+        cls.segundo = Exemplar.objects.create(item=cls.item, codigo_exemplar='JAL-2')
+
+    def _pendente(self):
+        hoje = date.today()
+        return Reserva.objects.create(usuario=self.gestor, item=self.item, data_retirada=hoje, data_devolucao=hoje)
+
+    def test_retiradas_recebem_exemplares_diferentes(self):
+        entregues = [alocacao.confirmar_retirada(self._pendente(), self.gestor) for _ in range(2)]
+        self.assertEqual({e.pk for e in entregues}, {self.primeiro.pk, self.segundo.pk})
+
+        terceira = self._pendente()
+        self.assertIsNone(alocacao.confirmar_retirada(terceira, self.gestor))
+        terceira.refresh_from_db()
+        self.assertEqual(terceira.status, Reserva.Status.PENDENTE)
+
+    def test_exemplar_pego_por_outro_balcao_passa_para_o_proximo(self):
+        original = alocacao._candidato
+
+        def candidato_disputado(item_id, exemplar=None, tentados=()):
+            exemplar_id = original(item_id, exemplar, tentados)
+            if not tentados:
+                # Outro balcão pega o exemplar entre a leitura e o UPDATE.
+                Exemplar.objects.filter(pk=exemplar_id).update(situacao=Exemplar.Situacao.RESERVADO)
+            return exemplar_id
+
+        with mock.patch.object(alocacao, '_candidato', side_effect=candidato_disputado):
+            entregue = alocacao.confirmar_retirada(self._pendente(), self.gestor)
+
+        self.assertEqual(entregue.pk, self.segundo.pk)
+        self.primeiro.refresh_from_db()
+        self.assertEqual(self.primeiro.vezes_retirado, 0)
+
+    def test_mensagem_quando_nao_ha_exemplar_livre(self):
+        Exemplar.objects.update(situacao=Exemplar.Situacao.RESERVADO)
+        reserva = self._pendente()
+        self.client.force_login(self.gestor)
+
+        resposta = self.client.post(reverse('core:confirmar_retirada', args=[reserva.pk]), {'exemplar': ''})
+        self.assertContains(resposta, 'Não há nenhum exemplar disponível deste item no momento.')
+        self.assertNotContains(resposta, 'O exemplar não está mais disponível')
+
+
+@skipUnless(connection.features.has_select_for_update_skip_locked, 'Requer SELECT ... FOR UPDATE SKIP LOCKED.')
+class AlocacaoConcorrenteTests(TransactionTestCase):
+    """
+    Vários balcões confirmando ao mesmo tempo nunca entregam o mesmo exemplar.
+    """
+
+    def test_balcoes_simultaneos(self):
+        gestor = Usuario.objects.create_user(
+            username='gestor', nusp='1', email='gestor@usp.br', password='x',
+            tipo_acesso=Usuario.TiposAcesso.MEMBRO_GESTAO,
+        )
+        item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        for i in range(4):
+            Exemplar.objects.create(item=item, codigo_exemplar=f'JAL-{i}')
+        hoje = date.today()
+        reservas = [
+            Reserva.objects.create(usuario=gestor, item=item, data_retirada=hoje, data_devolucao=hoje)
+            for _ in range(8)
+        ]
+
+        largada = threading.Barrier(len(reservas))
+        entregues = []
+
+        def atender(reserva):
+            try:
+                largada.wait()
+                exemplar = alocacao.confirmar_retirada(reserva, gestor)
+                if exemplar is not None:
+                    entregues.append(exemplar.pk)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=atender, args=(r,)) for r in reservas]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertTrue(entregues)
+        self.assertEqual(len(entregues), len(set(entregues)))
+        confirmadas = Reserva.objects.filter(status=Reserva.Status.CONFIRMADO)
+        self.assertEqual(sorted(confirmadas.values_list('exemplar_id', flat=True)), sorted(entregues))
+
+
+class UsuarioEmCacheTests(TestCase):
+    """
+    Depois da primeira requisição, sessão e usuário logado vêm do cache.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(
+            username='aluno', nusp='2', email='aluno@usp.br', password='x',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+        self.client.get(reverse('core:historico_reservas'))
+
+    def _consultas_de_autenticacao(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('core:historico_reservas'))
+        return [
+            c['sql'] for c in consultas.captured_queries
+            if 'FROM "django_session"' in c['sql'] or 'FROM "core_usuario"' in c['sql']
+        ]
+
+    def test_sem_consulta_de_autenticacao(self):
+        self.assertEqual(self._consultas_de_autenticacao(), [])
+
+    def test_alteracao_do_usuario_invalida_o_cache(self):
+        self.usuario.is_active = False
+        self.usuario.save()
+        resposta = self.client.get(reverse('core:historico_reservas'))
+        self.assertEqual(resposta.status_code, 302)
+
+    def test_troca_de_senha_encerra_a_sessao(self):
+        self.usuario.set_password('nova')
+        self.usuario.save()
+        resposta = self.client.get(reverse('core:historico_reservas'))
+        self.assertRedirects(resposta, f"{reverse('login')}?next={reverse('core:historico_reservas')}")
+
+
+class ServerTimingTests(TestCase):
+    """
+    O Server-Timing só sai com INSTRUMENTACAO_SERVER_TIMING e só para a gestão.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno', nusp='2', email='aluno@usp.br', password='x')
+        cls.membro = Usuario.objects.create_user(
+            username='membro', nusp='3', email='membro@usp.br', password='x',
+            tipo_acesso=Usuario.TiposAcesso.MEMBRO_GESTAO,
+        )
+
+    def _cabecalho(self, usuario=None):
+        # O middleware lê a configuração ao ser montado, na primeira requisição
+        # do client; por isso cada chamada usa um client novo.
+        cliente = self.client_class()
+        if usuario:
+            cliente.force_login(usuario)
+        return cliente.get(reverse('core:historico_reservas')).headers.get('Server-Timing')
+
+    def test_desligado_por_padrao(self):
+        self.assertIsNone(self._cabecalho(self.membro))
+
+    def test_somente_para_a_gestao(self):
+        with self.settings(INSTRUMENTACAO_SERVER_TIMING=True):
+            self.assertIsNone(self._cabecalho())
+            self.assertIsNone(self._cabecalho(self.aluno))
+            self.assertIn('db;dur=', self._cabecalho(self.membro))
+
+
+class AdminReservaTests(TestCase):
+    """
+    Mudanças de status pelo admin passam pelos mesmos serviços das telas da gestão.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(
+            username='admin', nusp='1', email='admin@usp.br', password='x',
+        )
+        cls.item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        cls.exemplar = Exemplar.objects.create(item=cls.item, codigo_exemplar='JAL-1')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        hoje = date.today()
+        self.reserva = Reserva.objects.create(
+            usuario=self.admin, item=self.item, data_retirada=hoje, data_devolucao=hoje,
+        )
+
+    def _alterar(self, status, **campos):
+        dados = {
+            'usuario': self.reserva.usuario_id,
+            'item': self.reserva.item_id,
+            'exemplar': self.reserva.exemplar_id or '',
+            'status': status,
+            'data_retirada': self.reserva.data_retirada.isoformat(),
+            'data_devolucao': self.reserva.data_devolucao.isoformat(),
+            'motivo_cancelamento': '',
+            'observacoes': '',
+            **campos,
+        }
+        resposta = self.client.post(reverse('admin:core_reserva_change', args=[self.reserva.pk]), dados)
+        self.reserva.refresh_from_db()
+        self.exemplar.refresh_from_db()
+        self.item.refresh_from_db()
+        return resposta
+
+    def test_retirada_e_devolucao(self):
+        self._alterar(Reserva.Status.CONFIRMADO)
+        self.assertEqual(self.reserva.exemplar_id, self.exemplar.pk)
+        self.assertEqual(self.reserva.usuario_confirmou_retirada, self.admin)
+        self.assertEqual(self.exemplar.situacao, Exemplar.Situacao.RESERVADO)
+        self.assertEqual(self.item.reservados, 1)
+
+        self._alterar(Reserva.Status.CONCLUIDA)
+        self.assertEqual(self.reserva.usuario_confirmou_devolucao, self.admin)
+        self.assertEqual(self.exemplar.situacao, Exemplar.Situacao.DISPONIVEL)
+        self.assertEqual(self.item.disponiveis, 1)
+        self.assertFalse(OcupacaoDiaria.objects.filter(quantidade__gt=0).exists())
+
+    def test_cancelamento_libera_o_exemplar(self):
+        self._alterar(Reserva.Status.CONFIRMADO)
+        self._alterar(Reserva.Status.CANCELADA)
+        self.assertEqual(self.reserva.status, Reserva.Status.CANCELADA)
+        self.assertEqual(self.reserva.usuario_cancelou, self.admin)
+        self.assertEqual(self.exemplar.situacao, Exemplar.Situacao.DISPONIVEL)
+        self.assertEqual(self.item.disponiveis, 1)
+
+    def test_transicao_invalida(self):
+        resposta = self._alterar(Reserva.Status.CONCLUIDA)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(self.reserva.status, Reserva.Status.PENDENTE)
+
+    def test_cancelamento_em_lote_libera_exemplar_separado(self):
+        Reserva.objects.filter(pk=self.reserva.pk).update(exemplar=self.exemplar)
+        self.exemplar.situacao = Exemplar.Situacao.RESERVADO
+        self.exemplar.save()
+
+        self.client.post(reverse('admin:core_reserva_changelist'), {
+            'action': 'cancelar_reservas',
+            '_selected_action': [self.reserva.pk],
+        })
+        self.reserva.refresh_from_db()
+        self.exemplar.refresh_from_db()
+        self.item.refresh_from_db()
+        self.assertEqual(self.reserva.status, Reserva.Status.CANCELADA)
+        self.assertEqual(self.exemplar.situacao, Exemplar.Situacao.DISPONIVEL)
+        self.assertEqual(self.item.disponiveis, 1)
+
+
+class ConsistenciaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.aluno = Usuario.objects.create_user(username='aluno', nusp='2', email='aluno@usp.br', password='x')
+        cls.item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        cls.solto = Exemplar.objects.create(item=cls.item, codigo_exemplar='JAL-1')
+        cls.emprestado = Exemplar.objects.create(item=cls.item, codigo_exemplar='JAL-2')
+        hoje = date.today()
+        Reserva.objects.create(
+            usuario=cls.aluno, item=cls.item, exemplar=cls.emprestado, status=Reserva.Status.CONFIRMADO,
+            data_retirada=hoje, data_devolucao=hoje,
+        )
+        # Situações trocadas, sem passar pelos contadores.
+        Exemplar.objects.filter(pk=cls.solto.pk).update(situacao=Exemplar.Situacao.RESERVADO)
+
+    def test_corrige_e_reconta(self):
+        self.assertEqual(consistencia.corrigir(simular=True), {
+            'reservas_duplicadas': [],
+            'confirmadas_com_exemplar_disponivel': [self.emprestado.pk],
+            'reservados_sem_reserva_ativa': [self.solto.pk],
+        })
+        consistencia.corrigir()
+
+        self.assertEqual(
+            dict(Exemplar.objects.values_list('pk', 'situacao')),
+            {self.solto.pk: Exemplar.Situacao.DISPONIVEL, self.emprestado.pk: Exemplar.Situacao.RESERVADO},
+        )
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.disponiveis, self.item.reservados), (1, 1))
+        self.assertEqual(consistencia.corrigir(simular=True), {tipo: [] for tipo in consistencia.TIPOS})
+
+
+class ExportacaoHistoricoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.diretor = Usuario.objects.create_user(
+            username='diretor', nusp='1', email='diretor@usp.br', password='x',
+            tipo_acesso=Usuario.TiposAcesso.DIRETORIA,
+        )
+        cls.aluno = Usuario.objects.create_user(
+            username='aluno', nusp='222', email='aluno@usp.br', password='x',
+            first_name='=HYPERLINK("http://exemplo.com")',
+        )
+        jaleco = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        oculos = Item.objects.create(nome='@Óculos', codigo_tipo='OCU')
+        hoje = date.today()
+        cls.reserva_jaleco = Reserva.objects.create(
+            usuario=cls.aluno, item=jaleco, data_retirada=hoje, data_devolucao=hoje,
+        )
+        cls.reserva_oculos = Reserva.objects.create(
+            usuario=cls.diretor, item=oculos, data_retirada=hoje, data_devolucao=hoje,
+        )
+        cls.reserva_oculos.marcar_como_cancelada(motivo='-1+1', usuario=cls.diretor)
+
+    def _exportar(self, filtros=None, como=None):
+        self.client.force_login(como or self.diretor)
+        resposta = self.client.get(reverse('core:exportar_historico_reservas'), filtros or {})
+        if resposta.status_code != 200:
+            return resposta, None
+        conteudo = b''.join(resposta.streaming_content).decode('utf-8')
+        return resposta, conteudo
+
+    def _linhas(self, conteudo):
+        return list(csv.reader(io.StringIO(conteudo.removeprefix(exportacao.BOM)), delimiter=';'))
+
+    def test_bom_cabecalho_e_colunas(self):
+        resposta, conteudo = self._exportar()
+        self.assertEqual(resposta['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertTrue(conteudo.startswith(exportacao.BOM))
+
+        cabecalho, *linhas = self._linhas(conteudo)
+        self.assertEqual(tuple(cabecalho), exportacao.CABECALHO)
+        self.assertEqual([int(linha[0]) for linha in linhas], [self.reserva_oculos.pk, self.reserva_jaleco.pk])
+        colunas = dict(zip(cabecalho, linhas[1]))
+        self.assertEqual(colunas['Código do item'], 'JAL')
+        self.assertEqual(colunas['NUSP'], '222')
+        self.assertEqual(colunas['Status'], 'Pendente')
+
+    def test_celulas_que_parecem_formula_viram_texto(self):
+        _, conteudo = self._exportar()
+        cabecalho, *linhas = self._linhas(conteudo)
+        oculos, jaleco = (dict(zip(cabecalho, linha)) for linha in linhas)
+        self.assertEqual(jaleco['Usuário'], '\'=HYPERLINK("http://exemplo.com")')
+        self.assertEqual(oculos['Item'], "'@Óculos")
+        self.assertEqual(oculos['Motivo do cancelamento'], "'-1+1")
+
+    def test_filtros_da_pagina(self):
+        for filtros, esperadas in (
+            ({'status': Reserva.Status.CANCELADA}, [self.reserva_oculos.pk]),
+            ({'usuario': '222'}, [self.reserva_jaleco.pk]),
+            ({'item': 'OCU'}, [self.reserva_oculos.pk]),
+        ):
+            with self.subTest(filtros=filtros):
+                _, conteudo = self._exportar(filtros)
+                _, *linhas = self._linhas(conteudo)
+                self.assertEqual([int(linha[0]) for linha in linhas], esperadas)
+
+    def test_somente_diretoria(self):
+        membro = Usuario.objects.create_user(
+            username='membro', nusp='3', email='membro@usp.br', password='x',
+            tipo_acesso=Usuario.TiposAcesso.MEMBRO_GESTAO,
+        )
+        for usuario in (self.aluno, membro):
+            resposta, _ = self._exportar(como=usuario)
+            self.assertEqual(resposta.status_code, 403)
+
+
+class MiniaturasTests(TestCase):
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = override_settings(MEDIA_ROOT=pasta.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def _imagem(self, nome, tamanho=(300, 200)):
+        conteudo = io.BytesIO()
+        Image.new('RGB', tamanho, 'red').save(conteudo, 'PNG')
+        return SimpleUploadedFile(nome, conteudo.getvalue(), content_type='image/png')
+
+    def test_gera_miniaturas(self):
+        item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL', imagem=self._imagem('jaleco.png'))
+        item.refresh_from_db()
+
+        self.assertEqual((item.imagem_largura, item.imagem_altura), (300, 200))
+        for campo, lado in (('miniatura', miniaturas.TAMANHO), ('miniatura_2x', 2 * miniaturas.TAMANHO)):
+            with getattr(item, campo).open('rb') as arquivo, Image.open(arquivo) as miniatura:
+                self.assertEqual(miniatura.size, (lado, lado))
+
+    def test_imagem_ilegivel_fica_sem_miniatura(self):
+        item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL', imagem=self._imagem('jaleco.png'))
+        antigas = [item.miniatura.name, item.miniatura_2x.name]
+
+        item.imagem = SimpleUploadedFile('quebrada.png', b'nada de png aqui')
+        with self.assertLogs('core.miniaturas', 'WARNING'):
+            item.save()
+        item.refresh_from_db()
+
+        self.assertFalse(item.miniatura)
+        self.assertIsNone(item.imagem_largura)
+        self.assertFalse(any(item.imagem.storage.exists(nome) for nome in antigas))
+
+    def test_imagem_grande_demais(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100), self.assertLogs('core.miniaturas', 'WARNING'):
+            item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL', imagem=self._imagem('jaleco.png'))
+        item.refresh_from_db()
+        self.assertTrue(item.imagem)
+        self.assertFalse(item.miniatura)
+
+    def test_troca_de_imagem_apaga_miniaturas_antigas(self):
+        item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL', imagem=self._imagem('jaleco.png'))
+        antigas = [item.miniatura.name, item.miniatura_2x.name]
+
+        item.imagem = self._imagem('jaleco-novo.png')
+        item.save()
+
+        storage = item.imagem.storage
+        self.assertFalse(any(storage.exists(nome) for nome in antigas))
+        self.assertTrue(storage.exists(item.miniatura.name))
+        self.assertTrue(storage.exists(item.miniatura_2x.name))
+
+
+class LembretesTests(TestCase):
+    """
+    Um aviso por usuário, com limite por execução e sem repetir no mesmo dia.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hoje = date(2025, 3, 10)
+        cls.item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        cls.alunos = [
+            Usuario.objects.create_user(username=f'aluno{i}', nusp=str(i), email=f'aluno{i}@usp.br', password='x')
+            for i in range(3)
+        ]
+        for aluno in cls.alunos:
+            for devolucao in (cls.hoje - timedelta(days=2), cls.hoje + timedelta(days=1)):
+                Reserva.objects.create(
+                    usuario=aluno, item=cls.item, status=Reserva.Status.CONFIRMADO,
+                    data_retirada=cls.hoje - timedelta(days=5), data_devolucao=devolucao,
+                )
+        # Vence depois de amanhã: ainda não recebe lembrete.
+        Reserva.objects.create(
+            usuario=cls.alunos[0], item=cls.item, status=Reserva.Status.CONFIRMADO,
+            data_retirada=cls.hoje, data_devolucao=cls.hoje + timedelta(days=2),
+        )
+
+    def test_atrasadas(self):
+        self.assertEqual(lembretes.reservas_atrasadas(self.hoje).count(), 3)
+
+    def test_um_aviso_por_usuario(self):
+        self.assertEqual(lembretes.enviar_lembretes(hoje=self.hoje), (3, 6))
+
+        avisos = EmailPendente.objects.order_by('destinatario')
+        self.assertEqual([a.destinatario for a in avisos], [a.email for a in self.alunos])
+        self.assertEqual(avisos[0].assunto, 'Devolução atrasada no TEM NO CAM')
+        self.assertIn('já deveriam ter sido devolvidos', avisos[0].mensagem)
+        self.assertIn('devem ser devolvidos amanhã', avisos[0].mensagem)
+
+    def test_limite_por_execucao_e_sem_repetir(self):
+        self.assertEqual(lembretes.enviar_lembretes(limite=2, hoje=self.hoje), (2, 4))
+        self.assertEqual(lembretes.enviar_lembretes(limite=2, hoje=self.hoje), (1, 2))
+        self.assertEqual(lembretes.enviar_lembretes(limite=2, hoje=self.hoje), (0, 0))
+
+        self.assertEqual(EmailPendente.objects.count(), 3)
+        self.assertEqual(Reserva.objects.filter(ultimo_lembrete_em=self.hoje).count(), 6)
+
+
+class InstrumentacaoTests(TestCase):
+    """
+    Medição por requisição, inclusive das respostas em streaming, e a página
+    /gestao/desempenho/.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.diretor = Usuario.objects.create_user(
+            username='diretor', nusp='1', email='diretor@usp.br', password='x',
+            tipo_acesso=Usuario.TiposAcesso.DIRETORIA,
+        )
+        item = Item.objects.create(nome='Jaleco', codigo_tipo='JAL')
+        hoje = date.today()
+        Reserva.objects.create(usuario=cls.diretor, item=item, data_retirada=hoje, data_devolucao=hoje)
+
+    def setUp(self):
+        instrumentacao.historico.limpar()
+        self.addCleanup(instrumentacao.historico.limpar)
+        self.client.force_login(self.diretor)
+
+    def _registros(self, caminho):
+        return [r for r in instrumentacao.historico.registros() if r.caminho == caminho]
+
+    def test_streaming_medido_ate_o_fim_do_corpo(self):
+        url = reverse('core:exportar_historico_reservas')
+        resposta = self.client.get(url)
+        self.assertEqual(self._registros(url), [])
+
+        with CaptureQueriesContext(connection) as consultas:
+            b''.join(resposta.streaming_content)
+        self.assertTrue(consultas.captured_queries)
+
+        registro, = self._registros(url)
+        self.assertGreaterEqual(registro.consultas, len(consultas.captured_queries))
+        self.assertEqual(registro.status, 200)
+
+    def test_aviso_de_n_mais_1(self):
+        def view(request):
+            for _ in range(settings.INSTRUMENTACAO_LIMITE_REPETICOES + 1):
+                Item.objects.first()
+            return HttpResponse()
+
+        middleware = instrumentacao.InstrumentacaoMiddleware(view)
+        with self.assertLogs('core.instrumentacao', 'WARNING') as logs:
+            middleware(RequestFactory().get('/itens/'))
+        self.assertIn('possível N+1', logs.output[0])
+        self.assertGreater(self._registros('/itens/')[0].maior_repeticao, middleware.limite)
+
+    def test_pagina_de_desempenho(self):
+        self.client.get(reverse('core:historico_reservas'))
+        resposta = self.client.get(reverse('core:desempenho'))
+        self.assertContains(resposta, reverse('core:historico_reservas'))
+
+        self.client.post(reverse('core:desempenho'))
+        self.assertEqual(
+            [r.caminho for r in instrumentacao.historico.registros()],
+            [reverse('core:desempenho')],
+        )
+
+    def test_desempenho_somente_diretoria(self):
+        aluno = Usuario.objects.create_user(username='aluno', nusp='2', email='aluno@usp.br', password='x')
+        self.client.force_login(aluno)
+        self.assertEqual(self.client.get(reverse('core:desempenho')).status_code, 403)
+
+
+class ResolvedorLogosTests(TestCase):
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = Path(pasta.name)
+        for nome in ('7.svg', '7.png', 'jaleco.jpg', 'oculos-de-protecao-amarelo.webp', 'leia-me.txt'):
+            (self.pasta / nome).touch()
+        self.resolvedor = logos.ResolvedorLogos(self.pasta)
+        self.resolvedor.carregar()
+
+    def test_nome_exato_e_prefixo(self):
+        self.assertEqual(self.resolvedor.resolver(Item(id=7, nome='Jaleco')), '7.png')
+        self.assertEqual(self.resolvedor.resolver(Item(id=1, nome='Jaleco')), 'jaleco.jpg')
+        self.assertEqual(
+            self.resolvedor.resolver(Item(id=2, nome='Óculos de proteção')),
+            'oculos-de-protecao-amarelo.webp',
+        )
+        self.assertIsNone(self.resolvedor.resolver(Item(id=3, nome='Calculadora')))
+
+    def test_arquivo_novo_depois_que_a_pasta_muda(self):
+        calculadora = Item(id=3, nome='Calculadora')
+        self.assertIsNone(self.resolvedor.resolver(calculadora))
+        (self.pasta / 'calculadora.png').touch()
+        # Garante uma data de modificação diferente mesmo em sistemas de
+        # arquivos com resolução grosseira.
+        versao = self.pasta.stat().st_mtime_ns + 10 ** 9
+        os.utime(self.pasta, ns=(versao, versao))
+
+        self.resolvedor.carregar()
+        self.assertEqual(self.resolvedor.resolver(calculadora), 'calculadora.png')
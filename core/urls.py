@@ -25,6 +25,8 @@ urlpatterns = [
     path("estatisticas/api/", views.api_estatisticas, name="api_estatisticas"),
     path('conta/editar/', views.editar_conta, name='editar_conta'),
     path('gestao/reservas/historico-completo/', views.historico_reservas_completo, name='historico_reservas_completo'),
+    path('gestao/reservas/historico-completo/exportar/', views.exportar_historico_reservas, name='exportar_historico_reservas'),
+    path('gestao/desempenho/', views.desempenho, name='desempenho'),
     
     path('ativar-conta/<slug:uidb64>/<slug:token>/', views.ativar_conta, name='ativar_conta'),
 
@@ -1,6 +1,5 @@
-from datetime import timedelta
-from django.db.models import Count, Q
-from django.db.models.functions import TruncDate, TruncMonth
+from django.db import transaction
+from django.db.models import Q
 
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
@@ -10,19 +9,23 @@ from django.contrib import messages
 from .models import Item, Reserva, Exemplar
 from .forms import ReservaForm, ReservaRetiradaForm, DevolucaoForm, PublicSignupForm, UsuarioTipoAcessoForm, UsuarioUpdateForm, RetiradaManualForm, NovoItemForm, NovoExemplarForm
 from .decorators import gestao_required, diretoria_required
+from . import alocacao, busca, cancelamentos, disponibilidade, estatisticas, exportacao, instrumentacao
+from .emails import enfileirar
+from .lembretes import reservas_atrasadas
+from .logos import anotar_logos
+from .paginacao import contagem_em_cache, paginar_por_cursor
+from django.views.decorators.cache import cache_control
 from django.views.decorators.http import require_GET
 
-from django.http import JsonResponse
-from django.db.models.functions import TruncDate, TruncMonth
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
 
-from django.core.mail import send_mail
 from django.urls import reverse
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag, urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import default_token_generator
-from django.conf import settings
-from django.utils.text import slugify
-from pathlib import Path
 import json
 
 
@@ -38,59 +41,9 @@ def home(request):
 @login_required
 def lista_itens(request):
 
-    itens = (
-        Item.objects
-        .annotate(
-            total_exemplares=Count('exemplares'),
-            disponiveis=Count(
-                'exemplares',
-                filter=Q(exemplares__situacao=Exemplar.Situacao.DISPONIVEL)
-            ),
-            reservados=Count(
-                'exemplares',
-                filter=Q(exemplares__situacao=Exemplar.Situacao.RESERVADO)
-            ),
-            em_manutencao=Count(
-                'exemplares',
-                filter=Q(exemplares__situacao=Exemplar.Situacao.EM_MANUTENCAO)
-            ),
-        )
-        .order_by('nome')
-    )
+    itens = Item.objects.order_by('nome')
 
-    try:
-        logos_dir = Path(settings.BASE_DIR) / 'static' / 'core' / 'logos'
-        available = {f.name for f in logos_dir.iterdir() if f.is_file()} if logos_dir.exists() else set()
-    except Exception:
-        available = set()
-
-    exts = ['png', 'jpg', 'jpeg', 'svg', 'webp']
-
-    itens_list = list(itens)
-    for item in itens_list:
-        item.logo_filename = None
-        for ext in exts:
-            candidate = f"{item.id}.{ext}"
-            if candidate in available:
-                item.logo_filename = candidate
-                break
-        if item.logo_filename:
-            continue
-
-        slug = slugify(item.nome or '')
-        for ext in exts:
-            candidate = f"{slug}.{ext}"
-            if candidate in available:
-                item.logo_filename = candidate
-                break
-        if item.logo_filename:
-            continue
-
-        if slug:
-            for fname in available:
-                if fname.startswith(slug):
-                    item.logo_filename = fname
-                    break
+    itens_list = anotar_logos(list(itens))
 
     return render(request, 'core/lista_itens.html', {'itens': itens_list})
 
@@ -135,8 +88,12 @@ def reservar_item(request, item_id):
 
             if not erros:
                 reserva.status = Reserva.Status.PENDENTE
-                reserva.save()
-                return redirect('core:historico_reservas')
+                if disponibilidade.reservar(reserva):
+                    return redirect('core:historico_reservas')
+                form.add_error(
+                    None,
+                    'Não há exemplares disponíveis para todo o período escolhido. Tente outras datas.'
+                )
     else:
         form = ReservaForm()
 
@@ -152,9 +109,9 @@ def historico_reservas(request):
 
     reservas = (Reserva.objects
                 .filter(usuario=request.user)
-                .select_related('item')
-                .order_by('-data_reserva'))
-    return render(request, 'core/historico_reservas.html', {'reservas': reservas})
+                .select_related('item'))
+    pagina = paginar_por_cursor(reservas, request, ('-data_reserva', '-id'))
+    return render(request, 'core/historico_reservas.html', {'reservas': pagina, 'pagina': pagina})
 
 
 @login_required
@@ -169,12 +126,7 @@ def cancelar_reserva_usuario(request, reserva_id):
         messages.warning(request, 'Só é possível cancelar reservas que ainda não foram confirmadas.')
         return redirect('core:historico_reservas')
 
-    exemplar = reserva.exemplar
-    if exemplar is not None and exemplar.situacao == Exemplar.Situacao.RESERVADO:
-        exemplar.situacao = Exemplar.Situacao.DISPONIVEL
-        exemplar.save()
-
-    reserva.marcar_como_cancelada(motivo='Cancelada pelo usuário.', automatico=False, usuario=request.user)
+    cancelamentos.cancelar(reserva, motivo='Cancelada pelo usuário.', usuario=request.user)
     messages.success(request, 'Reserva cancelada com sucesso.')
     return redirect('core:historico_reservas')
 
@@ -193,26 +145,17 @@ def reservas_pendentes(request):
                 .filter(status=Reserva.Status.PENDENTE)
                 .select_related('usuario', 'item'))
 
+    # Com busca, as mais parecidas com o termo vêm primeiro.
+    ordem = ('-data_reserva', '-id')
     if q:
-        from django.db.models import Q
-        filtros = (
-            Q(usuario__nusp__icontains=q) |
-            Q(usuario__username__icontains=q) |
-            Q(usuario__email__icontains=q) |
-            Q(usuario__first_name__icontains=q) |
-            Q(usuario__last_name__icontains=q) |
-            Q(item__codigo_tipo__icontains=q) |
-            Q(item__nome__icontains=q)
-        )
-        if q.isdigit():
-            filtros = filtros | Q(id=int(q))
+        reservas = busca.ranquear(reservas, q)
+        ordem = ('-relevancia', *ordem)
 
-        reservas = reservas.filter(filtros)
-
-    reservas = reservas.order_by('-data_reserva')
+    pagina = paginar_por_cursor(reservas, request, ordem)
 
     contexto = {
-        'reservas': reservas,
+        'reservas': pagina,
+        'pagina': pagina,
         'q': q,
     }
     return render(request, 'core/reservas_pendentes.html', contexto)
@@ -221,7 +164,7 @@ def reservas_pendentes(request):
 @gestao_required
 def confirmar_retirada(request, reserva_id):
 
-    reserva = get_object_or_404(Reserva, pk=reserva_id)
+    reserva = get_object_or_404(Reserva.objects.select_related('usuario', 'item'), pk=reserva_id)
 
     if reserva.status != Reserva.Status.PENDENTE:
         return redirect('core:reservas_pendentes')
@@ -229,18 +172,22 @@ def confirmar_retirada(request, reserva_id):
     if request.method == 'POST':
         form = ReservaRetiradaForm(request.POST, item=reserva.item)
         if form.is_valid():
-            exemplar = form.cleaned_data['exemplar']
-
-            reserva.exemplar = exemplar
-            reserva.status = Reserva.Status.CONFIRMADO
-            reserva.usuario_confirmou_retirada = request.user
-            reserva.data_confirmou_retirada = timezone.now()
-            reserva.save()
-
-            exemplar.situacao = Exemplar.Situacao.RESERVADO
-            exemplar.save()
-
-            return redirect('core:reservas_ativas')
+            # Sem exemplar escolhido, entrega o menos usado.
+            escolhido = form.cleaned_data.get('exemplar')
+            exemplar = alocacao.confirmar_retirada(reserva, request.user, exemplar=escolhido)
+            if exemplar is not None:
+                messages.success(request, f'Retirada confirmada com o exemplar {exemplar.codigo_exemplar}.')
+                return redirect('core:reservas_ativas')
+
+            reserva.refresh_from_db()
+            if reserva.status != Reserva.Status.PENDENTE:
+                messages.warning(request, 'Esta reserva já foi atendida ou cancelada por outra pessoa.')
+                return redirect('core:reservas_pendentes')
+
+            if escolhido is not None:
+                form.add_error(None, 'O exemplar não está mais disponível. Escolha outro ou use a entrega automática.')
+            else:
+                form.add_error(None, 'Não há nenhum exemplar disponível deste item no momento.')
     else:
         form = ReservaRetiradaForm(item=reserva.item)
 
@@ -261,17 +208,7 @@ def cancelar_reserva(request, reserva_id):
     reserva = get_object_or_404(Reserva, pk=reserva_id)
 
     if reserva.status == Reserva.Status.PENDENTE:
-
-        exemplar = reserva.exemplar
-        if exemplar is not None and exemplar.situacao == Exemplar.Situacao.RESERVADO:
-            exemplar.situacao = Exemplar.Situacao.DISPONIVEL
-            exemplar.save()
-
-        reserva.marcar_como_cancelada(
-            motivo="Reserva cancelada pela gestão.",
-            automatico=False,
-            usuario=request.user
-        )
+        cancelamentos.cancelar(reserva, motivo="Reserva cancelada pela gestão.", usuario=request.user)
 
     return redirect('core:reservas_pendentes')
 
@@ -280,31 +217,27 @@ def cancelar_reserva(request, reserva_id):
 def reservas_ativas(request):
 
     q = request.GET.get('q', '').strip()
-    reservas = (Reserva.objects
-                .filter(status=Reserva.Status.CONFIRMADO)
-                .select_related('usuario', 'item'))
+    atrasadas = request.GET.get('atrasadas') == '1'
 
-    if q:
-        from django.db.models import Q
-        filtros = (
-            Q(usuario__nusp__icontains=q) |
-            Q(usuario__username__icontains=q) |
-            Q(usuario__email__icontains=q) |
-            Q(usuario__first_name__icontains=q) |
-            Q(usuario__last_name__icontains=q) |
-            Q(item__codigo_tipo__icontains=q) |
-            Q(item__nome__icontains=q)
-        )
-        if q.isdigit():
-            filtros = filtros | Q(id=int(q))
+    if atrasadas:
+        reservas = reservas_atrasadas()
+    else:
+        reservas = Reserva.objects.filter(status=Reserva.Status.CONFIRMADO)
+    reservas = reservas.select_related('usuario', 'item')
 
-        reservas = reservas.filter(filtros)
+    ordem = ('-data_retirada', '-id')
+    if q:
+        reservas = busca.ranquear(reservas, q)
+        ordem = ('-relevancia', *ordem)
 
-    reservas = reservas.order_by('-data_retirada')
+    pagina = paginar_por_cursor(reservas, request, ordem)
 
     return render(request, 'core/reservas_ativas.html', {
-        'reservas': reservas,
+        'reservas': pagina,
+        'pagina': pagina,
         'q': q,
+        'atrasadas': atrasadas,
+        'hoje': timezone.localdate(),
     })
 
 
@@ -312,7 +245,7 @@ def reservas_ativas(request):
 @gestao_required
 def confirmar_devolucao(request, reserva_id):
 
-    reserva = get_object_or_404(Reserva, pk=reserva_id)
+    reserva = get_object_or_404(Reserva.objects.select_related('usuario', 'item', 'exemplar'), pk=reserva_id)
 
     if reserva.status != Reserva.Status.CONFIRMADO:
         return redirect('core:reservas_ativas')
@@ -320,24 +253,7 @@ def confirmar_devolucao(request, reserva_id):
     if request.method == 'POST':
         form = DevolucaoForm(request.POST)
         if form.is_valid():
-            nova_condicao = form.cleaned_data['condicao']
-            exemplar = reserva.exemplar
-
-            if exemplar is not None:
-                exemplar.condicao = nova_condicao
-
-                if nova_condicao == Exemplar.Condicao.BOM:
-                    exemplar.situacao = Exemplar.Situacao.DISPONIVEL
-                else:
-                    exemplar.situacao = Exemplar.Situacao.EM_MANUTENCAO
-
-                exemplar.save()
-
-            reserva.status = Reserva.Status.CONCLUIDA
-            reserva.usuario_confirmou_devolucao = request.user
-            reserva.data_confirmou_devolucao = timezone.now()
-            reserva.save()
-
+            alocacao.confirmar_devolucao(reserva, request.user, form.cleaned_data['condicao'])
             return redirect('core:reservas_ativas')
     else:
         form = DevolucaoForm()
@@ -350,7 +266,8 @@ def confirmar_devolucao(request, reserva_id):
 
 def enviar_email_ativacao(user, request):
     """
-    Envia um e-mail com link para ativar a conta do usuário.
+    Coloca na fila de saída um e-mail com link para ativar a conta do usuário.
+    O envio em si é feito por `manage.py enviar_emails`.
     """
     uid = urlsafe_base64_encode(force_bytes(user.pk))
     token = default_token_generator.make_token(user)
@@ -368,12 +285,7 @@ def enviar_email_ativacao(user, request):
         "Se você não solicitou este cadastro, ignore este e-mail."
     )
 
-    send_mail(
-        assunto,
-        mensagem,
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-    )
+    enfileirar(user.email, assunto, mensagem)
 
 
 
@@ -383,7 +295,7 @@ def signup(request):
     Agora:
     - só permite e-mail @usp.br (validado no formulário)
     - cria o usuário inativo
-    - envia e-mail com link para ativar a conta
+    - enfileira e-mail com link para ativar a conta (enviado por `manage.py enviar_emails`)
     """
     if request.user.is_authenticated:
         return redirect('core:home')
@@ -394,9 +306,9 @@ def signup(request):
             user = form.save(commit=False)
             user.tipo_acesso = 'Aluno'
             user.is_active = False
-            user.save()
-
-            enviar_email_ativacao(user, request)
+            with transaction.atomic():
+                user.save()
+                enviar_email_ativacao(user, request)
 
             return render(request, 'registration/aguarde_ativacao.html', {
                 'email': user.email,
@@ -435,7 +347,6 @@ def lista_usuarios(request):
     q = request.GET.get('q', '').strip()
     usuarios = User.objects.all()
     if q:
-        from django.db.models import Q
         usuarios = usuarios.filter(
             Q(nusp__icontains=q) |
             Q(username__icontains=q) |
@@ -444,92 +355,65 @@ def lista_usuarios(request):
             Q(last_name__icontains=q)
         )
 
-    usuarios = usuarios.order_by('nusp')
+    pagina = paginar_por_cursor(usuarios, request, ('nusp',))
 
     return render(request, 'core/lista_usuarios.html', {
-        'usuarios': usuarios,
+        'usuarios': pagina,
+        'pagina': pagina,
         'q': q,
     })
 
 
 @login_required
 @diretoria_required
+@cache_control(private=True, no_cache=True)
 def api_estatisticas(request):
     """
     API que retorna dados agregados de reservas em JSON.
     Será consumida pelo frontend Vue.
+
+    A resposta depende só da versão das estatísticas e do filtro: o navegador
+    revalida com If-None-Match e recebe 304 enquanto nada mudou, e o JSON
+    montado fica em cache com a versão na chave (nada a invalidar).
     """
-    item_id = request.GET.get('item_id')
+    item_id = request.GET.get('item_id') or None
+    versao = estatisticas.versao(item_id)
+    etag = quote_etag(f'{versao}-{item_id or ""}')
 
-    reservas = Reserva.objects.all()
-    if item_id:
-        reservas = reservas.filter(item_id=item_id)
-
-    # Reservas por dia
-    reservas_por_dia_qs = (
-        reservas
-        .annotate(dia=TruncDate('data_reserva'))
-        .values('dia')
-        .annotate(total=Count('id'))
-        .order_by('dia')
-    )
-    reservas_por_dia = [
-        {"dia": r["dia"].strftime("%Y-%m-%d"), "total": r["total"]}
-        for r in reservas_por_dia_qs
-    ]
+    resposta = get_conditional_response(request, etag=etag)
+    if resposta is None:
+        chave_cache = f'api_estatisticas:{versao}:{item_id or ""}'
+        data = cache.get(chave_cache)
+        if data is None:
+            # Tudo vem das tabelas pré-agregadas (core.estatisticas).
+            data = estatisticas.resumo(item_id)
+            cache.set(chave_cache, data, 60 * 60)
+        resposta = JsonResponse(data)
 
-    # Top 10 itens
-    top_items_qs = (
-        reservas
-        .values('item__nome', 'item__codigo_tipo')
-        .annotate(total=Count('id'))
-        .order_by('-total')[:10]
-    )
-    top_items = [
-        {
-            "item": f"{r['item__codigo_tipo']} - {r['item__nome']}",
-            "total": r["total"],
-        }
-        for r in top_items_qs
-    ]
+    resposta.headers.setdefault('ETag', etag)
+    return resposta
 
-    # Reservas por mês
-    reservas_mes_qs = (
-        reservas
-        .annotate(mes=TruncMonth('data_reserva'))
-        .values('mes')
-        .annotate(total=Count('id'))
-        .order_by('mes')
-    )
-    reservas_por_mes = [
-        {"mes": r["mes"].strftime("%Y-%m"), "total": r["total"]}
-        for r in reservas_mes_qs
-    ]
 
-    # Top usuários - forma alternativa
-    top_usuarios_qs = (
-        User.objects
-        .annotate(total_reservas=Count('reservas'))
-        .filter(total_reservas__gt=0)
-        .order_by('-total_reservas')[:10]
-    )
-    top_usuarios = [
-        {
-            "nusp": u.nusp,
-            "nome": u.get_full_name() or u.username or u.nusp,
-            "total": u.total_reservas,
-        }
-        for u in top_usuarios_qs
-    ]
+def _filtrar_historico_completo(request):
+    """
+    Filtros de status, NUSP e código do item do histórico completo (página e exportação).
+    """
+    status_filtro = request.GET.get('status', '')
+    usuario_filtro = request.GET.get('usuario', '')
+    item_filtro = request.GET.get('item', '')
+
+    reservas = Reserva.objects.all()
+    if status_filtro:
+        reservas = reservas.filter(status=status_filtro)
+    # O índice de busca (core.busca) acha as candidatas sem varrer a tabela;
+    # o icontains confirma que o termo está no NUSP/código, e não em outro campo.
+    if usuario_filtro:
+        reservas = busca.filtrar(reservas, usuario_filtro).filter(usuario__nusp__icontains=usuario_filtro)
+    if item_filtro:
+        reservas = busca.filtrar(reservas, item_filtro).filter(item__codigo_tipo__icontains=item_filtro)
+
+    return status_filtro, usuario_filtro, item_filtro, reservas
 
-    data = {
-        "total_reservas": reservas.count(),
-        "reservas_por_dia": reservas_por_dia,
-        "top_itens": top_items,
-        "reservas_por_mes": reservas_por_mes,
-        "top_usuarios": top_usuarios,
-    }
-    return JsonResponse(data)
 
 @login_required
 @diretoria_required
@@ -538,40 +422,48 @@ def historico_reservas_completo(request):
     Página para diretoria visualizar o histórico completo de todas as reservas
     com dados de confirmação (quem confirmou retirada/devolução e quando).
     """
-    from django.core.paginator import Paginator
-    
-    status_filtro = request.GET.get('status', '')
-    usuario_filtro = request.GET.get('usuario', '')
-    item_filtro = request.GET.get('item', '')
-    
-    reservas = Reserva.objects.select_related(
+    status_filtro, usuario_filtro, item_filtro, reservas = _filtrar_historico_completo(request)
+    reservas = reservas.select_related(
         'usuario', 'item', 'exemplar',
         'usuario_confirmou_retirada',
-        'usuario_confirmou_devolucao'
-    ).order_by('-data_reserva')
-    
-    if status_filtro:
-        reservas = reservas.filter(status=status_filtro)
-    if usuario_filtro:
-        reservas = reservas.filter(usuario__nusp__icontains=usuario_filtro)
-    if item_filtro:
-        reservas = reservas.filter(item__codigo_tipo__icontains=item_filtro)
-    
-    paginator = Paginator(reservas, 20)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
-    
+        'usuario_confirmou_devolucao',
+        'usuario_cancelou',
+    )
+
+    # Sem OFFSET nem COUNT por página: o total vem do cache e é atualizado em segundo plano.
+    pagina = paginar_por_cursor(reservas, request, ('-data_reserva', '-id'), por_pagina=20)
+
     contexto = {
-        'page_obj': page_obj,
-        'reservas': page_obj.object_list,
+        'pagina': pagina,
+        'reservas': pagina,
         'status_choices': Reserva.Status.choices,
         'status_filtro': status_filtro,
         'usuario_filtro': usuario_filtro,
         'item_filtro': item_filtro,
-        'total_reservas': reservas.count(),
+        'total_reservas': contagem_em_cache(reservas),
     }
     return render(request, 'core/historico_reservas_completo.html', contexto)
 
+
+@login_required
+@diretoria_required
+@require_GET
+def exportar_historico_reservas(request):
+    """
+    Histórico completo em CSV, com os mesmos filtros da página, enviado aos
+    poucos enquanto as linhas são lidas do banco (ver core.exportacao).
+    """
+    _, _, _, reservas = _filtrar_historico_completo(request)
+
+    response = StreamingHttpResponse(
+        exportacao.historico_csv(reservas),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="historico_reservas_{timezone.localdate():%Y%m%d}.csv"'
+    )
+    return response
+
 @login_required
 @diretoria_required
 def estatisticas_vue(request):
@@ -653,6 +545,8 @@ def registrar_retirada_manual(request):
             reserva = form.save(commit=False)
             reserva.usuario = usuario
             reserva.status = Reserva.Status.CONFIRMADO
+            # A retirada já aconteceu no balcão: entra na ocupação (Reserva.save)
+            # sem conferir a capacidade.
             reserva.save()
             messages.success(request, f'Retirada manual registrada com sucesso para {usuario.get_full_name()}.')
             return redirect('core:registrar_retirada_manual')
@@ -672,25 +566,7 @@ def modificar_estoque(request):
     Página para DIRETORIA gerenciar estoque (itens e exemplares).
     Exibe todos os itens e permite criar novos tipos de itens.
     """
-    itens = (
-        Item.objects
-        .annotate(
-            total_exemplares=Count('exemplares'),
-            disponiveis=Count(
-                'exemplares',
-                filter=Q(exemplares__situacao=Exemplar.Situacao.DISPONIVEL)
-            ),
-            reservados=Count(
-                'exemplares',
-                filter=Q(exemplares__situacao=Exemplar.Situacao.RESERVADO)
-            ),
-            em_manutencao=Count(
-                'exemplares',
-                filter=Q(exemplares__situacao=Exemplar.Situacao.EM_MANUTENCAO)
-            ),
-        )
-        .order_by('nome')
-    )
+    itens = Item.objects.order_by('nome')
 
     if request.method == 'POST':
         form = NovoItemForm(request.POST, request.FILES)
@@ -742,3 +618,19 @@ def detalhe_item_estoque(request, item_id):
     }
     return render(request, 'core/detalhe_item_estoque.html', contexto)
 
+
+@login_required
+@diretoria_required
+def desempenho(request):
+    """
+    Últimas requisições medidas pelo InstrumentacaoMiddleware neste processo.
+    """
+    if request.method == 'POST':
+        instrumentacao.historico.limpar()
+        return redirect('core:desempenho')
+
+    return render(request, 'core/desempenho.html', {
+        'registros': instrumentacao.historico.registros(),
+        'resumo': instrumentacao.historico.por_caminho(),
+        'limite_repeticoes': settings.INSTRUMENTACAO_LIMITE_REPETICOES,
+    })
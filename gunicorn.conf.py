@@ -0,0 +1,59 @@
+"""
+Configuração do gunicorn (lida automaticamente ao rodar `gunicorn` na raiz do projeto).
+
+O app é carregado uma vez no processo mestre (preload_app) e aquecido lá
+(core.aquecimento); os workers nascem por fork já com views importadas e
+templates compilados, compartilhando essa memória em copy-on-write. Cada
+worker é reciclado depois de GUNICORN_MAX_REQUESTS requisições (com um
+desvio aleatório, para não reiniciarem todos juntos), o que limita o
+crescimento de memória; o substituto também nasce aquecido.
+
+Os workers são gthread, com GUNICORN_THREADS threads cada. No worker sync o
+timeout vale por requisição, e uma exportação longa do histórico (enviada aos
+poucos, ver core.exportacao) seria morta no meio; no gthread o timeout só
+mede se o worker continua respondendo ao mestre, e uma requisição lenta
+ocupa uma thread sem travar as outras. Com DB_POOL, DB_POOL_MAX deve ser
+pelo menos GUNICORN_THREADS.
+
+A fila de e-mails não é responsabilidade do servidor web: `manage.py
+enviar_emails` roda como um serviço à parte (ver core.emails).
+"""
+import gc
+import os
+
+
+wsgi_app = 'temnocam.wsgi:application'
+bind = f'0.0.0.0:{os.environ.get("PORT", "8000")}'
+# Exportado para o settings, que escolhe o cache a partir do número de workers.
+os.environ.setdefault('WEB_CONCURRENCY', '2')
+workers = int(os.environ['WEB_CONCURRENCY'])
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+preload_app = True
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = '-'
+
+
+def when_ready(server):
+    """
+    Roda no mestre depois do preload e antes do fork dos workers.
+    """
+    from django.db import connections
+
+    from core.aquecimento import aquecer
+
+    tempos = aquecer()
+    server.log.info('Aquecimento (ms): %s', ', '.join(f'{etapa} {ms}' for etapa, ms in tempos.items()))
+
+    # Nenhuma conexão do mestre pode ser herdada pelos workers.
+    connections.close_all()
+
+    # Objetos criados até aqui vão para uma geração permanente que o coletor
+    # não percorre: sem isso, cada coleta nos workers tocaria (e copiaria)
+    # as páginas de memória herdadas do mestre.
+    gc.collect()
+    gc.freeze()
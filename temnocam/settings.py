@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -40,6 +42,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.instrumentacao.InstrumentacaoMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,19 +71,85 @@ TEMPLATES = [
 WSGI_APPLICATION = 'temnocam.wsgi.application'
 
 
+# Conexões com o banco:
+# - DB_CONN_MAX_AGE: segundos que uma conexão é reaproveitada entre requisições
+#   do mesmo worker (0 abre e fecha uma por requisição);
+# - DB_CONN_HEALTH_CHECKS: testa a conexão reaproveitada no início de cada
+#   requisição, para não falhar numa conexão derrubada pelo servidor;
+# - DB_POOL (só Postgres, psycopg 3): pool de conexões por worker, com tamanho
+#   DB_POOL_MIN a DB_POOL_MAX e espera máxima de DB_POOL_TIMEOUT segundos por
+#   uma conexão livre. Substitui DB_CONN_MAX_AGE, que o Django exige 0 com pool.
+# `manage.py benchmark_conexoes` compara as opções.
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+DB_POOL = os.environ.get('DB_POOL', 'False') == 'True'
+
 if os.environ.get('DATABASE_URL'):
     DATABASES = {
-        'default': dj_database_url.parse(os.environ.get('DATABASE_URL'))
+        'default': dj_database_url.parse(
+            os.environ.get('DATABASE_URL'),
+            conn_max_age=0 if DB_POOL else DB_CONN_MAX_AGE,
+            conn_health_checks=DB_CONN_HEALTH_CHECKS,
+        )
     }
+    if DB_POOL:
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN', 1)),
+            'max_size': int(os.environ.get('DB_POOL_MAX', 4)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
 else:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Transações começam já com trava de escrita (BEGIN IMMEDIATE),
+            # necessário para a entrega de exemplares em core.alocacao.
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+            },
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
         }
     }
 
 
+# Cache compartilhado por sessões, usuário logado e contagens (CACHE_BACKEND):
+# - memoria: um cache por processo. Só serve com um único processo web
+#   (WEB_CONCURRENCY=1, o padrão do runserver): com mais de um, uma troca de
+#   senha ou um usuário desativado num worker continuaria valendo nos outros até
+#   a entrada expirar, então essa combinação é recusada;
+# - arquivo (padrão com mais de um processo; o gunicorn.conf.py usa 2):
+#   diretório local (CACHE_LOCATION), compartilhado pelos workers da máquina;
+# - redis: servidor Redis ou compatível (CACHE_LOCATION, ex.: redis://127.0.0.1:6379/0);
+#   precisa do pacote `redis`. É o que serve para mais de uma máquina.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memoria' if WEB_CONCURRENCY <= 1 else 'arquivo')
+if CACHE_BACKEND == 'memoria' and WEB_CONCURRENCY > 1:
+    raise ImproperlyConfigured(
+        f'CACHE_BACKEND=memoria não pode ser usado com WEB_CONCURRENCY={WEB_CONCURRENCY}: '
+        'use arquivo ou redis.'
+    )
+_CACHE_BACKENDS = {
+    'memoria': ('django.core.cache.backends.locmem.LocMemCache', 'temnocam'),
+    'arquivo': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(tempfile.gettempdir(), 'temnocam-cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/0'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION', _CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'KEY_PREFIX': 'temnocam',
+    }
+}
+if CACHE_BACKEND != 'redis':
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRADAS', 10000))}
+
+# Sessão lida do cache e gravada também no banco: sobrevive a um cache limpo ou
+# reiniciado, mas as páginas não fazem SELECT em django_session.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -114,19 +183,40 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.Usuario'
 
+# O usuário logado vem do cache em vez de um SELECT por requisição (ver core.backends).
+AUTHENTICATION_BACKENDS = ['core.backends.BackendComCache']
+USUARIO_CACHE_SEGUNDOS = int(os.environ.get('USUARIO_CACHE_SEGUNDOS', 300))
+
 LOGIN_REDIRECT_URL = '/'
 
 LOGOUT_REDIRECT_URL = '/accounts/login/'
 LOGIN_URL = '/accounts/login/'
 
-EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_HOST = "smtp.gmail.com"
-EMAIL_PORT = 587
-EMAIL_HOST_USER = "temnocam.noreply@gmail.com"
-EMAIL_HOST_PASSWORD = "wnrohpoxqalzbdcb"
-EMAIL_USE_TLS = True
-DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+# Os e-mails são enviados por `manage.py enviar_emails` (ver core.emails);
+# as variáveis de ambiente permitem apontar para um SMTP local de teste.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', "django.core.mail.backends.smtp.EmailBackend")
+EMAIL_HOST = os.environ.get('EMAIL_HOST', "smtp.gmail.com")
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', "temnocam.noreply@gmail.com")
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 30))
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', "temnocam.noreply@gmail.com")
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Horas, a partir do início do dia previsto para retirada, até a reserva
+# pendente ser cancelada por `manage.py cancelar_reservas_expiradas`.
+RESERVA_PRAZO_RETIRADA_HORAS = int(os.environ.get('RESERVA_PRAZO_RETIRADA_HORAS', 24))
+
+# Canal usado por `manage.py enviar_lembretes` (ver core.notificacoes).
+NOTIFICADOR_LEMBRETES = os.environ.get('NOTIFICADOR_LEMBRETES', 'core.notificacoes.NotificadorEmail')
+
+# Medição de SQL por requisição (ver core.instrumentacao): quantas requisições
+# ficam na tabela de /gestao/desempenho/, quantas repetições da mesma
+# consulta numa requisição geram aviso de N+1 no log e se a gestão recebe o
+# cabeçalho Server-Timing (desligado por padrão).
+INSTRUMENTACAO_HISTORICO = int(os.environ.get('INSTRUMENTACAO_HISTORICO', 200))
+INSTRUMENTACAO_LIMITE_REPETICOES = int(os.environ.get('INSTRUMENTACAO_LIMITE_REPETICOES', 10))
+INSTRUMENTACAO_SERVER_TIMING = os.environ.get('INSTRUMENTACAO_SERVER_TIMING', 'False') == 'True'